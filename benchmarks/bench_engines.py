@@ -0,0 +1,127 @@
+"""Compare the cycle time of the sync and async engines against a local fake API server.
+
+Run from the repository root (the async engine needs the "async" extra):
+
+    poetry run python -m benchmarks.bench_engines --deployments=2000 --latency=0.01
+"""
+
+import argparse
+import asyncio
+import logging
+import re
+import time
+
+import pykube
+
+from benchmarks.fake_apiserver import FakeAPIServer
+from benchmarks.fake_apiserver import Store
+from kube_downscaler import helper
+from kube_downscaler import scaler
+
+
+def get_store(deployments: int, namespaces: int) -> Store:
+    """Return a cluster where all deployments need to be scaled down."""
+    store = Store()
+    for i in range(namespaces):
+        store.add("namespaces", {"metadata": {"name": f"ns-{i}"}})
+    for i in range(deployments):
+        store.add(
+            "deployments",
+            {
+                "apiVersion": "apps/v1",
+                "kind": "Deployment",
+                "metadata": {
+                    "name": f"deploy-{i}",
+                    "namespace": f"ns-{i % namespaces}",
+                    "uid": f"uid-{i}",
+                    "creationTimestamp": "2020-01-01T00:00:00Z",
+                },
+                "spec": {"replicas": 2},
+            },
+        )
+    return store
+
+
+def get_kwargs(args) -> dict:
+    return dict(
+        namespace="",
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=frozenset([re.compile("kube-system")]),
+        exclude_deployments=frozenset(["kube-downscaler"]),
+        dry_run=False,
+        grace_period=0,
+        enable_events=args.events,
+        max_concurrent_updates=args.concurrency,
+        list_page_size=args.page_size,
+    )
+
+
+def run_sync(url: str, args) -> float:
+    config = pykube.KubeConfig.from_url(url)
+    adapter = helper.KubernetesHTTPAdapter(
+        config, pool_connections=args.concurrency, pool_maxsize=args.concurrency
+    )
+    api = pykube.HTTPClient(config, http_adapter=adapter)
+    start = time.perf_counter()
+    scaler.scale(api=api, **get_kwargs(args))
+    return time.perf_counter() - start
+
+
+def run_async(url: str, args) -> float:
+    from kube_downscaler import async_engine
+
+    async def run():
+        client = async_engine.AsyncKubeClient(
+            pykube.KubeConfig.from_url(url), args.concurrency
+        )
+        try:
+            start = time.perf_counter()
+            await async_engine.scale(client, **get_kwargs(args))
+            return time.perf_counter() - start
+        finally:
+            await client.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--deployments", type=int, default=1000)
+    parser.add_argument("--namespaces", type=int, default=50)
+    parser.add_argument(
+        "--latency", type=float, default=0.01, help="Simulated API latency in seconds"
+    )
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--page-size", type=int, default=helper.DEFAULT_PAGE_SIZE)
+    parser.add_argument("--events", action="store_true")
+    args = parser.parse_args()
+
+    # do not measure the per-resource log output
+    logging.disable(logging.WARNING)
+
+    print(
+        f"{args.deployments} deployments to scale down, {args.latency * 1000:.0f}ms API latency, "
+        f"{args.concurrency} concurrent updates"
+    )
+    print(f"{'engine':>8} {'seconds':>8} {'requests':>9} {'speedup':>8}")
+    baseline = None
+    for engine, run in (("sync", run_sync), ("async", run_async)):
+        store = get_store(args.deployments, args.namespaces)
+        with FakeAPIServer(store, args.latency) as server:
+            elapsed = run(server.url, args)
+        if baseline is None:
+            baseline = elapsed
+        requests = sum(store.requests.values())
+        print(f"{engine:>8} {elapsed:>8.2f} {requests:>9} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""Measure the throughput of the functions called per resource and loop iteration and compare it with the stored baseline.
+
+Throughput is stored relative to a fixed pure-Python calibration workload, i.e. the baseline can be compared
+across machines (roughly). Exits with status 1 if any function got slower than the baseline minus the tolerance.
+
+Run from the repository root:
+
+    poetry run python -m benchmarks.bench_hot_paths
+    poetry run python -m benchmarks.bench_hot_paths --resources=100000 --tolerance=0.1
+    poetry run python -m benchmarks.bench_hot_paths --update-baseline
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import timeit
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Tuple
+
+from pykube import Deployment
+
+from benchmarks.load_test import get_deployment
+from kube_downscaler import helper
+from kube_downscaler import scaler
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "bench_hot_paths.json")
+
+CALIBRATION_OPERATIONS = 100000
+# calibration runs before and after every repetition
+CALIBRATION_SAMPLES = 3
+
+# a change is a regression if the relative throughput drops by more than this
+DEFAULT_TOLERANCE = 0.2
+
+NOW = datetime.datetime(2020, 10, 5, 8, 0, tzinfo=datetime.timezone.utc)
+
+DEFAULT_UPTIME = "Mon-Fri 07:30-20:30 Europe/Berlin"
+
+# the formats of creation timestamps and of the exclude-until annotation seen in clusters
+TIMESTAMPS = [
+    "2020-01-01T00:00:00Z",
+    "2020-09-30T23:59:59Z",
+    "2020-12-24",
+    "2020-12-24T18:00",
+    "2020-12-24 18:00",
+]
+
+
+class Benchmark(NamedTuple):
+    # called before every repetition (not measured), returns the measured function
+    setup: Callable[[List[Deployment]], Callable[[], None]]
+    # calls per resource
+    calls: int = 1
+
+
+class FakeResponse:
+    def __init__(self, data: str):
+        self.data = data
+
+    def json(self) -> dict:
+        return json.loads(self.data)
+
+
+class FakeAPI:
+
+    """Accept every PATCH without network, the response is the patch itself."""
+
+    def patch(self, **kwargs) -> FakeResponse:
+        return FakeResponse(kwargs["data"])
+
+    def raise_for_status(self, response: FakeResponse):
+        pass
+
+
+def json_copy(obj: dict) -> dict:
+    return json.loads(json.dumps(obj))
+
+
+def get_resources(count: int, seed: int = 0) -> List[Deployment]:
+    rng = random.Random(seed)
+    api = FakeAPI()
+    resources = []
+    for i in range(count):
+        obj = get_deployment(f"deploy-{i}", f"ns-{i % 1000}", rng)
+        obj["metadata"]["creationTimestamp"] = TIMESTAMPS[i % 2]
+        if i % 20 == 0:
+            obj["metadata"]["annotations"][
+                scaler.EXCLUDE_UNTIL_ANNOTATION
+            ] = TIMESTAMPS[i % len(TIMESTAMPS)]
+        resources.append(Deployment(api, obj))
+    return resources
+
+
+def setup_matches_time_spec(resources):
+    # a different time per resource, i.e. the memoized results are not reused and every call is evaluated
+    specs = [
+        (
+            NOW + datetime.timedelta(seconds=i),
+            resource.annotations.get(scaler.UPTIME_ANNOTATION, DEFAULT_UPTIME),
+            resource.annotations.get(scaler.DOWNTIME_ANNOTATION, "never"),
+        )
+        for i, resource in enumerate(resources)
+        if "Mon-Fri 9-5" not in resource.annotations.values()
+    ]
+    helper.matches_time_spec.cache_clear()
+
+    def run():
+        for now, uptime, downtime in specs:
+            helper.matches_time_spec(now, uptime)
+            helper.matches_time_spec(now, downtime)
+
+    return run
+
+
+def setup_parse_time(resources):
+    timestamps = [TIMESTAMPS[i % len(TIMESTAMPS)] for i in range(len(resources))]
+
+    def run():
+        for timestamp in timestamps:
+            scaler.parse_time(timestamp)
+
+    return run
+
+
+def setup_ignore_resource(resources):
+    def run():
+        for resource in resources:
+            scaler.ignore_resource(resource, NOW)
+
+    return run
+
+
+def setup_within_grace_period(resources):
+    def run():
+        for resource in resources:
+            scaler.within_grace_period(resource, 900, NOW)
+
+    return run
+
+
+def setup_get_annotation_value_as_int(resources):
+    def run():
+        for resource in resources:
+            scaler.get_annotation_value_as_int(
+                resource, scaler.DOWNTIME_REPLICAS_ANNOTATION
+            )
+            scaler.get_annotation_value_as_int(
+                resource, scaler.ORIGINAL_REPLICAS_ANNOTATION
+            )
+
+    return run
+
+
+def setup_autoscale_resource(resources):
+    # autoscale_resource changes the resources, start every repetition with the same state
+    copies = [
+        Deployment(resource.api, json_copy(resource.obj)) for resource in resources
+    ]
+    helper.matches_time_spec.cache_clear()
+
+    def run():
+        # same as autoscale_resources: every distinct schedule is evaluated once
+        schedule_groups = scaler.ScheduleGroups(NOW)
+        for resource in copies:
+            scaler.autoscale_resource(
+                resource,
+                upscale_period="never",
+                downscale_period="never",
+                default_uptime=DEFAULT_UPTIME,
+                default_downtime="never",
+                forced_uptime=False,
+                dry_run=False,
+                now=NOW,
+                schedule_groups=schedule_groups,
+            )
+
+    return run
+
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    "matches_time_spec": Benchmark(setup_matches_time_spec, 2),
+    "parse_time": Benchmark(setup_parse_time),
+    "ignore_resource": Benchmark(setup_ignore_resource),
+    "within_grace_period": Benchmark(setup_within_grace_period),
+    "get_annotation_value_as_int": Benchmark(setup_get_annotation_value_as_int, 2),
+    "autoscale_resource": Benchmark(setup_autoscale_resource),
+}
+
+
+def calibrate():
+    """Run a fixed workload (dict, string and int operations like the hot paths), returns the seconds."""
+    data = {}
+    for i in range(CALIBRATION_OPERATIONS):
+        key = f"downscaler/{i % 100}"
+        data[key] = int(str(i)) + len(key.lower())
+
+
+def measure(
+    benchmark: Benchmark, resources: List[Deployment], repeat: int
+) -> Tuple[float, float]:
+    """Return the calls per second (best of the repetitions) and the median throughput relative to the calibration.
+
+    CPU time is measured instead of wall time, i.e. time while other processes run is not counted.
+    Every repetition is calibrated right before and after (median of CALIBRATION_SAMPLES each),
+    i.e. under the same conditions (CPU frequency, load).
+    """
+    timer = timeit.Timer(calibrate, timer=time.process_time)
+    timings = []
+    ratios = []
+    for _ in range(repeat):
+        run = benchmark.setup(resources)
+        before = timer.repeat(CALIBRATION_SAMPLES, number=1)
+        seconds = timeit.Timer(run, timer=time.process_time).timeit(number=1)
+        after = timer.repeat(CALIBRATION_SAMPLES, number=1)
+        calibration = CALIBRATION_OPERATIONS / statistics.median(before + after)
+        timings.append(seconds)
+        ratios.append(len(resources) * benchmark.calls / seconds / calibration)
+    return len(resources) * benchmark.calls / min(timings), statistics.median(ratios)
+
+
+def load_baseline(path: str) -> dict:
+    try:
+        with open(path) as fd:
+            return json.load(fd)
+    except FileNotFoundError:
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resources", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed relative throughput drop before failing",
+    )
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store the results as new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "benchmarks", nargs="*", help=f"Only run these ({', '.join(BENCHMARKS)})"
+    )
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    # do not measure the per-resource log output (including the errors for invalid annotations)
+    logging.disable(logging.ERROR)
+
+    names = args.benchmarks or list(BENCHMARKS)
+    resources = get_resources(args.resources)
+    data = load_baseline(args.baseline)
+    baseline = data.get("benchmarks", {})
+
+    print(f"{args.resources} resources, best of {args.repeat}")
+    if baseline and data.get("resources") != args.resources:
+        print(f"Note: the baseline was measured with {data['resources']} resources")
+    print(
+        f"{'benchmark':>28} {'calls/s':>12} {'relative':>9} {'baseline':>9} {'change':>8}"
+    )
+    results = {}
+    regressions = []
+    for name in names:
+        calls_per_second, relative = measure(BENCHMARKS[name], resources, args.repeat)
+        results[name] = {
+            "calls_per_second": round(calls_per_second),
+            "relative": round(relative, 6),
+        }
+        line = f"{name:>28} {calls_per_second:>12,.0f} {relative:>9.4f}"
+        if name in baseline:
+            change = relative / baseline[name]["relative"] - 1
+            line += f" {baseline[name]['relative']:>9.4f} {change:>+7.0%}"
+            if change < -args.tolerance:
+                regressions.append(name)
+                line += " REGRESSION"
+        print(line)
+
+    if args.update_baseline:
+        data["python"] = platform.python_version()
+        data["resources"] = args.resources
+        data.setdefault("benchmarks", {}).update(results)
+        with open(args.baseline, "w") as fd:
+            json.dump(data, fd, indent=2, sort_keys=True)
+            fd.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    elif regressions:
+        print(
+            f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Compare the compiled and memoized matches_time_spec against the previous (parse on every call) implementation.
+
+Run from the repository root:
+
+    poetry run python -m benchmarks.bench_time_spec
+"""
+
+import argparse
+import datetime
+import re
+import timeit
+from typing import Match
+
+import pytz
+
+from kube_downscaler import helper
+
+SPECS = [
+    "always",
+    "never",
+    "Mon-Fri 07:30-20:30 Europe/Berlin",
+    "Sat-Sun 00:00-24:00 Europe/Berlin",
+    "Mon-Fri 08:00-18:00 America/New_York, Sat-Sat 10:00-14:00 America/New_York",
+    "2020-12-24T00:00:00+00:00-2021-01-01T23:59:59+00:00",
+]
+
+WEEKDAYS = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
+
+TIME_SPEC_PATTERN = re.compile(
+    r"^([a-zA-Z]{3})-([a-zA-Z]{3}) (\d\d):(\d\d)-(\d\d):(\d\d) (?P<tz>[a-zA-Z/_]+)$"
+)
+_ISO_8601_TIME_SPEC_PATTERN = r"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}[-+]\d{2}:\d{2})"
+ABSOLUTE_TIME_SPEC_PATTERN = re.compile(
+    r"^{0}-{0}$".format(_ISO_8601_TIME_SPEC_PATTERN)
+)
+
+
+def legacy_matches_time_spec(time: datetime.datetime, spec: str):
+    """Implementation before specs were compiled (reference for this benchmark)."""
+    if spec.lower() == "always":
+        return True
+    elif spec.lower() == "never":
+        return False
+    for spec_ in spec.split(","):
+        spec_ = spec_.strip()
+        recurring_match = TIME_SPEC_PATTERN.match(spec_)
+        if recurring_match is not None and _legacy_matches_recurring_time_spec(
+            time, recurring_match
+        ):
+            return True
+        absolute_match = ABSOLUTE_TIME_SPEC_PATTERN.match(spec_)
+        if absolute_match and _legacy_matches_absolute_time_spec(time, absolute_match):
+            return True
+        if not recurring_match and not absolute_match:
+            raise ValueError(f'Time spec value "{spec_}" does not match format')
+    return False
+
+
+def _legacy_matches_recurring_time_spec(time: datetime.datetime, match: Match):
+    tz = pytz.timezone(match.group("tz"))
+    local_time = tz.fromutc(time.replace(tzinfo=tz))
+    day_from = WEEKDAYS.index(match.group(1).upper())
+    day_to = WEEKDAYS.index(match.group(2).upper())
+    if day_from > day_to:
+        day_matches = local_time.weekday() >= day_from or local_time.weekday() <= day_to
+    else:
+        day_matches = day_from <= local_time.weekday() <= day_to
+    local_time_minutes = local_time.hour * 60 + local_time.minute
+    minute_from = int(match.group(3)) * 60 + int(match.group(4))
+    minute_to = int(match.group(5)) * 60 + int(match.group(6))
+    time_matches = minute_from <= local_time_minutes < minute_to
+    return day_matches and time_matches
+
+
+def _legacy_matches_absolute_time_spec(time: datetime.datetime, match: Match):
+    time_from = datetime.datetime.fromisoformat(match.group(1))
+    time_to = datetime.datetime.fromisoformat(match.group(2))
+    return time_from <= time <= time_to
+
+
+def run_cycle(func, now: datetime.datetime, resources: int):
+    # every resource evaluates up to 4 specs per loop iteration
+    for i in range(resources):
+        for j in range(4):
+            func(now, SPECS[(i + j) % len(SPECS)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resources", type=int, default=10000)
+    parser.add_argument("--cycles", type=int, default=3)
+    args = parser.parse_args()
+
+    now = datetime.datetime(2020, 10, 5, 8, 0, tzinfo=datetime.timezone.utc)
+    for spec in SPECS:
+        assert legacy_matches_time_spec(now, spec) == helper.matches_time_spec(
+            now, spec
+        ), spec
+
+    print(
+        f"{args.resources} resources x 4 specs, {args.cycles} loop iterations (new 'now' per iteration)"
+    )
+    results = {}
+    for name, func in [
+        ("legacy", legacy_matches_time_spec),
+        # compiled spec, but without memoizing the result per (time, spec)
+        ("compiled", helper.matches_time_spec.__wrapped__),
+        ("memoized", helper.matches_time_spec),
+    ]:
+
+        def cycles():
+            for cycle in range(args.cycles):
+                run_cycle(func, now + datetime.timedelta(seconds=cycle), args.resources)
+
+        results[name] = min(
+            timeit.repeat(
+                cycles, setup=helper.matches_time_spec.cache_clear, number=1, repeat=3,
+            )
+        )
+        calls = args.resources * 4 * args.cycles
+        print(
+            f"{name:>10}: {results[name]:.3f}s ({results[name] / calls * 1e6:.2f}µs per call)"
+        )
+    for name in ("compiled", "memoized"):
+        print(f"speedup ({name}): {results['legacy'] / results[name]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
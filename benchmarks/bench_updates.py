@@ -0,0 +1,101 @@
+"""Measure the wall-clock time to send N pending scaling updates with a given number of workers.
+
+Run from the repository root:
+
+    poetry run python -m benchmarks.bench_updates --updates=500 --latency=0.02
+"""
+
+import argparse
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from pykube import Deployment
+
+from kube_downscaler.scaler import autoscale_resource
+from kube_downscaler.scaler import wait_for_updates
+
+NOW = datetime.datetime(2020, 10, 5, 8, 0, tzinfo=datetime.timezone.utc)
+
+
+def get_fake_api(latency: float):
+    """Return a fake API client where every PATCH takes the given latency (in seconds)."""
+    api = MagicMock()
+
+    def patch(**kwargs):
+        time.sleep(latency)
+        response = MagicMock()
+        response.json.return_value = {"metadata": {}, "spec": {}}
+        return response
+
+    api.patch = patch
+    return api
+
+
+def get_deployments(api, count: int):
+    return [
+        Deployment(
+            api,
+            {
+                "metadata": {
+                    "name": f"deploy-{i}",
+                    "namespace": f"ns-{i % 50}",
+                    "creationTimestamp": "2020-01-01T00:00:00Z",
+                    "annotations": {"downscaler/original-replicas": "2"},
+                },
+                "spec": {"replicas": 0},
+            },
+        )
+        for i in range(count)
+    ]
+
+
+def run(updates: int, workers: int, latency: float) -> float:
+    api = get_fake_api(latency)
+    deployments = get_deployments(api, updates)
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    start = time.perf_counter()
+    pending_updates = []
+    for deployment in deployments:
+        future = autoscale_resource(
+            deployment,
+            "never",
+            "never",
+            "always",
+            "never",
+            forced_uptime=False,
+            dry_run=False,
+            now=NOW,
+            executor=executor,
+        )
+        if future:
+            pending_updates.append((deployment, future))
+    wait_for_updates(pending_updates)
+    elapsed = time.perf_counter() - start
+    if executor:
+        executor.shutdown()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="Simulated API latency in seconds"
+    )
+    parser.add_argument("--workers", default="1,4,16,32")
+    args = parser.parse_args()
+
+    print(f"{args.updates} pending updates, {args.latency * 1000:.0f}ms API latency")
+    print(f"{'workers':>8} {'seconds':>8} {'speedup':>8}")
+    baseline = None
+    for workers in map(int, args.workers.split(",")):
+        elapsed = run(args.updates, workers, args.latency)
+        if baseline is None:
+            baseline = elapsed
+        print(f"{workers:>8} {elapsed:>8.2f} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
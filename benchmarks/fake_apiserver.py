@@ -0,0 +1,601 @@
+"""Minimal in-memory stand-in for the Kubernetes API server, only serving the endpoints used by kube-downscaler.
+
+Every request sleeps for the configured latency (in a separate thread), so concurrent clients can overlap requests
+like against a real API server. Faults can be injected: a fraction of all requests is throttled with
+"429 Too Many Requests" and a fraction of all writes fails with "409 Conflict".
+
+Supported: LIST (with pagination and field/label selectors), WATCH, GET, POST, PUT and PATCH (JSON merge patch),
+including resourceVersion preconditions. Request counters and transferred bytes are served on /fake/stats.
+"""
+
+import bisect
+import collections
+import copy
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Deque
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+PATH_PATTERN = re.compile(
+    r"^/apis?(?:/(?P<group>[^/]+))?/(?P<version>v[^/]+)"
+    r"(?:/namespaces/(?P<namespace>[^/]+))?/(?P<endpoint>[^/]+)(?:/(?P<name>[^/]+))?$"
+)
+STATS_PATH = "/fake/stats"
+
+# changes kept for WATCH requests, older resource versions get "410 Gone" like after etcd compaction
+WATCH_LOG_SIZE = 100000
+MAX_WATCH_TIMEOUT_SECONDS = 60
+
+PARTIAL_OBJECT_METADATA = "PartialObjectMetadata"
+
+# commas separate requirements, except within set-based values like "env in (dev,test)"
+LABEL_REQUIREMENT_SEPARATOR = re.compile(r",(?![^(]*\))")
+SET_BASED_REQUIREMENT = re.compile(
+    r"^(?P<key>\S+)\s+(?P<op>in|notin)\s+\((?P<values>[^)]*)\)$"
+)
+
+
+class APIError(Exception):
+    def __init__(self, code: int, reason: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.reason = reason
+
+    def status(self) -> dict:
+        return {
+            "kind": "Status",
+            "apiVersion": "v1",
+            "status": "Failure",
+            "message": str(self),
+            "reason": self.reason,
+            "code": self.code,
+        }
+
+
+def merge_patch(target: dict, patch: dict) -> dict:
+    """Apply a JSON merge patch (RFC 7386) in place."""
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_patch(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+
+def get_field(obj: dict, path: str) -> str:
+    """Return the value of a dotted field path (e.g. "involvedObject.uid") as string, empty if missing."""
+    value = obj
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return ""
+        value = value.get(key)
+    return "" if value is None else str(value)
+
+
+def matches_field_selector(obj: dict, selector: str) -> bool:
+    """Evaluate "field=value" and "field!=value" requirements (the API server supports only a few fields per kind)."""
+    for requirement in filter(None, selector.split(",")):
+        if "!=" in requirement:
+            field, value = requirement.split("!=", 1)
+            if get_field(obj, field) == value:
+                return False
+        else:
+            field, value = requirement.replace("==", "=").split("=", 1)
+            if get_field(obj, field) != value:
+                return False
+    return True
+
+
+def matches_label_selector(labels: dict, selector: str) -> bool:
+    """Evaluate equality-based and set-based label requirements."""
+    for requirement in LABEL_REQUIREMENT_SEPARATOR.split(selector):
+        requirement = requirement.strip()
+        if not requirement:
+            continue
+        match = SET_BASED_REQUIREMENT.match(requirement)
+        if match:
+            values = {value.strip() for value in match.group("values").split(",")}
+            found = (
+                match.group("key") in labels and labels[match.group("key")] in values
+            )
+            if found != (match.group("op") == "in"):
+                return False
+        elif "!=" in requirement:
+            key, value = requirement.split("!=", 1)
+            if labels.get(key.strip()) == value.strip():
+                return False
+        elif "=" in requirement:
+            key, value = requirement.replace("==", "=").split("=", 1)
+            if labels.get(key.strip()) != value.strip():
+                return False
+        elif requirement.startswith("!"):
+            if requirement[1:] in labels:
+                return False
+        elif requirement not in labels:
+            return False
+    return True
+
+
+def get_partial_object_metadata(obj: dict) -> dict:
+    return {
+        "apiVersion": "meta.k8s.io/v1",
+        "kind": PARTIAL_OBJECT_METADATA,
+        "metadata": obj["metadata"],
+    }
+
+
+class Store:
+
+    """Objects by endpoint (e.g. "deployments"), each ordered by namespace and name like etcd does."""
+
+    def __init__(self, watch_log_size: int = WATCH_LOG_SIZE):
+        self.lock = threading.Lock()
+        # notified on every change and when the store is closed
+        self.changed = threading.Condition(self.lock)
+        self.closed = False
+        self.objects: Dict[str, Dict[Tuple[str, str], dict]] = {}
+        # sorted keys by endpoint, rebuilt on the next LIST after objects were created
+        self.keys: Dict[str, List[Tuple[str, str]]] = {}
+        self.resource_version = 0
+        # (resource version, endpoint, event type, object)
+        self.log: Deque[Tuple[int, str, str, dict]] = collections.deque(
+            maxlen=watch_log_size
+        )
+        self.requests: Dict[str, int] = {}
+        self.throttled = 0
+        self.conflicts = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def _record(self, endpoint: str, event_type: str, obj: dict):
+        """Bump the resource version of the (stored) object and notify all watchers, the lock must be held."""
+        self.resource_version += 1
+        obj["metadata"]["resourceVersion"] = str(self.resource_version)
+        self.log.append(
+            (self.resource_version, endpoint, event_type, copy.deepcopy(obj))
+        )
+        self.changed.notify_all()
+
+    def add(self, endpoint: str, obj: dict):
+        """Store the object (replacing an existing one), e.g. to set up the cluster."""
+        metadata = obj["metadata"]
+        metadata.setdefault("uid", str(uuid.uuid4()))
+        key = (metadata.get("namespace", ""), metadata["name"])
+        with self.lock:
+            objects = self.objects.setdefault(endpoint, {})
+            event_type = "MODIFIED" if key in objects else "ADDED"
+            objects[key] = obj
+            self.keys.pop(endpoint, None)
+            self._record(endpoint, event_type, obj)
+
+    def list(
+        self,
+        endpoint: str,
+        namespace: str,
+        field_selector: str = "",
+        label_selector: str = "",
+        limit: int = 0,
+        start_after: Optional[Tuple[str, str]] = None,
+    ) -> Tuple[List[dict], str, Optional[Tuple[str, str]]]:
+        """Return copies of the matching objects, the resource version and the key to continue after (if limited).
+
+        Like the API server, every page only scans the objects after the previous page.
+        """
+        items = []
+        last_key = None
+        with self.lock:
+            objects = self.objects.get(endpoint, {})
+            keys = self.keys.get(endpoint)
+            if keys is None:
+                keys = self.keys[endpoint] = sorted(objects)
+            if namespace:
+                # all keys of the namespace are sorted before the next possible namespace
+                start = bisect.bisect_left(keys, (namespace,))
+                end = bisect.bisect_left(keys, (namespace + "\0",))
+            else:
+                start, end = 0, len(keys)
+            if start_after:
+                start = max(start, bisect.bisect_right(keys, start_after))
+            for key in keys[start:end]:
+                obj = objects[key]
+                if field_selector and not matches_field_selector(obj, field_selector):
+                    continue
+                if label_selector and not matches_label_selector(
+                    obj["metadata"].get("labels") or {}, label_selector
+                ):
+                    continue
+                if limit and len(items) == limit:
+                    return items, str(self.resource_version), last_key
+                items.append(copy.deepcopy(obj))
+                last_key = key
+            return items, str(self.resource_version), None
+
+    def get(self, endpoint: str, namespace: str, name: str):
+        with self.lock:
+            return self.objects.get(endpoint, {}).get((namespace, name))
+
+    def _get_existing(self, endpoint: str, namespace: str, name: str) -> dict:
+        obj = self.objects.get(endpoint, {}).get((namespace, name))
+        if obj is None:
+            raise APIError(404, "NotFound", f'{endpoint} "{name}" not found')
+        return obj
+
+    def _check_resource_version(self, obj: dict, resource_version: Optional[str]):
+        if resource_version and resource_version != obj["metadata"]["resourceVersion"]:
+            raise APIError(
+                409,
+                "Conflict",
+                f'Operation cannot be fulfilled on "{obj["metadata"]["name"]}": the object has been modified',
+            )
+
+    def create(self, endpoint: str, namespace: str, obj: dict) -> dict:
+        metadata = obj.setdefault("metadata", {})
+        if namespace:
+            metadata["namespace"] = namespace
+        if not metadata.get("name"):
+            if not metadata.get("generateName"):
+                raise APIError(422, "Invalid", "name or generateName is required")
+            metadata["name"] = metadata["generateName"] + uuid.uuid4().hex[:5]
+        metadata["uid"] = str(uuid.uuid4())
+        metadata.setdefault(
+            "creationTimestamp", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        )
+        key = (metadata.get("namespace", ""), metadata["name"])
+        with self.lock:
+            objects = self.objects.setdefault(endpoint, {})
+            if key in objects:
+                raise APIError(
+                    409, "AlreadyExists", f'{endpoint} "{key[1]}" already exists'
+                )
+            objects[key] = obj
+            self.keys.pop(endpoint, None)
+            self._record(endpoint, "ADDED", obj)
+        return obj
+
+    def replace(self, endpoint: str, namespace: str, name: str, obj: dict) -> dict:
+        """Replace the object (PUT), failing if the given resource version is outdated."""
+        with self.lock:
+            existing = self._get_existing(endpoint, namespace, name)
+            self._check_resource_version(
+                existing, obj.get("metadata", {}).get("resourceVersion")
+            )
+            metadata = obj.setdefault("metadata", {})
+            for key in ("name", "namespace", "uid", "creationTimestamp"):
+                if key in existing["metadata"]:
+                    metadata[key] = existing["metadata"][key]
+            self.objects[endpoint][(namespace, name)] = obj
+            self._record(endpoint, "MODIFIED", obj)
+        return obj
+
+    def patch(self, endpoint: str, namespace: str, name: str, patch: dict) -> dict:
+        """Apply a merge patch, a resource version in the patch is a precondition (optimistic locking)."""
+        with self.lock:
+            obj = self._get_existing(endpoint, namespace, name)
+            self._check_resource_version(
+                obj, (patch.get("metadata") or {}).get("resourceVersion")
+            )
+            merge_patch(obj, patch)
+            self._record(endpoint, "MODIFIED", obj)
+        return obj
+
+    def watch(
+        self, endpoint: str, namespace: str, resource_version: str, timeout: float
+    ) -> Iterator[Tuple[str, dict]]:
+        """Return all changes after the given resource version until the timeout expires."""
+        with self.lock:
+            position = int(resource_version or self.resource_version)
+            if self.log and position < self.log[0][0] - 1:
+                raise APIError(410, "Expired", f"too old resource version: {position}")
+        return self._watch(endpoint, namespace, position, time.monotonic() + timeout)
+
+    def _watch(
+        self, endpoint: str, namespace: str, position: int, deadline: float
+    ) -> Iterator[Tuple[str, dict]]:
+        while True:
+            with self.lock:
+                while not self.closed and (not self.log or self.log[-1][0] <= position):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    self.changed.wait(remaining)
+                if self.closed:
+                    return
+                changes = [entry for entry in self.log if entry[0] > position]
+            for changed_version, changed_endpoint, event_type, obj in changes:
+                position = changed_version
+                if changed_endpoint == endpoint and (
+                    not namespace or obj["metadata"].get("namespace") == namespace
+                ):
+                    yield event_type, obj
+
+    def close(self):
+        """Stop all WATCH streams."""
+        with self.lock:
+            self.closed = True
+            self.changed.notify_all()
+
+    def count(self, verb: str):
+        with self.lock:
+            self.requests[verb] = self.requests.get(verb, 0) + 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "throttled": self.throttled,
+                "conflicts": self.conflicts,
+                "bytesReceived": self.bytes_received,
+                "bytesSent": self.bytes_sent,
+            }
+
+
+def get_handler(
+    store: Store,
+    latency: float,
+    throttle_rate: float = 0,
+    conflict_rate: float = 0,
+    retry_after: float = 1,
+    seed: Optional[int] = None,
+):
+    faults = random.Random(seed)
+    faults_lock = threading.Lock()
+
+    def inject(rate: float) -> bool:
+        if not rate:
+            return False
+        with faults_lock:
+            return faults.random() < rate
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body are written separately, avoid waiting for delayed ACKs
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def write(self, data: bytes):
+            self.wfile.write(data)
+            with store.lock:
+                store.bytes_sent += len(data)
+
+        def send_json(self, code: int, data: dict, headers: Optional[dict] = None):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.write(body)
+
+        def send_error_status(self, error: APIError, headers: Optional[dict] = None):
+            self.send_json(error.code, error.status(), headers)
+
+        def read_json(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            data = self.rfile.read(length)
+            with store.lock:
+                store.bytes_received += len(data)
+            return json.loads(data or b"{}")
+
+        def metadata_only(self) -> bool:
+            return f"as={PARTIAL_OBJECT_METADATA}" in (self.headers.get("Accept") or "")
+
+        def route(self):
+            url = urlparse(self.path)
+            if url.path == STATS_PATH:
+                # not counted as a request
+                self.send_json(200, store.stats())
+                return None, None
+            store.count(self.command)
+            time.sleep(latency)
+            if inject(throttle_rate):
+                with store.lock:
+                    store.throttled += 1
+                # drain the request body to keep the connection usable
+                self.read_json()
+                self.send_error_status(
+                    APIError(429, "TooManyRequests", "the server is throttling"),
+                    {"Retry-After": f"{retry_after:g}"},
+                )
+                return None, None
+            if self.command != "GET" and inject(conflict_rate):
+                with store.lock:
+                    store.conflicts += 1
+                self.read_json()
+                self.send_error_status(
+                    APIError(409, "Conflict", "the object has been modified (injected)")
+                )
+                return None, None
+            match = PATH_PATTERN.match(url.path)
+            if not match:
+                self.read_json()
+                self.send_error_status(APIError(404, "NotFound", "not found"))
+                return None, None
+            endpoint, namespace, name = match.group("endpoint", "namespace", "name")
+            if endpoint == "namespaces" and name:
+                # e.g. /api/v1/namespaces/default
+                namespace = ""
+            return (endpoint, namespace or "", name), parse_qs(url.query)
+
+        def handle_request(self, method):
+            target, query = self.route()
+            if not target:
+                return
+            try:
+                method(*target, {key: values[0] for key, values in query.items()})
+            except APIError as e:
+                self.send_error_status(e)
+
+        def do_GET(self):
+            self.handle_request(self.get)
+
+        def do_POST(self):
+            self.handle_request(self.post)
+
+        def do_PUT(self):
+            self.handle_request(self.put)
+
+        def do_PATCH(self):
+            self.handle_request(self.patch)
+
+        def get(self, endpoint: str, namespace: str, name: str, query: dict):
+            if name:
+                obj = store.get(endpoint, namespace, name)
+                if obj is None:
+                    raise APIError(404, "NotFound", f'{endpoint} "{name}" not found')
+                self.send_json(200, obj)
+            elif query.get("watch") in ("true", "1"):
+                self.watch(endpoint, namespace, query)
+            else:
+                self.list(endpoint, namespace, query)
+
+        def list(self, endpoint: str, namespace: str, query: dict):
+            start_after = None
+            if query.get("continue"):
+                # the continue token is the key of the last object sent
+                last_namespace, _, last_name = query["continue"].partition("/")
+                start_after = (last_namespace, last_name)
+            page, resource_version, last_key = store.list(
+                endpoint,
+                namespace,
+                query.get("fieldSelector", ""),
+                query.get("labelSelector", ""),
+                int(query.get("limit") or 0),
+                start_after,
+            )
+            metadata = {"resourceVersion": resource_version}
+            if last_key:
+                metadata["continue"] = "/".join(last_key)
+            kind = "List"
+            if self.metadata_only():
+                page = [get_partial_object_metadata(obj) for obj in page]
+                kind = f"{PARTIAL_OBJECT_METADATA}List"
+            self.send_json(200, {"kind": kind, "metadata": metadata, "items": page})
+
+        def watch(self, endpoint: str, namespace: str, query: dict):
+            timeout = min(
+                float(query.get("timeoutSeconds") or MAX_WATCH_TIMEOUT_SECONDS),
+                MAX_WATCH_TIMEOUT_SECONDS,
+            )
+            try:
+                changes = store.watch(
+                    endpoint, namespace, query.get("resourceVersion", ""), timeout
+                )
+            except APIError as e:
+                # like the API server, "410 Gone" is sent as WATCH event
+                self.send_json(200, {"type": "ERROR", "object": e.status()})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            field_selector = query.get("fieldSelector", "")
+            label_selector = query.get("labelSelector", "")
+            metadata_only = self.metadata_only()
+            resource_version = query.get("resourceVersion", "")
+            try:
+                for event_type, obj in changes:
+                    resource_version = obj["metadata"]["resourceVersion"]
+                    if field_selector and not matches_field_selector(
+                        obj, field_selector
+                    ):
+                        continue
+                    if label_selector and not matches_label_selector(
+                        obj["metadata"].get("labels") or {}, label_selector
+                    ):
+                        continue
+                    if metadata_only:
+                        obj = get_partial_object_metadata(obj)
+                    self.write_chunk({"type": event_type, "object": obj})
+                if query.get("allowWatchBookmarks") == "true" and resource_version:
+                    self.write_chunk(
+                        {
+                            "type": "BOOKMARK",
+                            "object": {
+                                "metadata": {"resourceVersion": resource_version}
+                            },
+                        }
+                    )
+                self.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # the client closed the stream
+                self.close_connection = True
+
+        def write_chunk(self, event: dict):
+            data = json.dumps(event).encode("utf-8") + b"\n"
+            self.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def post(self, endpoint: str, namespace: str, name: str, query: dict):
+            obj = store.create(endpoint, namespace, self.read_json())
+            self.send_json(201, obj)
+
+        def put(self, endpoint: str, namespace: str, name: str, query: dict):
+            obj = store.replace(endpoint, namespace, name, self.read_json())
+            self.send_json(200, obj)
+
+        def patch(self, endpoint: str, namespace: str, name: str, query: dict):
+            obj = store.patch(endpoint, namespace, name, self.read_json())
+            self.send_json(200, obj)
+
+    return Handler
+
+
+class HTTPServer(ThreadingHTTPServer):
+    # the default listen backlog (5) resets connections opened by many concurrent clients
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class FakeAPIServer:
+
+    """Serve the store on a local port (random by default) in a background thread."""
+
+    def __init__(
+        self,
+        store: Store,
+        latency: float = 0,
+        throttle_rate: float = 0,
+        conflict_rate: float = 0,
+        retry_after: float = 1,
+        seed: Optional[int] = None,
+        port: int = 0,
+    ):
+        self.store = store
+        self.server = HTTPServer(
+            ("127.0.0.1", port),
+            get_handler(
+                store, latency, throttle_rate, conflict_rate, retry_after, seed
+            ),
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.store.close()
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,389 @@
+"""Run kube-downscaler cycles against a synthetic cluster served by the local fake API server.
+
+The fake API server runs in a separate process, i.e. the peak RSS only includes the downscaler.
+Every cycle reports its wall-clock time, the requests by verb and the transferred (body) bytes.
+The decisions depend on the current time (the default uptime is a typical office hours spec).
+
+Run from the repository root (the async engine needs the "async" extra):
+
+    poetry run python -m benchmarks.load_test --namespaces=1000 --deployments=50000 --cycles=3
+    poetry run python -m benchmarks.load_test --latency=0.005 --throttle-rate=0.01 --conflict-rate=0.01 --retry-after=0.1
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import re
+import resource
+import time
+
+import pykube
+import requests
+
+from benchmarks.fake_apiserver import FakeAPIServer
+from benchmarks.fake_apiserver import STATS_PATH
+from benchmarks.fake_apiserver import Store
+from kube_downscaler import helper
+from kube_downscaler import main as downscaler_main
+from kube_downscaler import scaler
+from kube_downscaler.events import EventEmitter
+from kube_downscaler.ratelimit import DEFAULT_BURST
+from kube_downscaler.ratelimit import RateLimiter
+
+DEFAULT_UPTIME = "Mon-Fri 07:30-20:30 Europe/Berlin"
+
+# (weight, annotations, replicas) of the deployments, most of them only use the defaults
+DEPLOYMENT_ANNOTATION_MIX = [
+    (55, {}, 2),
+    (12, {scaler.UPTIME_ANNOTATION: "Mon-Fri 08:00-18:00 America/New_York"}, 2),
+    (5, {scaler.DOWNTIME_ANNOTATION: "Sat-Sun 00:00-24:00 Europe/Berlin"}, 3),
+    (8, {scaler.EXCLUDE_ANNOTATION: "true"}, 1),
+    (3, {scaler.EXCLUDE_UNTIL_ANNOTATION: "2099-12-31"}, 1),
+    (5, {scaler.DOWNTIME_REPLICAS_ANNOTATION: "1"}, 4),
+    # already scaled down in a previous cycle
+    (10, {scaler.ORIGINAL_REPLICAS_ANNOTATION: "3"}, 0),
+    # invalid time spec, logged as error
+    (2, {scaler.UPTIME_ANNOTATION: "Mon-Fri 9-5"}, 1),
+]
+
+# (weight, annotations) of the namespaces
+NAMESPACE_ANNOTATION_MIX = [
+    (85, {}),
+    (10, {scaler.UPTIME_ANNOTATION: "Mon-Fri 09:00-17:00 Europe/London"}),
+    (3, {scaler.EXCLUDE_ANNOTATION: "true"}),
+    (2, {scaler.DOWNTIME_REPLICAS_ANNOTATION: "1"}),
+]
+
+# share of deployments with the (large) annotation written by "kubectl apply"
+LAST_APPLIED_SHARE = 0.3
+# share of running pods forcing uptime in their namespace
+FORCE_UPTIME_POD_SHARE = 0.01
+
+
+def choose(rng: random.Random, mix: list):
+    return rng.choices(mix, weights=[entry[0] for entry in mix])[0]
+
+
+def get_namespace(name: str, rng: random.Random) -> dict:
+    _, annotations = choose(rng, NAMESPACE_ANNOTATION_MIX)
+    return {
+        "apiVersion": "v1",
+        "kind": "Namespace",
+        "metadata": {
+            "name": name,
+            "labels": {"team": f"team-{rng.randrange(50)}"},
+            "annotations": dict(annotations),
+            "creationTimestamp": "2020-01-01T00:00:00Z",
+        },
+        "spec": {"finalizers": ["kubernetes"]},
+        "status": {"phase": "Active"},
+    }
+
+
+def get_deployment(name: str, namespace: str, rng: random.Random) -> dict:
+    """Return a deployment with a typical manifest size (pod template, managed fields and status)."""
+    _, annotations, replicas = choose(rng, DEPLOYMENT_ANNOTATION_MIX)
+    labels = {"application": name, "version": f"v{rng.randrange(1, 20)}"}
+    container = {
+        "name": "main",
+        "image": f"registry.example.org/{namespace}/{name}:{rng.randrange(1000)}",
+        "ports": [{"containerPort": 8080, "protocol": "TCP"}],
+        "env": [
+            {"name": f"ENV_VAR_{i}", "value": f"value-{rng.randrange(10 ** 6)}"}
+            for i in range(rng.randrange(2, 10))
+        ],
+        "resources": {
+            "limits": {"memory": "512Mi"},
+            "requests": {"cpu": "100m", "memory": "512Mi"},
+        },
+        "readinessProbe": {"httpGet": {"path": "/health", "port": 8080}},
+    }
+    deployment = {
+        "apiVersion": "apps/v1",
+        "kind": "Deployment",
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "labels": labels,
+            "annotations": {
+                "deployment.kubernetes.io/revision": str(rng.randrange(1, 50)),
+                **annotations,
+            },
+            "creationTimestamp": "2020-01-01T00:00:00Z",
+            "generation": rng.randrange(1, 50),
+            "managedFields": [
+                {
+                    "manager": "kubectl",
+                    "operation": "Update",
+                    "apiVersion": "apps/v1",
+                    "time": "2020-01-01T00:00:00Z",
+                    "fieldsType": "FieldsV1",
+                    "fieldsV1": {"f:spec": {"f:replicas": {}, "f:template": {}}},
+                }
+            ],
+        },
+        "spec": {
+            "replicas": replicas,
+            "selector": {"matchLabels": {"application": name}},
+            "template": {
+                "metadata": {"labels": labels},
+                "spec": {"containers": [container]},
+            },
+        },
+        "status": {
+            "replicas": replicas,
+            "readyReplicas": replicas,
+            "observedGeneration": 1,
+        },
+    }
+    if rng.random() < LAST_APPLIED_SHARE:
+        deployment["metadata"]["annotations"][
+            "kubectl.kubernetes.io/last-applied-configuration"
+        ] = json.dumps({"spec": deployment["spec"]})
+    return deployment
+
+
+def get_pod(name: str, namespace: str, rng: random.Random) -> dict:
+    annotations = {}
+    if rng.random() < FORCE_UPTIME_POD_SHARE:
+        annotations[scaler.FORCE_UPTIME_ANNOTATION] = "true"
+    return {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "annotations": annotations,
+            "creationTimestamp": "2020-01-01T00:00:00Z",
+        },
+        "spec": {"containers": [{"name": "main", "image": "busybox"}]},
+        "status": {"phase": rng.choice(["Running"] * 9 + ["Succeeded"])},
+    }
+
+
+def get_store(args) -> Store:
+    rng = random.Random(args.seed)
+    store = Store()
+    namespaces = [f"ns-{i}" for i in range(args.namespaces)]
+    for namespace in ["kube-system"] + namespaces:
+        store.add("namespaces", get_namespace(namespace, rng))
+    store.add(
+        "deployments", get_deployment("kube-downscaler", "kube-system", random.Random())
+    )
+    for i in range(args.deployments):
+        namespace = namespaces[i % len(namespaces)]
+        store.add("deployments", get_deployment(f"deploy-{i}", namespace, rng))
+    for i in range(args.pods):
+        namespace = namespaces[i % len(namespaces)]
+        store.add("pods", get_pod(f"pod-{i}", namespace, rng))
+    return store
+
+
+def serve(args, connection):
+    """Build the cluster and serve it until the parent process sends anything."""
+    store = get_store(args)
+    with FakeAPIServer(
+        store,
+        args.latency,
+        args.throttle_rate,
+        args.conflict_rate,
+        args.retry_after,
+        args.seed,
+    ) as server:
+        connection.send(server.url)
+        connection.recv()
+
+
+def get_stats(url: str) -> dict:
+    return requests.get(url + STATS_PATH).json()
+
+
+def get_difference(before: dict, after: dict) -> dict:
+    requests_by_verb = {
+        verb: count - before["requests"].get(verb, 0)
+        for verb, count in after["requests"].items()
+    }
+    return {
+        **{key: after[key] - before[key] for key in after if key != "requests"},
+        "requests": {verb: count for verb, count in requests_by_verb.items() if count},
+    }
+
+
+def get_peak_rss_mib() -> float:
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_kwargs(args, decision_cache, informers) -> dict:
+    return dict(
+        namespace="",
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime=args.default_uptime,
+        default_downtime="never",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=frozenset([re.compile("kube-system")]),
+        exclude_deployments=frozenset(["kube-downscaler"]),
+        dry_run=False,
+        grace_period=0,
+        enable_events=args.events,
+        informers=informers,
+        max_concurrent_updates=args.concurrency,
+        list_page_size=args.page_size,
+        decision_cache=decision_cache,
+    )
+
+
+def print_cycle(name: str, seconds: float, stats: dict):
+    requests_by_verb = ", ".join(
+        f"{verb}={count}" for verb, count in sorted(stats["requests"].items())
+    )
+    print(
+        f"{name:>8} {seconds:>8.2f} {sum(stats['requests'].values()):>9} "
+        f"{stats['bytesSent'] / 2 ** 20:>9.1f} {stats['bytesReceived'] / 2 ** 20:>9.1f} "
+        f"{stats['throttled']:>9} {stats['conflicts']:>9}  {requests_by_verb}"
+    )
+
+
+def run(url: str, args):
+    config = pykube.KubeConfig.from_url(url)
+    rate_limiter = RateLimiter(args.write_qps, args.write_burst)
+    pool_size = helper.DEFAULT_POOL_SIZE + args.concurrency
+    adapter = helper.RateLimitedHTTPAdapter(
+        config, rate_limiter, pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    api = pykube.HTTPClient(config, http_adapter=adapter)
+    decision_cache = scaler.DecisionCache() if args.decision_cache else None
+
+    informers = None
+    if args.informer:
+        before = get_stats(url)
+        start = time.perf_counter()
+        informers = downscaler_main.start_informers(
+            api,
+            "",
+            "deployments",
+            page_size=args.page_size,
+            on_delete=decision_cache.evict if decision_cache else None,
+        )
+        print_cycle(
+            "sync", time.perf_counter() - start, get_difference(before, get_stats(url))
+        )
+
+    event_emitter = None
+    async_event_emitter = None
+    loop = None
+    if args.engine == "async":
+        from kube_downscaler import async_engine
+
+        loop = asyncio.new_event_loop()
+        client = async_engine.AsyncKubeClient(config, pool_size, rate_limiter)
+        if args.events:
+            async_event_emitter = async_engine.AsyncEventEmitter(client)
+    elif args.events:
+        event_emitter = EventEmitter(api)
+        event_emitter.start()
+
+    kwargs = get_kwargs(args, decision_cache, informers)
+    try:
+        for cycle in range(1, args.cycles + 1):
+            before = get_stats(url)
+            start = time.perf_counter()
+            if loop:
+                loop.run_until_complete(
+                    async_engine.scale(
+                        client, event_emitter=async_event_emitter, **kwargs
+                    )
+                )
+            else:
+                scaler.scale(api=api, event_emitter=event_emitter, **kwargs)
+                if event_emitter:
+                    # events are part of the cycle
+                    event_emitter.flush()
+            seconds = time.perf_counter() - start
+            print_cycle(f"#{cycle}", seconds, get_difference(before, get_stats(url)))
+    finally:
+        if event_emitter:
+            event_emitter.stop()
+        for informer in (informers or {}).values():
+            informer.stop()
+        if loop:
+            loop.run_until_complete(client.close())
+            loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--namespaces", type=int, default=1000)
+    parser.add_argument("--deployments", type=int, default=50000)
+    parser.add_argument("--pods", type=int, default=10000)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--engine", choices=["sync", "async"], default="sync")
+    parser.add_argument("--informer", action="store_true")
+    parser.add_argument("--events", action="store_true")
+    parser.add_argument(
+        "--no-decision-cache", dest="decision_cache", action="store_false"
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--page-size", type=int, default=helper.DEFAULT_PAGE_SIZE)
+    parser.add_argument("--write-qps", type=float, default=0)
+    parser.add_argument("--write-burst", type=int, default=DEFAULT_BURST)
+    parser.add_argument("--default-uptime", default=DEFAULT_UPTIME)
+    parser.add_argument(
+        "--latency", type=float, default=0.001, help="Simulated API latency in seconds"
+    )
+    parser.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0,
+        help="Share of requests answered with 429 Too Many Requests",
+    )
+    parser.add_argument(
+        "--conflict-rate",
+        type=float,
+        default=0,
+        help="Share of writes answered with 409 Conflict",
+    )
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=1,
+        help="Retry-After seconds sent with 429 Too Many Requests",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # do not measure the per-resource log output (failed updates are counted by the fake API server)
+    logging.disable(logging.ERROR)
+
+    connection, child_connection = multiprocessing.Pipe()
+    server = multiprocessing.Process(
+        target=serve, args=(args, child_connection), daemon=True
+    )
+    start = time.perf_counter()
+    server.start()
+    url = connection.recv()
+    print(
+        f"{args.namespaces} namespaces, {args.deployments} deployments and {args.pods} pods "
+        f"built in {time.perf_counter() - start:.1f}s, {args.latency * 1000:.0f}ms API latency"
+    )
+    print(
+        f"{'cycle':>8} {'seconds':>8} {'requests':>9} {'MiB in':>9} {'MiB out':>9} "
+        f"{'throttled':>9} {'conflicts':>9}  requests by verb"
+    )
+    rss_before = get_peak_rss_mib()
+    try:
+        run(url, args)
+    finally:
+        connection.send("stop")
+        server.join()
+    print(
+        f"peak RSS: {get_peak_rss_mib():.0f} MiB ({rss_before:.0f} MiB before the first cycle)"
+    )
+
+
+if __name__ == "__main__":
+    main()
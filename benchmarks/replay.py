@@ -0,0 +1,90 @@
+"""Replay a loop iteration recorded with --record offline, e.g. to benchmark or profile it against real data.
+
+The recorded settings and time are used, i.e. the same decisions are made and the same requests are sent.
+Requests which were not recorded (e.g. because the code changed the decisions) are answered with 404 and reported.
+
+Run from the repository root:
+
+    poetry run python -m benchmarks.replay recording.jsonl.gz --cycles=5
+    poetry run python -m benchmarks.replay recording.jsonl.gz --profile
+"""
+
+import argparse
+import cProfile
+import datetime
+import logging
+import pstats
+import re
+import time
+
+import pykube
+
+from kube_downscaler import scaler
+from kube_downscaler.recording import load_recording
+from kube_downscaler.recording import ReplayHTTPAdapter
+
+
+def get_kwargs(settings: dict) -> dict:
+    """Return the scale() arguments for the recorded settings, same as kube_downscaler.main.run_loop."""
+    kwargs = dict(settings)
+    kwargs["include_resources"] = frozenset(settings["include_resources"].split(","))
+    kwargs["exclude_namespaces"] = frozenset(
+        re.compile(pattern) for pattern in settings["exclude_namespaces"].split(",")
+    )
+    kwargs["exclude_deployments"] = frozenset(
+        settings["exclude_deployments"].split(",")
+    )
+    return kwargs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recording")
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument(
+        "--profile", action="store_true", help="Print the top functions of one cycle"
+    )
+    parser.add_argument(
+        "--decision-cache",
+        action="store_true",
+        help="Reuse decisions across cycles (all cycles after the first are cache hits)",
+    )
+    args = parser.parse_args()
+
+    header, exchanges = load_recording(args.recording)
+    adapter = ReplayHTTPAdapter(exchanges)
+    api = pykube.HTTPClient(
+        pykube.KubeConfig.from_url("http://replay"), http_adapter=adapter
+    )
+    now = datetime.datetime.fromisoformat(header["recorded"])
+    kwargs = get_kwargs(header["settings"])
+    decision_cache = scaler.DecisionCache() if args.decision_cache else None
+
+    # do not measure the per-resource log output
+    logging.disable(logging.ERROR)
+
+    print(f"{len(exchanges)} requests recorded at {header['recorded']}")
+    if args.profile:
+        profile = cProfile.Profile()
+        profile.runcall(
+            scaler.scale, api=api, now=now, decision_cache=decision_cache, **kwargs
+        )
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(30)
+        return
+
+    print(f"{'cycle':>8} {'seconds':>8} {'requests':>9} {'misses':>7}")
+    for cycle in range(1, args.cycles + 1):
+        requests, misses = adapter.requests, len(adapter.misses)
+        start = time.perf_counter()
+        scaler.scale(api=api, now=now, decision_cache=decision_cache, **kwargs)
+        seconds = time.perf_counter() - start
+        print(
+            f"{'#' + str(cycle):>8} {seconds:>8.2f} {adapter.requests - requests:>9} "
+            f"{len(adapter.misses) - misses:>7}"
+        )
+    for method, url in sorted(set(adapter.misses))[:10]:
+        print(f"not recorded: {method} {url}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,790 @@
+import asyncio
+import base64
+import datetime
+import json
+import logging
+import ssl
+import time
+from typing import AsyncIterator
+from typing import Callable
+from typing import Dict
+from typing import FrozenSet
+from typing import List
+from typing import Optional
+from typing import Pattern
+from typing import Set
+from typing import Tuple
+from typing import Union
+
+import aiohttp
+import pykube
+from pykube import Namespace
+from pykube.exceptions import HTTPError
+from pykube.objects import NamespacedAPIObject
+
+from kube_downscaler import helper
+from kube_downscaler import metrics
+from kube_downscaler import ratelimit
+from kube_downscaler.events import aggregate
+from kube_downscaler.events import CORE_EVENTS_API
+from kube_downscaler.events import EVENT_CACHE_SIZE
+from kube_downscaler.events import EVENT_CACHE_TTL_SECONDS
+from kube_downscaler.events import EventCache
+from kube_downscaler.events import EVENTS_API
+from kube_downscaler.events import get_create_body
+from kube_downscaler.events import get_update_patch
+from kube_downscaler.events import QueuedEvent
+from kube_downscaler.informer import Informer
+from kube_downscaler.informer import PARTIAL_OBJECT_METADATA_LIST
+from kube_downscaler.leader import check_leadership
+from kube_downscaler.leader import LeadershipLost
+from kube_downscaler.ratelimit import PRIORITY_EVENT
+from kube_downscaler.ratelimit import PRIORITY_SCALE_DOWN
+from kube_downscaler.ratelimit import PRIORITY_SCALE_UP
+from kube_downscaler.ratelimit import RateLimiter
+from kube_downscaler.recording import Recorder
+from kube_downscaler.resources.event import Event as EventV1
+from kube_downscaler.resources.record import ResourceRecord
+from kube_downscaler.scaler import apply_action
+from kube_downscaler.scaler import DecisionCache
+from kube_downscaler.scaler import filter_resources
+from kube_downscaler.scaler import get_action
+from kube_downscaler.scaler import get_event_message
+from kube_downscaler.scaler import get_list_params
+from kube_downscaler.scaler import get_namespace_defaults
+from kube_downscaler.scaler import get_namespace_names
+from kube_downscaler.scaler import get_namespace_time_specs
+from kube_downscaler.scaler import get_next_transition
+from kube_downscaler.scaler import get_scale_patch
+from kube_downscaler.scaler import get_shard
+from kube_downscaler.scaler import get_target_namespaces
+from kube_downscaler.scaler import get_time_specs
+from kube_downscaler.scaler import is_forcing_uptime
+from kube_downscaler.scaler import NamespaceDefaults
+from kube_downscaler.scaler import NOT_FINISHED_PODS_FIELD_SELECTOR
+from kube_downscaler.scaler import RESOURCE_CLASSES
+from kube_downscaler.scaler import SCALE_UP
+from kube_downscaler.scaler import ScheduleGroups
+
+logger = logging.getLogger(__name__)
+
+# same default timeout as pykube's HTTPClient
+DEFAULT_TIMEOUT_SECONDS = 10
+# kubeconfig user fields (e.g. exec plugins or OIDC) which are only supported by pykube, i.e. the sync engine
+UNSUPPORTED_AUTH_FIELDS = ("exec", "auth-provider")
+
+
+class APIError(HTTPError):
+
+    """HTTPError which keeps the Status object returned by the API server."""
+
+    def __init__(self, code: int, message: str, status: dict):
+        super().__init__(code, message)
+        self.status = status
+        # seconds to wait before retrying, e.g. for "429 Too Many Requests"
+        self.retry_after = ratelimit.DEFAULT_RETRY_AFTER_SECONDS
+
+
+def get_ssl_context(config: pykube.KubeConfig) -> Union[ssl.SSLContext, bool]:
+    cluster = config.cluster
+    if cluster.get("insecure-skip-tls-verify"):
+        return False
+    cafile = None
+    if "certificate-authority" in cluster:
+        cafile = cluster["certificate-authority"].filename()
+    context = ssl.create_default_context(cafile=cafile)
+    user = config.user
+    if "client-certificate" in user:
+        context.load_cert_chain(
+            user["client-certificate"].filename(), user["client-key"].filename()
+        )
+    return context
+
+
+def get_auth_headers(config: pykube.KubeConfig) -> Dict[str, str]:
+    """Return the Authorization header for token or basic auth (client certificates are part of the SSL context).
+
+    Raises ValueError for kubeconfig users which only pykube (i.e. the sync engine) supports, e.g. exec or OIDC.
+    """
+    user = config.user
+    if user.get("token"):
+        return {"Authorization": f"Bearer {user['token']}"}
+    if user.get("username") and user.get("password"):
+        credentials = f"{user['username']}:{user['password']}".encode("utf-8")
+        return {"Authorization": f"Basic {base64.b64encode(credentials).decode()}"}
+    for field in UNSUPPORTED_AUTH_FIELDS:
+        if field in user:
+            raise ValueError(
+                f'The kubeconfig user authenticates with "{field}", which is not supported by --engine=async (use --engine=sync)'
+            )
+    return {}
+
+
+def get_path(kind, namespace: Optional[str] = None, name: Optional[str] = None) -> str:
+    """Return the API path of a collection or object, e.g. /apis/apps/v1/namespaces/default/deployments/my-deploy."""
+    base = kind.base or ("/api" if kind.version == "v1" else "/apis")
+    parts = [base, kind.version]
+    if namespace:
+        parts += ["namespaces", namespace]
+    parts.append(kind.endpoint)
+    if name:
+        parts.append(name)
+    return "/".join(parts)
+
+
+class AsyncKubeClient:
+
+    """Minimal Kubernetes API client sharing one aiohttp session (and connection pool) for all requests."""
+
+    def __init__(
+        self,
+        config: pykube.KubeConfig,
+        pool_size: int,
+        rate_limiter: Optional[RateLimiter] = None,
+        recorder: Optional[Recorder] = None,
+    ):
+        self.url = config.cluster["server"].rstrip("/")
+        self.headers = get_auth_headers(config)
+        self.ssl = get_ssl_context(config)
+        self.pool_size = pool_size
+        # shared with the sync API client, see helper.RateLimitedHTTPAdapter
+        self.rate_limiter = rate_limiter
+        # same format as recorded by the sync API client
+        self.recorder = recorder
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # the session must be created within the running event loop
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, ssl=self.ssl),
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT_SECONDS),
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        data: Optional[dict] = None,
+        content_type: str = "application/json",
+    ) -> dict:
+        kwargs: dict = {"params": params, "headers": dict(headers or {})}
+        if data is not None:
+            kwargs["data"] = json.dumps(data)
+            kwargs["headers"]["Content-Type"] = content_type
+        retries = 0
+        while True:
+            if self.rate_limiter and method in ratelimit.WRITE_METHODS:
+                await self.rate_limiter.acquire_async()
+            try:
+                return await self._request(method, path, kwargs)
+            except APIError as e:
+                if e.code != 429 or retries >= ratelimit.MAX_RETRIES:
+                    raise
+                seconds = e.retry_after
+            retries += 1
+            logger.warning(
+                f"{method} {path} was throttled by the API server, retrying in {seconds}s"
+            )
+            if self.rate_limiter:
+                # all other writes wait as well
+                self.rate_limiter.pause(seconds)
+            await asyncio.sleep(seconds)
+
+    async def _request(self, method: str, path: str, kwargs: dict) -> dict:
+        start = time.monotonic()
+        async with self.get_session().request(method, self.url + path, **kwargs) as r:
+            body = await r.read()
+            if self.recorder and not self.recorder.closed:
+                self.recorder.record(
+                    method, str(r.url), kwargs.get("data"), r.status, r.headers, body
+                )
+            resource = metrics.get_resource_from_path(path)
+            metrics.API_REQUESTS.inc(verb=method, resource=resource, code=str(r.status))
+            metrics.API_REQUEST_DURATION.observe(
+                time.monotonic() - start, verb=method, resource=resource
+            )
+            if r.status >= 400:
+                try:
+                    status = json.loads(body)
+                except ValueError:
+                    status = {"message": body.decode("utf-8", "replace")}
+                error = APIError(r.status, status.get("message"), status)
+                error.retry_after = ratelimit.get_retry_after(r.headers)
+                raise error
+            return json.loads(body)
+
+    async def list_pages(
+        self,
+        kind,
+        namespace: Optional[str] = None,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        page_size: int = helper.DEFAULT_PAGE_SIZE,
+    ) -> AsyncIterator[dict]:
+        """Yield the LIST response chunks one by one, see helper.list_pages."""
+        params = dict(params or {})
+        if page_size:
+            params["limit"] = page_size
+        path = get_path(kind, namespace)
+        token = None
+        while True:
+            try:
+                data = await self.request(
+                    "GET",
+                    path,
+                    params={**params, "continue": token} if token else params,
+                    headers=headers,
+                )
+            except APIError as e:
+                if e.code != 410 or not token:
+                    raise
+                # the continue token expired, the API server tells us where to resume
+                token = (e.status.get("metadata") or {}).get("continue")
+                if not token:
+                    raise
+                logger.warning(
+                    f"Continue token for {kind.endpoint} expired, resuming with inconsistent list"
+                )
+                continue
+            yield data
+            token = (data.get("metadata") or {}).get("continue")
+            if not token:
+                break
+
+    async def patch(self, resource: ResourceRecord, patch: dict) -> dict:
+        return await self.request(
+            "PATCH",
+            get_path(resource.resource_class, resource.namespace, resource.name),
+            data=patch,
+            content_type="application/merge-patch+json",
+        )
+
+
+class AsyncEventEmitter:
+
+    """Same as events.EventEmitter, but the events of a loop iteration are sent after its updates (without listing events)."""
+
+    def __init__(
+        self,
+        client: AsyncKubeClient,
+        events_api: str = CORE_EVENTS_API,
+        cache_size: int = EVENT_CACHE_SIZE,
+        cache_ttl: float = EVENT_CACHE_TTL_SECONDS,
+    ):
+        self.client = client
+        self.events_api = events_api
+        # kept across loop iterations, i.e. repeated events update the ones created before
+        self._cache = EventCache(cache_size, cache_ttl)
+        self._pending: List[QueuedEvent] = []
+
+    def emit(self, resource, message: str, reason: str, event_type: str):
+        self._pending.append(
+            QueuedEvent(
+                helper.get_involved_object(resource),
+                message,
+                reason,
+                event_type,
+                datetime.datetime.utcnow(),
+            )
+        )
+
+    async def flush(self, max_concurrent: int = 1):
+        """Send all emitted events, repeated events only once."""
+        events = aggregate(self._pending)
+        self._pending = []
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def send(event: QueuedEvent, count: int):
+            async with semaphore:
+                await self.send(event, count)
+
+        results = await asyncio.gather(
+            *[send(event, count) for event, count in events], return_exceptions=True
+        )
+        for (event, _), result in zip(events, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"Could not send event for {event.involved_object['namespace']}/{event.involved_object['name']}: {result}"
+                )
+
+    def get_path(self, event: QueuedEvent, name: Optional[str] = None) -> str:
+        kind = EventV1 if self.events_api == EVENTS_API else pykube.Event
+        return get_path(kind, event.involved_object["namespace"], name)
+
+    async def send(self, event: QueuedEvent, count: int = 1):
+        cached = self._cache.get(event)
+        if cached:
+            try:
+                await self.client.request(
+                    "PATCH",
+                    self.get_path(event, cached.name),
+                    data=get_update_patch(event, cached.count + count, self.events_api),
+                    content_type="application/merge-patch+json",
+                )
+            except APIError as e:
+                if e.code != 404:
+                    raise
+                # the event was deleted in the meantime, create a new one
+            else:
+                self._cache.updated(event, cached, cached.count + count)
+                return
+        obj = await self.client.request(
+            "POST",
+            self.get_path(event),
+            data=get_create_body(event, count, self.events_api),
+        )
+        self._cache.created(event, obj["metadata"]["name"], count)
+
+
+async def pods_force_uptime(
+    client: AsyncKubeClient,
+    namespace: str,
+    informer: Optional[Informer] = None,
+    page_size: int = helper.DEFAULT_PAGE_SIZE,
+) -> bool:
+    """Return True if there are any running pods which require the deployments to be scaled back up."""
+    if informer:
+        pods = [pod.obj for pod in informer.list()]
+    else:
+        pods = []
+        async for page in client.list_pages(
+            pykube.Pod,
+            namespace,
+            params={"fieldSelector": NOT_FINISHED_PODS_FIELD_SELECTOR},
+            headers={"Accept": PARTIAL_OBJECT_METADATA_LIST},
+            page_size=page_size,
+        ):
+            pods = [pod for pod in page.get("items") or [] if is_forcing_uptime(pod)]
+            if pods:
+                # no need to fetch the remaining pages
+                break
+    for pod in pods:
+        if is_forcing_uptime(pod):
+            metadata = pod["metadata"]
+            logger.info(
+                f"Forced uptime because of {metadata.get('namespace')}/{metadata['name']}"
+            )
+            return True
+    return False
+
+
+async def get_namespace(client: AsyncKubeClient, name: str) -> NamespacedAPIObject:
+    return Namespace(None, await client.request("GET", get_path(Namespace, name=name)))
+
+
+async def get_namespaces(
+    client: AsyncKubeClient,
+    namespace: str,
+    informer: Optional[Informer] = None,
+    page_size: int = helper.DEFAULT_PAGE_SIZE,
+    namespace_selector: Optional[str] = None,
+) -> Dict[str, NamespacedAPIObject]:
+    if informer:
+        namespace_objs = informer.list()
+    elif namespace:
+        namespace_objs = [await get_namespace(client, namespace)]
+    else:
+        params = {"labelSelector": namespace_selector} if namespace_selector else None
+        namespace_objs = []
+        async for page in client.list_pages(
+            Namespace, params=params, page_size=page_size
+        ):
+            namespace_objs += [Namespace(None, obj) for obj in page.get("items") or []]
+    return {namespace_obj.name: namespace_obj for namespace_obj in namespace_objs}
+
+
+_DONE = object()
+
+
+class Prefetcher:
+
+    """Consume the LIST pages in a background task while the caller processes the previous ones, see helper.Prefetcher."""
+
+    def __init__(self, pages: AsyncIterator[dict], maxsize: int = 1):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        # start fetching right away, not only when the caller starts iterating
+        self._task = asyncio.ensure_future(self._run(pages))
+
+    async def _run(self, pages: AsyncIterator[dict]):
+        try:
+            async for page in pages:
+                await self._queue.put((page, None))
+        except Exception as e:
+            await self._queue.put((None, e))
+        else:
+            await self._queue.put((_DONE, None))
+
+    async def __aiter__(self):
+        while True:
+            page, error = await self._queue.get()
+            if error is not None:
+                raise error
+            if page is _DONE:
+                return
+            yield page
+
+    def close(self):
+        self._task.cancel()
+
+
+async def chain_pages(prefetchers: List[Prefetcher]) -> AsyncIterator[dict]:
+    for prefetcher in prefetchers:
+        async for page in prefetcher:
+            yield page
+
+
+async def group_by_namespace(
+    kind, pages: AsyncIterator[dict], deployment_time_annotation: Optional[str] = None
+) -> AsyncIterator[Tuple[str, List[ResourceRecord]]]:
+    """Group the listed objects (as compact records) by namespace, the API server returns them ordered by namespace and name."""
+    current_namespace = None
+    group: List[ResourceRecord] = []
+    async for page in pages:
+        for obj in page.get("items") or []:
+            resource = ResourceRecord(None, kind, obj, deployment_time_annotation)
+            if group and resource.namespace != current_namespace:
+                yield current_namespace, group
+                group = []
+            current_namespace = resource.namespace
+            group.append(resource)
+    if group:
+        yield current_namespace, group
+
+
+async def iterate_informer(informer: Informer) -> AsyncIterator[dict]:
+    # the informer's store is already in memory, i.e. it is a single "page"
+    yield {"items": [resource.obj for resource in informer.list()]}
+
+
+class Updater:
+
+    """Send PATCH (and event) requests as tasks, at most max_concurrent_updates at a time."""
+
+    def __init__(
+        self,
+        client: AsyncKubeClient,
+        max_concurrent_updates: int,
+        event_emitter: Optional[AsyncEventEmitter] = None,
+        is_leader: Optional[Callable[[], bool]] = None,
+    ):
+        self.client = client
+        self.max_concurrent_updates = max_concurrent_updates
+        self.semaphore = asyncio.Semaphore(max_concurrent_updates)
+        self.event_emitter = event_emitter
+        self.is_leader = is_leader
+        self.pending: List[Tuple[NamespacedAPIObject, asyncio.Future]] = []
+
+    async def _update(self, resource: NamespacedAPIObject, scaling_up: bool):
+        patch = get_scale_patch(resource)
+        async with self.semaphore:
+            # the update might have waited for the semaphore (or the rate limiter) for a while
+            check_leadership(self.is_leader)
+            # scale-ups first, e.g. when the downtime ends for many resources at once
+            with ratelimit.priority(
+                PRIORITY_SCALE_UP if scaling_up else PRIORITY_SCALE_DOWN
+            ):
+                await self.client.patch(resource, patch)
+        if self.event_emitter:
+            self.event_emitter.emit(
+                resource,
+                get_event_message(resource, scaling_up),
+                "ScaleUp" if scaling_up else "ScaleDown",
+                "Normal",
+            )
+
+    def submit(self, resource: NamespacedAPIObject, scaling_up: bool):
+        task = asyncio.ensure_future(self._update(resource, scaling_up))
+        self.pending.append((resource, task))
+
+    async def wait(self):
+        """Wait for all submitted updates (errors are logged in submission order) and send their events.
+
+        LeadershipLost is raised (once) after the events were sent if any update was not sent because of it.
+        """
+        await asyncio.gather(
+            *[task for _, task in self.pending], return_exceptions=True
+        )
+        lost = None
+        for resource, task in self.pending:
+            e = task.exception()
+            if isinstance(e, LeadershipLost):
+                lost = e
+            elif e is not None:
+                logger.error(
+                    f"Failed to process {resource.kind} {resource.namespace}/{resource.name}: {e}"
+                )
+        self.pending = []
+        if self.event_emitter:
+            # events are sent after all updates (if rate limited)
+            with ratelimit.priority(PRIORITY_EVENT):
+                await self.event_emitter.flush(self.max_concurrent_updates)
+        if lost:
+            raise lost
+
+
+async def autoscale_resources(
+    client: AsyncKubeClient,
+    kind,
+    pages: AsyncIterator[dict],
+    exclude_namespaces: FrozenSet[Pattern],
+    exclude_names: FrozenSet[str],
+    upscale_period: str,
+    downscale_period: str,
+    default_uptime: str,
+    default_downtime: str,
+    forced_uptime: bool,
+    dry_run: bool,
+    now: datetime.datetime,
+    grace_period: int,
+    downtime_replicas: int,
+    deployment_time_annotation: Optional[str],
+    namespaces: Dict[str, NamespacedAPIObject],
+    namespace_defaults: Dict[str, NamespaceDefaults],
+    time_specs: Set[str],
+    updater: Updater,
+    decision_cache: Optional[DecisionCache] = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    schedule_groups: Optional[ScheduleGroups] = None,
+):
+    """Same as scaler.autoscale_resources, but updates are sent as tasks without blocking the evaluation."""
+    if schedule_groups is None:
+        schedule_groups = ScheduleGroups(now)
+    async for current_namespace, group in group_by_namespace(
+        kind, pages, deployment_time_annotation
+    ):
+        if shard_count > 1 and get_shard(current_namespace, shard_count) != shard_index:
+            continue
+        resources = filter_resources(
+            kind, current_namespace, group, exclude_namespaces, exclude_names
+        )
+        if not resources:
+            continue
+
+        defaults = namespace_defaults.get(current_namespace)
+        if defaults is None:
+            namespace_obj = namespaces.get(current_namespace)
+            if namespace_obj is None:
+                # the namespace was not (yet) listed, e.g. because it was just created
+                namespace_obj = await get_namespace(client, current_namespace)
+            defaults = get_namespace_defaults(
+                namespace_obj,
+                upscale_period,
+                downscale_period,
+                default_uptime,
+                default_downtime,
+                forced_uptime,
+                now,
+                downtime_replicas,
+            )
+            namespace_defaults[current_namespace] = defaults
+            time_specs.update(get_namespace_time_specs(namespace_obj))
+
+        for resource in resources:
+            schedule = get_time_specs(resource, defaults)
+            if schedule_groups.add(schedule):
+                time_specs.update(schedule)
+            metrics.RESOURCES_EVALUATED.inc(kind=resource.kind)
+            try:
+                action = get_action(
+                    resource,
+                    defaults,
+                    now,
+                    grace_period,
+                    deployment_time_annotation,
+                    decision_cache,
+                    schedule_groups,
+                    schedule,
+                )
+                # events are sent together with the update
+                if apply_action(resource, action, dry_run, False, grace_period):
+                    if dry_run:
+                        logger.info(
+                            f"**DRY-RUN**: would update {resource.kind} {resource.namespace}/{resource.name}"
+                        )
+                    else:
+                        check_leadership(updater.is_leader)
+                        updater.submit(resource, action.type == SCALE_UP)
+            except LeadershipLost:
+                raise
+            except Exception as e:
+                logger.exception(
+                    f"Failed to process {resource.kind} {resource.namespace}/{resource.name}: {e}"
+                )
+
+
+async def scale(
+    client: AsyncKubeClient,
+    namespace: str,
+    upscale_period: str,
+    downscale_period: str,
+    default_uptime: str,
+    default_downtime: str,
+    include_resources: FrozenSet[str],
+    exclude_namespaces: FrozenSet[Pattern],
+    exclude_deployments: FrozenSet[str],
+    dry_run: bool,
+    grace_period: int,
+    downtime_replicas: int = 0,
+    deployment_time_annotation: Optional[str] = None,
+    enable_events: bool = False,
+    informers: Optional[Dict[str, Informer]] = None,
+    max_concurrent_updates: int = 1,
+    list_page_size: int = helper.DEFAULT_PAGE_SIZE,
+    decision_cache: Optional[DecisionCache] = None,
+    label_selector: Optional[str] = None,
+    namespace_selector: Optional[str] = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    event_emitter: Optional[AsyncEventEmitter] = None,
+    is_leader: Optional[Callable[[], bool]] = None,
+    now: Optional[datetime.datetime] = None,
+) -> Optional[datetime.datetime]:
+    """Scale all resources (see scaler.scale) and return the next instant when any of the used time specs changes."""
+    informers = informers or {}
+    start = time.monotonic()
+    # a fixed time is only given for the recorded loop iteration
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if decision_cache:
+        decision_cache.start_cycle(now)
+    kinds = [clazz for clazz in RESOURCE_CLASSES if clazz.endpoint in include_resources]
+
+    async def list_namespaces(target_namespace):
+        try:
+            return await get_namespaces(
+                client,
+                target_namespace,
+                informers.get(Namespace.endpoint),
+                list_page_size,
+                namespace_selector,
+            )
+        except APIError as e:
+            if e.code != 404 or len(names) < 2:
+                raise
+            # do not fail all other namespaces of the list
+            logger.warning(f"Namespace {target_namespace} does not exist")
+            return {}
+
+    names = get_namespace_names(namespace)
+    selected = None
+    if namespace_selector or (shard_count > 1 and not names):
+        # the selected namespaces must be known before their resources can be listed
+        selected = await list_namespaces(None)
+    targets = (
+        [None]
+        if informers
+        else get_target_namespaces(namespace, selected, shard_index, shard_count)
+    )
+    pod_targets = targets
+    if shard_count > 1 and not informers:
+        # pods in any of the namespaces (not only the shard's) force the uptime, same as without sharding
+        pod_targets = get_target_namespaces(
+            namespace, selected if namespace_selector else None
+        )
+
+    # all LIST calls run concurrently, the cycle only waits for the slowest one
+    forced_uptime_task = asyncio.ensure_future(
+        asyncio.gather(
+            *[
+                pods_force_uptime(
+                    client, target, informers.get(pykube.Pod.endpoint), list_page_size
+                )
+                for target in pod_targets
+            ]
+        )
+    )
+    namespaces_task = asyncio.ensure_future(
+        asyncio.gather(
+            *[
+                list_namespaces(target)
+                for target in (targets if selected is None else [])
+            ]
+        )
+    )
+    params = get_list_params(exclude_namespaces, exclude_deployments, label_selector)
+    prefetchers: Dict[str, List[Prefetcher]] = {}
+    for clazz in kinds:
+        if clazz.endpoint not in informers:
+            prefetchers[clazz.endpoint] = [
+                Prefetcher(
+                    client.list_pages(
+                        clazz, target, params=params, page_size=list_page_size
+                    )
+                )
+                for target in targets
+            ]
+
+    if enable_events and event_emitter is None:
+        event_emitter = AsyncEventEmitter(client)
+    updater = Updater(
+        client,
+        max_concurrent_updates,
+        event_emitter if enable_events else None,
+        is_leader,
+    )
+    time_specs: Set[str] = set()
+    schedule_groups = ScheduleGroups(now)
+    try:
+        forced_uptimes, namespaces_list = await asyncio.gather(
+            forced_uptime_task, namespaces_task
+        )
+        forced_uptime = any(forced_uptimes)
+        namespaces = selected or {}
+        for target_namespaces in namespaces_list:
+            namespaces.update(target_namespaces)
+        namespace_defaults: Dict[str, NamespaceDefaults] = {}
+        for clazz in kinds:
+            await autoscale_resources(
+                client,
+                clazz,
+                (
+                    chain_pages(prefetchers[clazz.endpoint])
+                    if clazz.endpoint in prefetchers
+                    else iterate_informer(informers[clazz.endpoint])
+                ),
+                exclude_namespaces,
+                exclude_deployments,
+                upscale_period,
+                downscale_period,
+                default_uptime,
+                default_downtime,
+                forced_uptime,
+                dry_run,
+                now,
+                grace_period,
+                downtime_replicas,
+                deployment_time_annotation,
+                namespaces,
+                namespace_defaults,
+                time_specs,
+                updater,
+                decision_cache,
+                shard_index,
+                shard_count,
+                schedule_groups,
+            )
+    finally:
+        for task in (forced_uptime_task, namespaces_task):
+            task.cancel()
+        for target_prefetchers in prefetchers.values():
+            for prefetcher in target_prefetchers:
+                prefetcher.close()
+        with metrics.PHASE_DURATION.time(phase="updates", kind=""):
+            await updater.wait()
+
+    metrics.CYCLE_DURATION.observe(time.monotonic() - start)
+    metrics.LAST_SUCCESSFUL_CYCLE.set(time.time())
+    next_transition = get_next_transition(now, time_specs)
+    if decision_cache:
+        decision_cache.end_cycle(next_transition)
+    return next_transition
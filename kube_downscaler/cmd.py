@@ -1,6 +1,13 @@
 import argparse
 import os
 
+from kube_downscaler import helper
+from kube_downscaler.events import CORE_EVENTS_API
+from kube_downscaler.events import EVENTS_APIS
+from kube_downscaler.leader import LEASE_NAME
+from kube_downscaler.ratelimit import DEFAULT_BURST
+from kube_downscaler.scaler import DEFAULT_DECISION_CACHE_SIZE
+
 VALID_RESOURCES = frozenset(
     ["deployments", "statefulsets", "stacks", "cronjobs", "horizontalpodautoscalers"]
 )
@@ -33,7 +40,16 @@ def get_parser():
     parser.add_argument(
         "--interval", type=int, help="Loop interval (default: 30s)", default=30
     )
-    parser.add_argument("--namespace", help="Namespace")
+    namespace_group = parser.add_mutually_exclusive_group(required=False)
+    namespace_group.add_argument(
+        "--namespace",
+        help="Only downscale resources in these namespaces, comma-separated list (default: all namespaces)",
+    )
+    namespace_group.add_argument(
+        "--namespace-selector",
+        help="Only downscale resources in namespaces matching this label selector, e.g. 'team=foo'",
+        default=os.getenv("NAMESPACE_SELECTOR"),
+    )
     parser.add_argument(
         "--include-resources",
         type=check_include_resources,
@@ -76,6 +92,11 @@ def get_parser():
         help="Exclude specific deployments from downscaling (default: kube-downscaler,downscaler)",
         default=os.getenv("EXCLUDE_DEPLOYMENTS", "kube-downscaler,downscaler"),
     )
+    parser.add_argument(
+        "--label-selector",
+        help="Only manage resources matching this label selector, e.g. 'downscaler/enabled=true' (opt-in) or 'downscaler/exclude!=true' (opt-out)",
+        default=os.getenv("LABEL_SELECTOR"),
+    )
     parser.add_argument(
         "--downtime-replicas",
         type=int,
@@ -91,4 +112,90 @@ def get_parser():
         help="Emit Kubernetes events for scale up/down",
         action="store_true",
     )
+    parser.add_argument(
+        "--events-api",
+        choices=EVENTS_APIS,
+        help=f"API version of the emitted events, {EVENTS_APIS[1]} records repeated events as series (default: {CORE_EVENTS_API})",
+        default=os.getenv("EVENTS_API", CORE_EVENTS_API),
+    )
+    parser.add_argument(
+        "--informer",
+        help="Keep resources in a local cache (one LIST, then WATCH) instead of listing all resources in every loop iteration",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--leader-election",
+        help="Run multiple replicas, only the replica holding a Lease is scaling (use with --informer to keep a warm cache on standby replicas)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--leader-election-namespace",
+        help="Namespace of the leader election Lease (default: the namespace kube-downscaler is running in)",
+        default=os.getenv("LEADER_ELECTION_NAMESPACE"),
+    )
+    parser.add_argument(
+        "--leader-election-lease-name",
+        help=f"Name of the leader election Lease (default: {LEASE_NAME})",
+        default=os.getenv("LEADER_ELECTION_LEASE_NAME", LEASE_NAME),
+    )
+    parser.add_argument(
+        "--shard-count",
+        type=int,
+        help="Split the namespaces into this many shards (by consistent hash of the namespace name), each handled by other replicas (default: 1)",
+        default=int(os.getenv("SHARD_COUNT", 1)),
+    )
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        help="Only downscale the namespaces of this shard, from 0 to --shard-count - 1 (default: 0)",
+        default=int(os.getenv("SHARD_INDEX", 0)),
+    )
+    parser.add_argument(
+        "--max-concurrent-updates",
+        type=int,
+        help="Maximum number of resource updates sent to the Kubernetes API in parallel (default: 1)",
+        default=int(os.getenv("MAX_CONCURRENT_UPDATES", 1)),
+    )
+    parser.add_argument(
+        "--write-qps",
+        type=float,
+        help="Maximum number of write requests (updates and events) per second, scale-ups are sent first, 0 for no limit (default: 0)",
+        default=float(os.getenv("WRITE_QPS", 0)),
+    )
+    parser.add_argument(
+        "--write-burst",
+        type=int,
+        help=f"Maximum number of write requests sent at once when rate limited by --write-qps (default: {DEFAULT_BURST})",
+        default=int(os.getenv("WRITE_BURST", DEFAULT_BURST)),
+    )
+    parser.add_argument(
+        "--list-page-size",
+        type=int,
+        help="Maximum number of objects per LIST response (limit/continue), 0 to list all objects at once (default: 500)",
+        default=int(os.getenv("LIST_PAGE_SIZE", helper.DEFAULT_PAGE_SIZE)),
+    )
+    parser.add_argument(
+        "--decision-cache-size",
+        type=int,
+        help=f"Maximum number of resources to remember the last decision for (skips unchanged resources until a time spec changes), 0 to disable (default: {DEFAULT_DECISION_CACHE_SIZE})",
+        default=int(os.getenv("DECISION_CACHE_SIZE", DEFAULT_DECISION_CACHE_SIZE)),
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["sync", "async"],
+        help="Scaling engine: sync (pykube and threads) or async (asyncio and aiohttp, install the 'async' extra, supports token, basic and client certificate auth only) (default: sync)",
+        default=os.getenv("ENGINE", "sync"),
+    )
+    parser.add_argument(
+        "--record",
+        metavar="FILE",
+        help="Record the Kubernetes API requests and responses of the first loop iteration to this gzipped file for replaying them offline (secrets are redacted)",
+        default=os.getenv("RECORD"),
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on this port (path /metrics), disabled by default",
+        default=int(os.getenv("METRICS_PORT", 0)),
+    )
     return parser
@@ -0,0 +1,259 @@
+import datetime
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import pykube
+from pykube.exceptions import HTTPError
+
+from kube_downscaler import helper
+from kube_downscaler import ratelimit
+from kube_downscaler.ratelimit import PRIORITY_EVENT
+from kube_downscaler.resources.event import Event as EventV1
+
+logger = logging.getLogger(__name__)
+
+CORE_EVENTS_API = "v1"
+EVENTS_API = "events.k8s.io/v1"
+EVENTS_APIS = [CORE_EVENTS_API, EVENTS_API]
+
+# the API server deletes events after one hour by default (--event-ttl), do not try to update older ones
+EVENT_CACHE_TTL_SECONDS = 50 * 60
+EVENT_CACHE_SIZE = 10000
+
+MICRO_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+# the pod name when running in-cluster
+REPORTING_INSTANCE = os.getenv("HOSTNAME") or socket.gethostname()
+
+
+class QueuedEvent(NamedTuple):
+    involved_object: dict
+    message: str
+    reason: str
+    event_type: str
+    now: datetime.datetime
+
+    @property
+    def key(self) -> Tuple[str, str, str, str]:
+        return (
+            self.involved_object["namespace"],
+            self.involved_object["uid"],
+            self.reason,
+            self.event_type,
+        )
+
+
+class CachedEvent(NamedTuple):
+    name: str
+    message: str
+    count: int
+    # time.monotonic() when the event was created
+    created: float
+
+
+def get_event_v1_body(event: QueuedEvent, count: int) -> dict:
+    """Return an events.k8s.io/v1 Event, repeated occurrences are recorded as series."""
+    body = {
+        "metadata": {
+            "namespace": event.involved_object["namespace"],
+            "generateName": "kube-downscaler-",
+        },
+        "eventTime": event.now.strftime(MICRO_TIME_FORMAT),
+        "reportingController": "kube-downscaler",
+        "reportingInstance": REPORTING_INSTANCE,
+        "action": event.reason,
+        "reason": event.reason,
+        "regarding": event.involved_object,
+        "note": event.message,
+        "type": event.event_type,
+    }
+    if count > 1:
+        body["series"] = get_series(event, count)
+    return body
+
+
+def get_series(event: QueuedEvent, count: int) -> dict:
+    return {"count": count, "lastObservedTime": event.now.strftime(MICRO_TIME_FORMAT)}
+
+
+def aggregate(events: List[QueuedEvent]) -> List[Tuple[QueuedEvent, int]]:
+    """Merge identical events (same object, reason, type and message) into one with a count, keeping the order."""
+    counts: Dict[tuple, Tuple[QueuedEvent, int]] = {}
+    for event in events:
+        key = event.key + (event.message,)
+        _, count = counts.get(key, (event, 0))
+        # keep the timestamp of the last occurrence
+        counts[key] = (event, count + 1)
+    return list(counts.values())
+
+
+def get_create_body(event: QueuedEvent, count: int, events_api: str) -> dict:
+    if events_api == EVENTS_API:
+        return get_event_v1_body(event, count)
+    return helper.get_event_body(
+        event.involved_object,
+        event.message,
+        event.reason,
+        event.event_type,
+        event.now,
+        count,
+    )
+
+
+def get_update_patch(event: QueuedEvent, count: int, events_api: str) -> dict:
+    if events_api == EVENTS_API:
+        return {"series": get_series(event, count)}
+    return {"count": count, "lastTimestamp": event.now.strftime("%Y-%m-%dT%H:%M:%SZ")}
+
+
+class EventCache:
+
+    """Events created by us by (namespace, involved object uid, reason, type), the least recently used ones are dropped."""
+
+    def __init__(
+        self, size: int = EVENT_CACHE_SIZE, ttl: float = EVENT_CACHE_TTL_SECONDS
+    ):
+        self.size = size
+        self.ttl = ttl
+        self._events: "OrderedDict[Tuple[str, str, str, str], CachedEvent]"
+        self._events = OrderedDict()
+
+    def get(self, event: QueuedEvent) -> Optional[CachedEvent]:
+        """Return the event to update, i.e. the same message was created by us recently."""
+        cached = self._events.get(event.key)
+        if (
+            cached
+            and cached.message == event.message
+            and time.monotonic() - cached.created < self.ttl
+        ):
+            return cached
+        return None
+
+    def created(self, event: QueuedEvent, name: str, count: int):
+        self._put(event, CachedEvent(name, event.message, count, time.monotonic()))
+
+    def updated(self, event: QueuedEvent, cached: CachedEvent, count: int):
+        self._put(event, cached._replace(count=count))
+
+    def _put(self, event: QueuedEvent, cached: CachedEvent):
+        self._events[event.key] = cached
+        self._events.move_to_end(event.key)
+        while len(self._events) > self.size:
+            self._events.popitem(last=False)
+
+
+_STOP = object()
+
+
+class EventEmitter:
+
+    """Send events from a background thread, repeated events update the ones created before (without listing events)."""
+
+    def __init__(
+        self,
+        api,
+        events_api: str = CORE_EVENTS_API,
+        cache_size: int = EVENT_CACHE_SIZE,
+        cache_ttl: float = EVENT_CACHE_TTL_SECONDS,
+    ):
+        self.api = api
+        self.events_api = events_api
+        self._queue: queue.Queue = queue.Queue()
+        self._cache = EventCache(cache_size, cache_ttl)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name="event-emitter", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Send all queued events and stop the background thread."""
+        self._queue.put(_STOP)
+        if self._thread:
+            self._thread.join(timeout)
+
+    def flush(self):
+        """Wait until all queued events were sent."""
+        self._queue.join()
+
+    def emit(self, resource, message: str, reason: str, event_type: str):
+        self._queue.put(
+            QueuedEvent(
+                helper.get_involved_object(resource),
+                message,
+                reason,
+                event_type,
+                datetime.datetime.utcnow(),
+            )
+        )
+
+    def run(self):
+        # events are sent after all waiting updates (if rate limited)
+        with ratelimit.priority(PRIORITY_EVENT):
+            self._run()
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            batch = [self._queue.get()]
+            # everything queued in the meantime is sent together, repeated events only once
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            events = [event for event in batch if event is not _STOP]
+            stopped = len(events) < len(batch)
+            try:
+                for event, count in aggregate(events):
+                    try:
+                        self.send(event, count)
+                    except Exception as e:
+                        logger.error(
+                            f"Could not send event for {event.involved_object['namespace']}/{event.involved_object['name']}: {e}"
+                        )
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def send(self, event: QueuedEvent, count: int = 1):
+        cached = self._cache.get(event)
+        if cached:
+            try:
+                self.update(event, cached.name, cached.count + count)
+            except HTTPError as e:
+                if e.code != 404:
+                    raise
+                # the event was deleted in the meantime, create a new one
+            else:
+                self._cache.updated(event, cached, cached.count + count)
+                return
+        self._cache.created(event, self.create(event, count), count)
+
+    def create(self, event: QueuedEvent, count: int) -> str:
+        body = get_create_body(event, count, self.events_api)
+        if self.events_api == EVENTS_API:
+            obj = EventV1(self.api, body)
+        else:
+            obj = pykube.Event(self.api, body)
+        obj.create()
+        return obj.name
+
+    def update(self, event: QueuedEvent, name: str, count: int):
+        metadata = {"name": name, "namespace": event.involved_object["namespace"]}
+        clazz = EventV1 if self.events_api == EVENTS_API else pykube.Event
+        clazz(self.api, {"metadata": metadata}).patch(
+            get_update_patch(event, count, self.events_api)
+        )
@@ -1,13 +1,37 @@
 import datetime
+import functools
 import logging
+import os
+import queue
 import re
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Iterable
+from typing import Iterator
 from typing import Match
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
 
 import pykube
 import pytz
+from pykube.exceptions import HTTPError
+from pykube.http import KubernetesHTTPAdapter
+
+from kube_downscaler import metrics
+from kube_downscaler import ratelimit
+from kube_downscaler.ratelimit import RateLimiter
+from kube_downscaler.recording import Recorder
 
 logger = logging.getLogger(__name__)
 
+# bound service account tokens are rotated by the kubelet
+SERVICE_ACCOUNT_TOKEN_PATH = "/var/run/secrets/kubernetes.io/serviceaccount/token"
+DEFAULT_POOL_SIZE = 10
+# number of objects per LIST response (same default as kubectl)
+DEFAULT_PAGE_SIZE = 500
+
 WEEKDAYS = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
 
 TIME_SPEC_PATTERN = re.compile(
@@ -19,58 +43,347 @@ ABSOLUTE_TIME_SPEC_PATTERN = re.compile(
 )
 
 
-def matches_time_spec(time: datetime.datetime, spec: str):
+class RecurringTimeSpec(NamedTuple):
+    # bit 0 is Monday, bit 6 is Sunday
+    weekdays: int
+    minute_from: int
+    minute_to: int
+    tz: datetime.tzinfo
+
+
+class AbsoluteTimeSpec(NamedTuple):
+    time_from: datetime.datetime
+    time_to: datetime.datetime
+
+
+class TimeSpec(NamedTuple):
+    always: bool
+    recurring: Tuple[RecurringTimeSpec, ...]
+    absolute: Tuple[AbsoluteTimeSpec, ...]
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_time_spec(spec: str) -> TimeSpec:
+    """Parse the time spec string once into an immutable structure which is cheap to evaluate."""
     if spec.lower() == "always":
-        return True
+        return TimeSpec(always=True, recurring=(), absolute=())
     elif spec.lower() == "never":
-        return False
+        return TimeSpec(always=False, recurring=(), absolute=())
+    recurring = []
+    absolute = []
     for spec_ in spec.split(","):
         spec_ = spec_.strip()
         recurring_match = TIME_SPEC_PATTERN.match(spec_)
-        if recurring_match is not None and _matches_recurring_time_spec(
-            time, recurring_match
-        ):
-            return True
+        if recurring_match is not None:
+            recurring.append(_compile_recurring_time_spec(recurring_match))
+            continue
         absolute_match = ABSOLUTE_TIME_SPEC_PATTERN.match(spec_)
-        if absolute_match and _matches_absolute_time_spec(time, absolute_match):
-            return True
-        if not recurring_match and not absolute_match:
-            raise ValueError(
-                f'Time spec value "{spec_}" does not match format ("Mon-Fri 06:30-20:30 Europe/Berlin" or "2019-01-01T00:00:00+00:00-2019-01-02T12:34:56+00:00")'
-            )
-    return False
+        if absolute_match is not None:
+            absolute.append(_compile_absolute_time_spec(absolute_match))
+            continue
+        raise ValueError(
+            f'Time spec value "{spec_}" does not match format ("Mon-Fri 06:30-20:30 Europe/Berlin" or "2019-01-01T00:00:00+00:00-2019-01-02T12:34:56+00:00")'
+        )
+    return TimeSpec(always=False, recurring=tuple(recurring), absolute=tuple(absolute))
 
 
-def _matches_recurring_time_spec(time: datetime.datetime, match: Match):
-    tz = pytz.timezone(match.group("tz"))
-    local_time = tz.fromutc(time.replace(tzinfo=tz))
+def _compile_recurring_time_spec(match: Match) -> RecurringTimeSpec:
     day_from = WEEKDAYS.index(match.group(1).upper())
     day_to = WEEKDAYS.index(match.group(2).upper())
     if day_from > day_to:
         # wrap around, e.g. Sun-Fri (makes sense for countries with work week starting on Sunday)
-        day_matches = local_time.weekday() >= day_from or local_time.weekday() <= day_to
+        days = list(range(day_from, 7)) + list(range(0, day_to + 1))
     else:
         # e.g. Mon-Fri
-        day_matches = day_from <= local_time.weekday() <= day_to
+        days = list(range(day_from, day_to + 1))
+    return RecurringTimeSpec(
+        weekdays=sum(1 << day for day in days),
+        minute_from=int(match.group(3)) * 60 + int(match.group(4)),
+        minute_to=int(match.group(5)) * 60 + int(match.group(6)),
+        tz=get_timezone(match.group("tz")),
+    )
+
+
+def get_timezone(name: str) -> datetime.tzinfo:
+    try:
+        return pytz.timezone(name)
+    except pytz.UnknownTimeZoneError:
+        # same as any other invalid time spec (pytz raises a KeyError)
+        raise ValueError(f'Unknown time zone "{name}" in time spec')
+
+
+def _compile_absolute_time_spec(match: Match) -> AbsoluteTimeSpec:
+    return AbsoluteTimeSpec(
+        time_from=datetime.datetime.fromisoformat(match.group(1)),
+        time_to=datetime.datetime.fromisoformat(match.group(2)),
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def matches_time_spec(time: datetime.datetime, spec: str):
+    # results are memoized: the same few specs are evaluated for the same "now" in every loop iteration
+    return _matches_compiled_time_spec(time, compile_time_spec(spec))
+
+
+def _matches_compiled_time_spec(time: datetime.datetime, time_spec: TimeSpec):
+    if time_spec.always:
+        return True
+    for recurring in time_spec.recurring:
+        if _matches_recurring_time_spec(time, recurring):
+            return True
+    for absolute in time_spec.absolute:
+        if absolute.time_from <= time <= absolute.time_to:
+            return True
+    return False
+
+
+def get_next_time_spec_transition(
+    time: datetime.datetime, spec: str
+) -> Optional[datetime.datetime]:
+    """Return the next instant after the given time when the result of matches_time_spec changes (None if it never changes)."""
+    time_spec = compile_time_spec(spec)
+    current = _matches_compiled_time_spec(time, time_spec)
+    candidates = []
+    for recurring in time_spec.recurring:
+        local_date = time.astimezone(recurring.tz).date()
+        # the weekly schedule repeats after 7 days, one more day covers ranges ending at midnight
+        for days in range(-1, 8):
+            day = local_date + datetime.timedelta(days=days)
+            for minutes in (recurring.minute_from, recurring.minute_to):
+                local_time = datetime.datetime.combine(
+                    day, datetime.time()
+                ) + datetime.timedelta(minutes=minutes)
+                candidates.append(recurring.tz.localize(local_time))
+    for absolute in time_spec.absolute:
+        # the absolute range includes its end time
+        candidates.append(absolute.time_from)
+        candidates.append(absolute.time_to + datetime.timedelta(microseconds=1))
+    # recurring time specs are evaluated for UTC times, see _matches_recurring_time_spec
+    candidates = [
+        candidate.astimezone(datetime.timezone.utc) for candidate in candidates
+    ]
+    for candidate in sorted(c for c in candidates if c > time):
+        if _matches_compiled_time_spec(candidate, time_spec) != current:
+            return candidate
+    return None
+
+
+def _matches_recurring_time_spec(time: datetime.datetime, recurring: RecurringTimeSpec):
+    tz = recurring.tz
+    local_time = tz.fromutc(time.replace(tzinfo=tz))
+    if not (recurring.weekdays >> local_time.weekday()) & 1:
+        return False
     local_time_minutes = local_time.hour * 60 + local_time.minute
-    minute_from = int(match.group(3)) * 60 + int(match.group(4))
-    minute_to = int(match.group(5)) * 60 + int(match.group(6))
-    time_matches = minute_from <= local_time_minutes < minute_to
-    return day_matches and time_matches
+    return recurring.minute_from <= local_time_minutes < recurring.minute_to
+
+
+class RateLimitedHTTPAdapter(KubernetesHTTPAdapter):
 
+    """Send write requests through the (optional) rate limiter and retry after "429 Too Many Requests".
 
-def _matches_absolute_time_spec(time: datetime.datetime, match: Match):
-    time_from = datetime.datetime.fromisoformat(match.group(1))
-    time_to = datetime.datetime.fromisoformat(match.group(2))
-    return time_from <= time <= time_to
+    Requests and responses (except WATCH streams) are written to the recorder until it is closed.
+    """
 
+    def __init__(
+        self,
+        kube_config,
+        rate_limiter: Optional[RateLimiter] = None,
+        recorder: Optional[Recorder] = None,
+        **kwargs,
+    ):
+        super().__init__(kube_config, **kwargs)
+        self.rate_limiter = rate_limiter
+        self.recorder = recorder
 
-def get_kube_api():
+    def _do_send(self, request, **kwargs):
+        retries = 0
+        # e.g. the Lease renewal must not wait for throttled updates
+        exempt = ratelimit.is_exempt(request.path_url)
+        while True:
+            if (
+                self.rate_limiter
+                and not exempt
+                and request.method in ratelimit.WRITE_METHODS
+            ):
+                self.rate_limiter.acquire()
+            response = super()._do_send(request, **kwargs)
+            if self.recorder and not self.recorder.closed and not kwargs.get("stream"):
+                self.recorder.record(
+                    request.method,
+                    request.path_url,
+                    request.body,
+                    response.status_code,
+                    response.headers,
+                    response.content,
+                )
+            if (
+                response.status_code != 429
+                or exempt
+                or retries >= ratelimit.MAX_RETRIES
+            ):
+                return response
+            retries += 1
+            seconds = ratelimit.get_retry_after(response.headers)
+            logger.warning(
+                f"{request.method} {request.path_url} was throttled by the API server, retrying in {seconds}s"
+            )
+            response.close()
+            if self.rate_limiter:
+                # all other writes wait as well
+                self.rate_limiter.pause(seconds)
+            time.sleep(seconds)
+
+
+def get_kube_api(
+    pool_size: int = DEFAULT_POOL_SIZE,
+    rate_limiter: Optional[RateLimiter] = None,
+    recorder: Optional[Recorder] = None,
+):
     config = pykube.KubeConfig.from_env()
-    api = pykube.HTTPClient(config)
+    # keep enough connections open for concurrent requests (e.g. updates and watches)
+    http_adapter = RateLimitedHTTPAdapter(
+        config,
+        rate_limiter,
+        recorder,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+    )
+    api = pykube.HTTPClient(config, http_adapter=http_adapter)
+    metrics.instrument_session(api.session)
     return api
 
 
+def get_service_account_token_mtime() -> Optional[float]:
+    """Return the modification time of the service account token (None if not running in-cluster)."""
+    try:
+        return os.stat(SERVICE_ACCOUNT_TOKEN_PATH).st_mtime
+    except OSError:
+        return None
+
+
+def get_connection_count(api) -> int:
+    """Return the number of connections (i.e. TLS handshakes) opened by the API client so far."""
+    count = 0
+    for adapter in set(api.session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                count += pool.num_connections
+    return count
+
+
+def list_pages(
+    api,
+    kind,
+    namespace: Optional[str] = None,
+    params: Optional[dict] = None,
+    headers: Optional[dict] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> Iterator[dict]:
+    """Yield the LIST response chunks one by one (using limit/continue), page_size 0 lists everything at once."""
+    kwargs = {"url": kind.endpoint, "version": kind.version}
+    if kind.base:
+        kwargs["base"] = kind.base
+    if namespace:
+        kwargs["namespace"] = namespace
+    if headers:
+        kwargs["headers"] = headers
+    params = dict(params or {})
+    if page_size:
+        params["limit"] = page_size
+    token = None
+    while True:
+        response = api.get(
+            params={**params, "continue": token} if token else params, **kwargs
+        )
+        try:
+            api.raise_for_status(response)
+        except HTTPError as e:
+            if e.code != 410 or not token:
+                raise
+            # the continue token expired (etcd compaction), the API server tells us where to resume
+            # without a consistent snapshot, objects changed in the meantime might be missing or duplicated
+            token = (response.json().get("metadata") or {}).get("continue")
+            if not token:
+                raise
+            logger.warning(
+                f"Continue token for {kind.endpoint} expired, resuming with inconsistent list"
+            )
+            continue
+        data = response.json()
+        yield data
+        token = (data.get("metadata") or {}).get("continue")
+        if not token:
+            break
+
+
+def list_objects(
+    api,
+    kind,
+    namespace: Optional[str] = None,
+    params: Optional[dict] = None,
+    headers: Optional[dict] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> Iterator[dict]:
+    """Yield the raw objects of a (paginated) LIST, only one page is kept in memory at a time."""
+    for page in list_pages(api, kind, namespace, params, headers, page_size):
+        yield from page.get("items") or []
+
+
+_DONE = object()
+
+
+class Prefetcher:
+    """Consume an iterable (e.g. LIST pages) in a background thread while the caller processes the previous items."""
+
+    def __init__(self, iterable: Iterable, executor: Executor, maxsize: int = 1):
+        # a small buffer keeps memory bounded if the caller is slower than the API server
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._stopped = threading.Event()
+        self._future = executor.submit(self._run, iterable)
+
+    def _put(self, item) -> bool:
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, iterable: Iterable):
+        if self._stopped.is_set():
+            # closed before the executor started it, e.g. the cancellation came too late
+            return
+        try:
+            for item in iterable:
+                if not self._put((item, None)):
+                    return
+        except Exception as e:
+            self._put((None, e))
+        else:
+            self._put(_DONE)
+
+    def __iter__(self):
+        while True:
+            entry = self._queue.get()
+            if entry is _DONE:
+                return
+            item, error = entry
+            if error is not None:
+                raise error
+            yield item
+
+    def close(self):
+        """Stop fetching, e.g. because the caller failed and will not consume the remaining items.
+
+        If the executor did not start fetching yet, nothing is fetched at all.
+        """
+        self._stopped.set()
+        self._future.cancel()
+
+
 def add_event(resource, message: str, reason: str, event_type: str, dry_run: bool):
     event = (
         pykube.objects.Event.objects(resource.api)
@@ -99,33 +412,49 @@ def add_event(resource, message: str, reason: str, event_type: str, dry_run: boo
     return create_event(resource, message, reason, event_type, dry_run)
 
 
-def create_event(resource, message: str, reason: str, event_type: str, dry_run: bool):
-    now = datetime.datetime.utcnow()
+def get_involved_object(resource) -> dict:
+    return {
+        "apiVersion": resource.version,
+        "name": resource.name,
+        "namespace": resource.namespace,
+        "kind": resource.kind,
+        "resourceVersion": resource.metadata.get("resourceVersion"),
+        # https://kubernetes.io/docs/concepts/overview/working-with-objects/names/#uids
+        "uid": resource.metadata.get("uid"),
+    }
+
+
+def get_event_body(
+    involved_object: dict,
+    message: str,
+    reason: str,
+    event_type: str,
+    now: Optional[datetime.datetime] = None,
+    count: int = 1,
+) -> dict:
+    if now is None:
+        now = datetime.datetime.utcnow()
     timestamp = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return {
+        "metadata": {
+            "namespace": involved_object["namespace"],
+            "generateName": "kube-downscaler-",
+        },
+        "type": event_type,
+        "count": count,
+        "firstTimestamp": timestamp,
+        "lastTimestamp": timestamp,
+        "reason": reason,
+        "involvedObject": involved_object,
+        "message": message,
+        "source": {"component": "kube-downscaler"},
+    }
+
+
+def create_event(resource, message: str, reason: str, event_type: str, dry_run: bool):
     event = pykube.Event(
         resource.api,
-        {
-            "metadata": {
-                "namespace": resource.namespace,
-                "generateName": "kube-downscaler-",
-            },
-            "type": event_type,
-            "count": 1,
-            "firstTimestamp": timestamp,
-            "lastTimestamp": timestamp,
-            "reason": reason,
-            "involvedObject": {
-                "apiVersion": resource.version,
-                "name": resource.name,
-                "namespace": resource.namespace,
-                "kind": resource.kind,
-                "resourceVersion": resource.metadata.get("resourceVersion"),
-                # https://kubernetes.io/docs/concepts/overview/working-with-objects/names/#uids
-                "uid": resource.metadata.get("uid"),
-            },
-            "message": message,
-            "source": {"component": "kube-downscaler"},
-        },
+        get_event_body(get_involved_object(resource), message, reason, event_type),
     )
     if not dry_run:
         try:
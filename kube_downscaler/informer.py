@@ -0,0 +1,275 @@
+import copy
+import json
+import logging
+import threading
+import time
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import requests
+from pykube.exceptions import HTTPError
+from pykube.objects import APIObject
+
+from kube_downscaler import helper
+
+logger = logging.getLogger(__name__)
+
+# the API server closes the WATCH after this timeout, we then resume from the last resourceVersion
+WATCH_TIMEOUT_SECONDS = 300
+# client-side read timeout for the WATCH stream, must be larger than the server-side timeout
+WATCH_READ_TIMEOUT_SECONDS = WATCH_TIMEOUT_SECONDS + 30
+RETRY_DELAY_SECONDS = 5
+
+# only transfer object metadata, older API servers will fall back to full JSON objects
+PARTIAL_OBJECT_METADATA_LIST = (
+    "application/json;as=PartialObjectMetadataList;v=v1;g=meta.k8s.io,application/json"
+)
+PARTIAL_OBJECT_METADATA = (
+    "application/json;as=PartialObjectMetadata;v=v1;g=meta.k8s.io,application/json"
+)
+
+
+def is_gone(e: Exception) -> bool:
+    """Return True if the exception is a "410 Gone" error, i.e. our resourceVersion is too old."""
+    if isinstance(e, HTTPError):
+        return e.code == 410
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code == 410
+    return False
+
+
+def get_key(obj: dict) -> Tuple[str, str]:
+    metadata = obj["metadata"]
+    return (metadata.get("namespace", ""), metadata["name"])
+
+
+def is_relevant_change(old: Optional[dict], new: Optional[dict]) -> bool:
+    """Return True if the change could affect scaling, i.e. ignore status-only updates."""
+    if old is None or new is None:
+        return old is not new
+    return old["metadata"].get("annotations") != new["metadata"].get(
+        "annotations"
+    ) or old.get("spec") != new.get("spec")
+
+
+class Informer:
+
+    """Keep an in-memory store of Kubernetes objects up-to-date with one initial LIST and a WATCH stream."""
+
+    def __init__(
+        self,
+        api,
+        kind,
+        namespace: Optional[str] = None,
+        params: Optional[dict] = None,
+        metadata_only: bool = False,
+        predicate: Optional[Callable[[dict], bool]] = None,
+        changed: Optional[threading.Event] = None,
+        page_size: int = helper.DEFAULT_PAGE_SIZE,
+        on_delete: Optional[Callable[[dict], None]] = None,
+        transform: Optional[Callable[[dict], dict]] = None,
+    ):
+        self.api = api
+        self.kind = kind
+        self.namespace = namespace
+        # additional query parameters for LIST and WATCH, e.g. a fieldSelector
+        self.params = params or {}
+        self.metadata_only = metadata_only
+        # only objects matching the predicate are kept in the store
+        self.predicate = predicate
+        # set whenever a relevant change was observed, e.g. to wake up the main loop
+        self.changed = changed
+        self.page_size = page_size
+        # called with the last known state of every deleted object
+        self.on_delete = on_delete
+        # applied to every object before it is stored, e.g. to drop all fields which are never read
+        self.transform = transform
+        self.resource_version: Optional[str] = None
+        self._store: Dict[Tuple[str, str], dict] = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __repr__(self):
+        return f"<Informer for {self.kind.endpoint} in {self.namespace or 'all namespaces'}>"
+
+    @property
+    def synced(self) -> bool:
+        return self._synced.is_set()
+
+    def _request_kwargs(self, params: dict, accept: str) -> dict:
+        kwargs = {
+            "url": self.kind.endpoint,
+            "version": self.kind.version,
+            "params": {**self.params, **params},
+        }
+        if self.namespace:
+            kwargs["namespace"] = self.namespace
+        if self.metadata_only:
+            kwargs["headers"] = {"Accept": accept}
+        return kwargs
+
+    def _matches(self, obj: dict) -> bool:
+        return self.predicate is None or self.predicate(obj)
+
+    def _transform(self, obj: dict) -> dict:
+        return obj if self.transform is None else self.transform(obj)
+
+    def relist(self):
+        """Replace the store with the result of a full (paginated) LIST and remember its resourceVersion."""
+        store = {}
+        for page in helper.list_pages(
+            self.api,
+            self.kind,
+            self.namespace,
+            self.params,
+            {"Accept": PARTIAL_OBJECT_METADATA_LIST} if self.metadata_only else None,
+            self.page_size,
+        ):
+            for obj in page.get("items") or []:
+                if self._matches(obj):
+                    store[get_key(obj)] = self._transform(obj)
+            # all pages of a consistent LIST share the resourceVersion, use the last one otherwise
+            resource_version = page["metadata"]["resourceVersion"]
+        with self._lock:
+            self._store = store
+            self.resource_version = resource_version
+        self._synced.set()
+        self._notify()
+        logger.debug(f"Listed {len(store)} {self.kind.endpoint}")
+
+    def handle_event(self, event_type: str, obj: dict):
+        if event_type == "ERROR":
+            # the API server sends a Status object, e.g. code 410 if our resourceVersion expired
+            raise HTTPError(obj.get("code"), obj.get("message"))
+        self.resource_version = obj["metadata"]["resourceVersion"]
+        if event_type == "BOOKMARK":
+            return
+        key = get_key(obj)
+        with self._lock:
+            if event_type == "DELETED" or not self._matches(obj):
+                old = self._store.pop(key, None)
+                new = None
+            else:
+                old = self._store.get(key)
+                new = self._store[key] = self._transform(obj)
+        if event_type == "DELETED" and self.on_delete is not None:
+            self.on_delete(obj)
+        if is_relevant_change(old, new):
+            self._notify()
+
+    def _notify(self):
+        if self.changed is not None:
+            self.changed.set()
+
+    def watch(self):
+        """Apply WATCH events to the store until the API server closes the stream."""
+        params = {
+            "watch": "true",
+            "resourceVersion": self.resource_version,
+            "allowWatchBookmarks": "true",
+            "timeoutSeconds": WATCH_TIMEOUT_SECONDS,
+        }
+        response = self.api.get(
+            stream=True,
+            timeout=(self.api.timeout, WATCH_READ_TIMEOUT_SECONDS),
+            **self._request_kwargs(params, PARTIAL_OBJECT_METADATA),
+        )
+        self.api.raise_for_status(response)
+        try:
+            for line in response.iter_lines():
+                if self._stopped.is_set():
+                    break
+                if not line:
+                    continue
+                event = json.loads(line)
+                self.handle_event(event["type"], event["object"])
+        finally:
+            response.close()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                if self.resource_version is None:
+                    self.relist()
+                self.watch()
+            except Exception as e:
+                if is_gone(e):
+                    logger.info(
+                        f"resourceVersion {self.resource_version} for {self.kind.endpoint} is too old, relisting.."
+                    )
+                    self.resource_version = None
+                else:
+                    logger.exception(f"Failed to watch {self.kind.endpoint}: {e}")
+                    self._stopped.wait(RETRY_DELAY_SECONDS)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name=f"informer-{self.kind.endpoint}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def wait_for_sync(self, timeout: Optional[float] = None) -> bool:
+        return self._synced.wait(timeout)
+
+    def list(self) -> List[APIObject]:
+        """Return copies of all cached objects, callers are free to modify them."""
+        if not self.synced:
+            raise RuntimeError(f"{self} has not synced yet")
+        with self._lock:
+            objs = [obj for _, obj in sorted(self._store.items())]
+        return [self.kind(self.api, copy.deepcopy(obj)) for obj in objs]
+
+
+class InformerGroup:
+
+    """Informers for the same kind in several namespaces, listed together like a single (cluster-wide) informer."""
+
+    def __init__(self, informers: List[Informer]):
+        self.informers = sorted(informers, key=lambda informer: informer.namespace)
+
+    def __repr__(self):
+        namespaces = ",".join(informer.namespace for informer in self.informers)
+        return f"<InformerGroup for {self.informers[0].kind.endpoint} in {namespaces}>"
+
+    @property
+    def api(self):
+        return self.informers[0].api
+
+    @api.setter
+    def api(self, api):
+        for informer in self.informers:
+            informer.api = api
+
+    @property
+    def synced(self) -> bool:
+        return all(informer.synced for informer in self.informers)
+
+    def start(self):
+        for informer in self.informers:
+            informer.start()
+
+    def stop(self):
+        for informer in self.informers:
+            informer.stop()
+
+    def wait_for_sync(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for informer in self.informers:
+            remaining = (
+                None if deadline is None else max(0, deadline - time.monotonic())
+            )
+            if not informer.wait_for_sync(remaining):
+                return False
+        return True
+
+    def list(self) -> List[APIObject]:
+        """Return copies of the objects of all namespaces, ordered by namespace and name."""
+        return [obj for informer in self.informers for obj in informer.list()]
@@ -0,0 +1,224 @@
+import datetime
+import logging
+import threading
+import time
+import uuid
+from typing import Callable
+from typing import Optional
+
+from pykube.exceptions import HTTPError
+from pykube.exceptions import ObjectDoesNotExist
+
+from kube_downscaler.events import MICRO_TIME_FORMAT
+from kube_downscaler.events import REPORTING_INSTANCE
+from kube_downscaler.resources.lease import Lease
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "kube-downscaler"
+# same defaults as the Kubernetes controllers (client-go leaderelection)
+LEASE_DURATION_SECONDS = 15
+RENEW_DEADLINE_SECONDS = 10
+RETRY_PERIOD_SECONDS = 2
+
+SERVICE_ACCOUNT_NAMESPACE_PATH = (
+    "/var/run/secrets/kubernetes.io/serviceaccount/namespace"
+)
+
+
+class LeadershipLost(Exception):
+
+    """Abort the loop iteration before the next write, another replica might already be the leader."""
+
+
+def check_leadership(is_leader: Optional[Callable[[], bool]]):
+    """Raise LeadershipLost if we are not the leader (anymore), without leader election every replica is the leader."""
+    if is_leader is not None and not is_leader():
+        raise LeadershipLost("Lost the leadership, not sending any further updates")
+
+
+def get_default_namespace() -> str:
+    """Return the namespace we are running in (or "default" when running outside of the cluster)."""
+    try:
+        with open(SERVICE_ACCOUNT_NAMESPACE_PATH) as fd:
+            return fd.read().strip()
+    except OSError:
+        return "default"
+
+
+class LeaderElector:
+
+    """Acquire and renew a Lease in a background thread, only the replica holding the Lease is the leader."""
+
+    def __init__(
+        self,
+        api,
+        namespace: str,
+        name: str = LEASE_NAME,
+        identity: Optional[str] = None,
+        lease_duration: int = LEASE_DURATION_SECONDS,
+        renew_deadline: float = RENEW_DEADLINE_SECONDS,
+        retry_period: float = RETRY_PERIOD_SECONDS,
+        changed: Optional[threading.Event] = None,
+    ):
+        self.api = api
+        self.namespace = namespace
+        self.name = name
+        self.identity = identity or f"{REPORTING_INSTANCE}_{uuid.uuid4().hex[:8]}"
+        self.lease_duration = lease_duration
+        self.renew_deadline = renew_deadline
+        self.retry_period = retry_period
+        # set when we became the leader, e.g. to wake up the main loop
+        self.changed = changed
+        # the other replica's lease expires relative to when *we* saw it change (no clock skew)
+        self._observed_spec: Optional[dict] = None
+        self._observed_time = 0.0
+        # time.monotonic() of our last successful acquire or renew
+        self._renewed: Optional[float] = None
+        self._leading = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __repr__(self):
+        return f"<LeaderElector {self.identity} for Lease {self.namespace}/{self.name}>"
+
+    @property
+    def is_leader(self) -> bool:
+        # stop acting as leader if the lease was not renewed in time, another replica will take over soon
+        return (
+            self._renewed is not None
+            and time.monotonic() - self._renewed < self.renew_deadline
+        )
+
+    def wait_for_leadership(self, timeout: Optional[float] = None) -> bool:
+        if self._leading.is_set() and not self.is_leader:
+            # the renew deadline passed, but the elector thread did not notice yet (e.g. a Lease request hangs),
+            # i.e. waiting for _leading would return right away
+            seconds = (
+                self.retry_period
+                if timeout is None
+                else min(timeout, self.retry_period)
+            )
+            self._stopped.wait(seconds)
+            return self.is_leader
+        return self._leading.wait(timeout) and self.is_leader
+
+    def get_lease(self) -> Optional[Lease]:
+        try:
+            return Lease.objects(self.api, namespace=self.namespace).get_by_name(
+                self.name
+            )
+        except ObjectDoesNotExist:
+            return None
+
+    def try_acquire_or_renew(self) -> bool:
+        """Return True if we hold the Lease (again), the Lease update fails with a conflict if another replica was faster."""
+        now = datetime.datetime.utcnow().strftime(MICRO_TIME_FORMAT)
+        spec = {
+            "holderIdentity": self.identity,
+            "leaseDurationSeconds": self.lease_duration,
+            "acquireTime": now,
+            "renewTime": now,
+            "leaseTransitions": 0,
+        }
+        lease = self.get_lease()
+        if lease is None:
+            lease = Lease(
+                self.api,
+                {
+                    "metadata": {"name": self.name, "namespace": self.namespace},
+                    "spec": spec,
+                },
+            )
+            return self._write(lease.create)
+
+        observed = lease.obj.get("spec") or {}
+        if observed != self._observed_spec:
+            self._observed_spec = observed
+            self._observed_time = time.monotonic()
+        holder = observed.get("holderIdentity")
+        if holder == self.identity:
+            spec["acquireTime"] = observed.get("acquireTime", now)
+            spec["leaseTransitions"] = observed.get("leaseTransitions", 0)
+        else:
+            duration = observed.get("leaseDurationSeconds") or self.lease_duration
+            if holder and time.monotonic() - self._observed_time < duration:
+                # the other replica is still the leader
+                return False
+            spec["leaseTransitions"] = observed.get("leaseTransitions", 0) + 1
+        # the resourceVersion makes the update fail if the Lease changed in the meantime
+        return self._write(
+            lambda: lease.patch(
+                {
+                    "metadata": {"resourceVersion": lease.metadata["resourceVersion"]},
+                    "spec": spec,
+                }
+            )
+        )
+
+    def _write(self, func) -> bool:
+        try:
+            func()
+        except HTTPError as e:
+            if e.code != 409:
+                raise
+            logger.debug(f"Conflict while updating Lease {self.namespace}/{self.name}")
+            return False
+        return True
+
+    def release(self):
+        """Give up the Lease (if we hold it), i.e. another replica can take over without waiting for the Lease to expire."""
+        if self._renewed is None:
+            # we never held the Lease
+            return
+        self._renewed = None
+        self._leading.clear()
+        lease = self.get_lease()
+        if (
+            lease
+            and (lease.obj.get("spec") or {}).get("holderIdentity") == self.identity
+        ):
+            lease.patch(
+                {
+                    "metadata": {"resourceVersion": lease.metadata["resourceVersion"]},
+                    "spec": {"holderIdentity": None, "leaseDurationSeconds": 1},
+                }
+            )
+            logger.info(f"Released Lease {self.namespace}/{self.name}")
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                acquired = self.try_acquire_or_renew()
+            except Exception as e:
+                logger.error(
+                    f"Failed to acquire or renew Lease {self.namespace}/{self.name}: {e}"
+                )
+                acquired = False
+            if acquired:
+                self._renewed = time.monotonic()
+                if not self._leading.is_set():
+                    logger.info(f"{self.identity} is now the leader")
+                    self._leading.set()
+                    if self.changed is not None:
+                        self.changed.set()
+            elif self._leading.is_set() and not self.is_leader:
+                logger.warning(f"{self.identity} lost the leadership")
+                self._leading.clear()
+            self._stopped.wait(self.retry_period)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name="leader-elector", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop renewing and release the Lease."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        try:
+            self.release()
+        except Exception as e:
+            logger.error(f"Failed to release Lease {self.namespace}/{self.name}: {e}")
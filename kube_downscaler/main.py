@@ -1,19 +1,58 @@
 #!/usr/bin/env python3
+import asyncio
+import datetime
+import functools
 import logging
 import re
+import threading
 import time
+from typing import Optional
+
+from pykube import Namespace
+from pykube import Pod
 
 from kube_downscaler import __version__
 from kube_downscaler import cmd
+from kube_downscaler import helper
+from kube_downscaler import metrics
 from kube_downscaler import shutdown
+from kube_downscaler.events import CORE_EVENTS_API
+from kube_downscaler.events import EventEmitter
+from kube_downscaler.informer import Informer
+from kube_downscaler.informer import InformerGroup
+from kube_downscaler.leader import get_default_namespace
+from kube_downscaler.leader import LeaderElector
+from kube_downscaler.leader import LeadershipLost
+from kube_downscaler.leader import LEASE_NAME
+from kube_downscaler.ratelimit import DEFAULT_BURST
+from kube_downscaler.ratelimit import RateLimiter
+from kube_downscaler.recording import Recorder
+from kube_downscaler.resources.record import compact_obj
+from kube_downscaler.scaler import DecisionCache
+from kube_downscaler.scaler import DEFAULT_DECISION_CACHE_SIZE
+from kube_downscaler.scaler import get_list_params
+from kube_downscaler.scaler import get_namespace_names
+from kube_downscaler.scaler import is_forcing_uptime
+from kube_downscaler.scaler import NOT_FINISHED_PODS_FIELD_SELECTOR
+from kube_downscaler.scaler import RESOURCE_CLASSES
 from kube_downscaler.scaler import scale
 
 logger = logging.getLogger("downscaler")
 
+INFORMER_SYNC_TIMEOUT_SECONDS = 60
+# wake up slightly after the time spec transition to be on the safe side
+TRANSITION_DELAY_SECONDS = 1
+WATCH_EVENT_DELAY_SECONDS = 1
+
 
 def main(args=None):
     parser = cmd.get_parser()
     args = parser.parse_args(args)
+    if args.namespace_selector and args.informer:
+        # the informers watch a fixed set of namespaces
+        parser.error("--namespace-selector can not be used together with --informer")
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be between 0 and --shard-count - 1")
 
     logging.basicConfig(
         format="%(asctime)s %(levelname)s: %(message)s",
@@ -26,6 +65,9 @@ def main(args=None):
     if args.dry_run:
         logger.info("**DRY-RUN**: no downscaling will be performed!")
 
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+
     return run_loop(
         args.once,
         args.namespace,
@@ -42,7 +84,109 @@ def main(args=None):
         args.downtime_replicas,
         args.deployment_time_annotation,
         args.enable_events,
+        args.informer,
+        args.max_concurrent_updates,
+        args.list_page_size,
+        args.engine,
+        args.decision_cache_size,
+        args.events_api,
+        args.label_selector,
+        args.namespace_selector,
+        args.leader_election,
+        args.leader_election_namespace,
+        args.leader_election_lease_name,
+        args.shard_index,
+        args.shard_count,
+        args.write_qps,
+        args.write_burst,
+        args.record,
+    )
+
+
+def create_informer(api, kind, namespace, **kwargs):
+    """Return an informer for the comma-separated list of namespaces (or for all namespaces)."""
+    names = get_namespace_names(namespace)
+    if len(names) > 1:
+        # one WATCH per namespace, i.e. no cluster-wide LIST permission is needed
+        return InformerGroup([Informer(api, kind, name, **kwargs) for name in names])
+    return Informer(api, kind, namespace, **kwargs)
+
+
+def start_informers(
+    api,
+    namespace,
+    include_resources,
+    changed=None,
+    page_size=helper.DEFAULT_PAGE_SIZE,
+    on_delete=None,
+    params=None,
+    deployment_time_annotation=None,
+):
+    informers = {}
+    # only the fields needed for scaling are kept in memory
+    transform = functools.partial(
+        compact_obj, deployment_time_annotation=deployment_time_annotation
     )
+    for clazz in RESOURCE_CLASSES:
+        if clazz.endpoint in include_resources.split(","):
+            informers[clazz.endpoint] = create_informer(
+                api,
+                clazz,
+                namespace,
+                params=params,
+                changed=changed,
+                page_size=page_size,
+                on_delete=on_delete,
+                transform=transform,
+            )
+    names = get_namespace_names(namespace)
+    if names:
+        # Namespaces are cluster-scoped, only watch the ones we are interested in
+        informers[Namespace.endpoint] = InformerGroup(
+            [
+                Informer(
+                    api,
+                    Namespace,
+                    params={"fieldSelector": f"metadata.name={name}"},
+                    changed=changed,
+                    page_size=page_size,
+                )
+                for name in names
+            ]
+        )
+    else:
+        informers[Namespace.endpoint] = Informer(
+            api, Namespace, changed=changed, page_size=page_size
+        )
+    # only keep the metadata of pods forcing uptime in memory
+    informers[Pod.endpoint] = create_informer(
+        api,
+        Pod,
+        namespace,
+        params={"fieldSelector": NOT_FINISHED_PODS_FIELD_SELECTOR},
+        metadata_only=True,
+        predicate=is_forcing_uptime,
+        changed=changed,
+        page_size=page_size,
+    )
+    for informer in informers.values():
+        informer.start()
+    for informer in informers.values():
+        if not informer.wait_for_sync(INFORMER_SYNC_TIMEOUT_SECONDS):
+            logger.warning(
+                f"{informer} did not sync within {INFORMER_SYNC_TIMEOUT_SECONDS}s"
+            )
+    return informers
+
+
+def get_sleep_seconds(
+    interval: int, next_transition: Optional[datetime.datetime], now: datetime.datetime,
+) -> float:
+    """Sleep until the next time spec transition, but never longer than the loop interval."""
+    if next_transition is None:
+        return interval
+    seconds = (next_transition - now).total_seconds() + TRANSITION_DELAY_SECONDS
+    return max(0, min(interval, seconds))
 
 
 def run_loop(
@@ -61,30 +205,225 @@ def run_loop(
     downtime_replicas,
     deployment_time_annotation=None,
     enable_events=False,
+    use_informer=False,
+    max_concurrent_updates=1,
+    list_page_size=helper.DEFAULT_PAGE_SIZE,
+    engine="sync",
+    decision_cache_size=DEFAULT_DECISION_CACHE_SIZE,
+    events_api=CORE_EVENTS_API,
+    label_selector=None,
+    namespace_selector=None,
+    leader_election=False,
+    leader_election_namespace=None,
+    leader_election_lease_name=LEASE_NAME,
+    shard_index=0,
+    shard_count=1,
+    write_qps=0,
+    write_burst=DEFAULT_BURST,
+    record=None,
 ):
     handler = shutdown.GracefulShutdown()
-    while True:
-        try:
-            scale(
-                namespace,
-                upscale_period,
-                downscale_period,
-                default_uptime,
-                default_downtime,
-                include_resources=frozenset(include_resources.split(",")),
-                exclude_namespaces=frozenset(
-                    re.compile(pattern) for pattern in exclude_namespaces.split(",")
-                ),
-                exclude_deployments=frozenset(exclude_deployments.split(",")),
-                dry_run=dry_run,
+
+    # all writes (updates, events and the Lease) share the same token bucket,
+    # "429 Too Many Requests" pauses all writes even without a limit
+    rate_limiter = RateLimiter(write_qps, write_burst)
+
+    # the API traffic of the first loop iteration is recorded (e.g. for benchmarks/replay.py)
+    recorder = None
+    if record:
+        recorder = Recorder(
+            record,
+            dict(
+                namespace=namespace,
+                include_resources=include_resources,
+                upscale_period=upscale_period,
+                downscale_period=downscale_period,
+                default_uptime=default_uptime,
+                default_downtime=default_downtime,
+                exclude_namespaces=exclude_namespaces,
+                exclude_deployments=exclude_deployments,
                 grace_period=grace_period,
+                dry_run=dry_run,
                 downtime_replicas=downtime_replicas,
                 deployment_time_annotation=deployment_time_annotation,
-                enable_events=enable_events,
+                list_page_size=list_page_size,
+                label_selector=label_selector,
+                namespace_selector=namespace_selector,
+                shard_index=shard_index,
+                shard_count=shard_count,
+            ),
+        )
+
+    # the API client (and its connection pool) is reused across loop iterations
+    pool_size = helper.DEFAULT_POOL_SIZE + max_concurrent_updates
+    api = helper.get_kube_api(pool_size, rate_limiter, recorder)
+    token_mtime = helper.get_service_account_token_mtime()
+
+    loop = None
+    if engine == "async":
+        # aiohttp is an optional dependency, only import it when needed
+        from kube_downscaler import async_engine
+
+        loop = asyncio.new_event_loop()
+        client = async_engine.AsyncKubeClient(
+            api.config, pool_size, rate_limiter, recorder
+        )
+
+    # events are sent in the background (the async engine sends them after the updates of each iteration)
+    event_emitter = None
+    async_event_emitter = None
+    if enable_events and loop:
+        async_event_emitter = async_engine.AsyncEventEmitter(client, events_api)
+    elif enable_events:
+        event_emitter = EventEmitter(api, events_api)
+        event_emitter.start()
+
+    # the same decisions are reused across loop iterations as long as nothing changed
+    decision_cache = DecisionCache(decision_cache_size) if decision_cache_size else None
+
+    exclude_namespace_patterns = frozenset(
+        re.compile(pattern) for pattern in exclude_namespaces.split(",")
+    )
+    exclude_names = frozenset(exclude_deployments.split(","))
+
+    # set by the informers when a watch event arrives
+    wakeup = threading.Event()
+    informers = None
+    if use_informer:
+        informers = start_informers(
+            api,
+            namespace,
+            include_resources,
+            wakeup,
+            list_page_size,
+            decision_cache.evict if decision_cache else None,
+            get_list_params(exclude_namespace_patterns, exclude_names, label_selector),
+            deployment_time_annotation,
+        )
+
+    kwargs = dict(
+        namespace=namespace,
+        upscale_period=upscale_period,
+        downscale_period=downscale_period,
+        default_uptime=default_uptime,
+        default_downtime=default_downtime,
+        include_resources=frozenset(include_resources.split(",")),
+        exclude_namespaces=exclude_namespace_patterns,
+        exclude_deployments=exclude_names,
+        dry_run=dry_run,
+        grace_period=grace_period,
+        downtime_replicas=downtime_replicas,
+        deployment_time_annotation=deployment_time_annotation,
+        enable_events=enable_events,
+        informers=informers,
+        max_concurrent_updates=max_concurrent_updates,
+        list_page_size=list_page_size,
+        decision_cache=decision_cache,
+        label_selector=label_selector,
+        namespace_selector=namespace_selector,
+        shard_index=shard_index,
+        shard_count=shard_count,
+    )
+
+    # without leader election every replica is the leader
+    elector = None
+    if leader_election:
+        if shard_count > 1:
+            # the replicas of every shard elect their own leader
+            leader_election_lease_name += f"-{shard_index}"
+        elector = LeaderElector(
+            api,
+            leader_election_namespace or get_default_namespace(),
+            leader_election_lease_name,
+            changed=wakeup,
+        )
+        elector.start()
+        # checked before every update, i.e. the loop iteration is aborted as soon as the leadership is lost
+        kwargs["is_leader"] = lambda: elector.is_leader
+
+    try:
+        while True:
+            next_transition = None
+            wakeup.clear()
+            current_token_mtime = helper.get_service_account_token_mtime()
+            if current_token_mtime != token_mtime:
+                logger.info(
+                    "Service account token changed, reloading Kubernetes API client"
+                )
+                api = helper.get_kube_api(pool_size, rate_limiter, recorder)
+                token_mtime = current_token_mtime
+                if loop:
+                    loop.run_until_complete(client.close())
+                    client = async_engine.AsyncKubeClient(
+                        api.config, pool_size, rate_limiter, recorder
+                    )
+                    if async_event_emitter:
+                        async_event_emitter.client = client
+                for informer in (informers or {}).values():
+                    informer.api = api
+                if event_emitter:
+                    event_emitter.api = api
+                if elector:
+                    elector.api = api
+            if elector and not elector.is_leader:
+                # standby: the informers (if enabled) keep their cache warm, nothing is listed or updated
+                if handler.shutdown_now:
+                    return
+                with handler.safe_exit():
+                    elector.wait_for_leadership(interval)
+                continue
+            connections = helper.get_connection_count(api)
+            now = None
+            if recorder and not recorder.closed:
+                # the recorded loop iteration is replayed with the same time
+                now = datetime.datetime.now(datetime.timezone.utc)
+                recorder.start(now)
+            try:
+                if loop:
+                    next_transition = loop.run_until_complete(
+                        async_engine.scale(
+                            client, event_emitter=async_event_emitter, now=now, **kwargs
+                        )
+                    )
+                else:
+                    next_transition = scale(
+                        api=api, event_emitter=event_emitter, now=now, **kwargs
+                    )
+            except LeadershipLost as e:
+                logger.warning(f"Aborted the loop iteration: {e}")
+            except Exception as e:
+                logger.exception(f"Failed to autoscale: {e}")
+            if recorder and not recorder.closed:
+                if event_emitter:
+                    # the events belong to the recorded loop iteration
+                    event_emitter.flush()
+                recorder.close()
+            logger.debug(
+                f"Opened {helper.get_connection_count(api) - connections} new connection(s) to the Kubernetes API"
             )
-        except Exception as e:
-            logger.exception(f"Failed to autoscale: {e}")
-        if run_once or handler.shutdown_now:
-            return
-        with handler.safe_exit():
-            time.sleep(interval)
+            if run_once or handler.shutdown_now:
+                return
+            with handler.safe_exit():
+                seconds = get_sleep_seconds(
+                    interval,
+                    next_transition,
+                    datetime.datetime.now(datetime.timezone.utc),
+                )
+                if seconds < interval:
+                    logger.debug(
+                        f"Sleeping {seconds:.0f}s until the next schedule transition at {next_transition}"
+                    )
+                if wakeup.wait(seconds):
+                    # collect related watch events before starting the next iteration
+                    time.sleep(WATCH_EVENT_DELAY_SECONDS)
+    finally:
+        # also on SIGTERM, i.e. a standby replica can take over right away
+        if elector:
+            elector.stop()
+        if event_emitter:
+            event_emitter.stop()
+        if loop:
+            loop.run_until_complete(client.close())
+            loop.close()
+        if recorder:
+            recorder.close()
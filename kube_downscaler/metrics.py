@@ -0,0 +1,357 @@
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Generic
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import TypeVar
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# same default buckets as the official Prometheus client libraries
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    2.5,
+    5.0,
+    7.5,
+    10.0,
+    float("inf"),
+)
+
+# label (name, value) pairs of a sample
+Labels = Tuple[Tuple[str, str], ...]
+# metric name (e.g. with _bucket suffix), labels and value
+Sample = Tuple[str, Labels, float]
+
+# the value kept per label combination, e.g. a float for counters
+V = TypeVar("V")
+
+REGISTRY: List["Metric"] = []
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric(Generic[V]):
+
+    """Base class for metrics with a fixed set of label names, values are kept per label combination."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], V] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} requires labels {self.labelnames}, got {sorted(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Labels:
+        return tuple(zip(self.labelnames, key))
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> Iterator[Sample]:
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class ScalarMetric(Metric[float]):
+
+    """Metric with a single value per label combination, i.e. one sample each."""
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, self._labels(key), value
+
+
+class Counter(ScalarMetric):
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(ScalarMetric):
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, **labels: str) -> Optional[float]:
+        return self._values.get(self._key(labels))
+
+
+class HistogramValue(NamedTuple):
+    # per bucket, not cumulative
+    counts: List[int]
+    total: float
+
+
+class Histogram(Metric[HistogramValue]):
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != float("inf"):
+            self.buckets += (float("inf"),)
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            current = self._values.get(key)
+            counts = current.counts if current else [0] * len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = HistogramValue(
+                counts, (current.total if current else 0.0) + value
+            )
+
+    def get_count(self, **labels: str) -> int:
+        value = self._values.get(self._key(labels))
+        return sum(value.counts) if value else 0
+
+    def time(self, **labels: str) -> "Timer":
+        return Timer(self, labels)
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = sorted(
+                (key, HistogramValue(list(value.counts), value.total))
+                for key, value in self._values.items()
+            )
+        for key, (counts, total) in values:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (
+                    ("le", format_value(bound)),
+                ), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Timer:
+
+    """Context manager observing the elapsed (monotonic) time in a histogram."""
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.monotonic() - self.start, **self.labels)
+
+
+class TimedIterator:
+
+    """Wrap an iterator and sum up the time spent waiting for its items (e.g. fetching LIST pages)."""
+
+    def __init__(self, iterable: Iterable):
+        self.iterator = iter(iterable)
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.monotonic()
+        try:
+            return next(self.iterator)
+        finally:
+            self.seconds += time.monotonic() - start
+
+
+CYCLE_DURATION = Histogram(
+    "kube_downscaler_cycle_duration_seconds",
+    "Duration of a complete scaling cycle",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+PHASE_DURATION = Histogram(
+    "kube_downscaler_phase_duration_seconds",
+    "Duration of a phase of the scaling cycle (pods, namespaces, list, evaluate, updates), evaluate includes synchronous updates",
+    ["phase", "kind"],
+)
+API_REQUESTS = Counter(
+    "kube_downscaler_api_requests_total",
+    "Number of requests to the Kubernetes API",
+    ["verb", "resource", "code"],
+)
+API_REQUEST_DURATION = Histogram(
+    "kube_downscaler_api_request_duration_seconds",
+    "Latency of requests to the Kubernetes API (until the response headers were received)",
+    ["verb", "resource"],
+)
+RESOURCES_EVALUATED = Counter(
+    "kube_downscaler_resources_evaluated_total",
+    "Number of resources evaluated",
+    ["kind"],
+)
+RESOURCES_EXCLUDED = Counter(
+    "kube_downscaler_resources_excluded_total",
+    "Number of resources excluded (by name, namespace or annotation)",
+    ["kind"],
+)
+RESOURCES_SCALED_UP = Counter(
+    "kube_downscaler_resources_scaled_up_total",
+    "Number of resources scaled up (including dry-run)",
+    ["kind"],
+)
+RESOURCES_SCALED_DOWN = Counter(
+    "kube_downscaler_resources_scaled_down_total",
+    "Number of resources scaled down (including dry-run)",
+    ["kind"],
+)
+DECISION_CACHE_HITS = Counter(
+    "kube_downscaler_decision_cache_hits_total",
+    "Number of resources evaluated using a cached decision",
+    ["kind"],
+)
+LAST_SUCCESSFUL_CYCLE = Gauge(
+    "kube_downscaler_last_successful_cycle_timestamp_seconds",
+    "Unix timestamp of the last scaling cycle which completed without errors",
+)
+
+
+def get_resource_from_path(path: str) -> str:
+    """Return the resource (plural) of a Kubernetes API path, e.g. "deployments" for /apis/apps/v1/namespaces/default/deployments/my-deploy."""
+    parts = [part for part in path.split("/") if part]
+    if parts[:1] == ["api"]:
+        parts = parts[2:]
+    elif parts[:1] == ["apis"]:
+        parts = parts[3:]
+    if len(parts) > 2 and parts[0] == "namespaces":
+        # namespaced resource, skip the namespace name
+        parts = parts[2:]
+    return parts[0] if parts else ""
+
+
+def observe_response(response, *args, **kwargs):
+    """Response hook for requests sessions, see https://requests.readthedocs.io/en/latest/user/advanced/#event-hooks."""
+    try:
+        request = response.request
+        verb = request.method
+        if "watch=true" in (urlparse(request.url).query or ""):
+            verb = "WATCH"
+        resource = get_resource_from_path(urlparse(request.url).path)
+        API_REQUESTS.inc(verb=verb, resource=resource, code=str(response.status_code))
+        API_REQUEST_DURATION.observe(
+            response.elapsed.total_seconds(), verb=verb, resource=resource
+        )
+    except Exception as e:
+        logger.debug(f"Failed to record API request metrics: {e}")
+
+
+def instrument_session(session):
+    """Record count and latency of all requests sent with the given requests session."""
+    session.hooks["response"].append(observe_response)
+
+
+def generate_latest() -> str:
+    return "".join(metric.expose() for metric in REGISTRY)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = generate_latest().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Metrics request: {format % args}")
+
+
+def start_http_server(port: int, addr: str = "") -> ThreadingHTTPServer:
+    """Serve /metrics in a background (daemon) thread."""
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    )
+    thread.start()
+    logger.info(f"Serving Prometheus metrics on port {server.server_address[1]}")
+    return server
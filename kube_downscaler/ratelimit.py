@@ -0,0 +1,205 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Executor
+from concurrent.futures import Future
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+# lower values are served first
+PRIORITY_DEFAULT = 0
+PRIORITY_SCALE_UP = 1
+PRIORITY_SCALE_DOWN = 2
+PRIORITY_EVENT = 3
+
+# the bucket size, i.e. how many writes can be sent at once after a quiet period
+DEFAULT_BURST = 10
+
+# how often a request is retried after "429 Too Many Requests"
+MAX_RETRIES = 5
+# used if the API server does not send a Retry-After header
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+MAX_RETRY_AFTER_SECONDS = 60.0
+
+WRITE_METHODS = frozenset(["POST", "PUT", "PATCH", "DELETE"])
+# the leader election Lease must be renewed within the renew deadline, i.e. its requests are neither
+# rate limited nor paused (or retried) after "429 Too Many Requests", the LeaderElector retries them anyway
+EXEMPT_PATH_PREFIXES = ("/apis/coordination.k8s.io/",)
+
+# every thread and asyncio task has its own value
+_priority: contextvars.ContextVar = contextvars.ContextVar(
+    "priority", default=PRIORITY_DEFAULT
+)
+
+
+@contextlib.contextmanager
+def priority(value: int):
+    """Use the given priority for all rate limited requests sent within the block."""
+    token = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def get_priority() -> int:
+    return _priority.get()
+
+
+def is_exempt(path: str) -> bool:
+    """Return True if requests to the path bypass the rate limiter, see EXEMPT_PATH_PREFIXES."""
+    return path.startswith(EXEMPT_PATH_PREFIXES)
+
+
+def get_retry_after(headers) -> float:
+    """Return the seconds to wait according to the Retry-After header (only the delay-seconds form is sent by the API server)."""
+    try:
+        seconds = float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER_SECONDS
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER_SECONDS)
+
+
+class RateLimiter:
+
+    """Token bucket shared by all writes, waiting callers are served by priority (then in order of arrival)."""
+
+    def __init__(self, qps: float, burst: int = 1):
+        # no limit if qps is 0, but Retry-After still pauses all callers
+        self.qps = qps
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting: List[Tuple[int, int]] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self, now: float):
+        if self.qps:
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.qps)
+        self._last = now
+
+    def _try_acquire(self, entry: Tuple[int, int]) -> float:
+        """Take a token if the entry is the first one waiting, otherwise return the seconds to wait (0 to wait for the others)."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = self._paused_until - now
+        if wait > 0:
+            return wait
+        if self._waiting[0] != entry:
+            return 0
+        if self.qps and self._tokens < 1:
+            return (1 - self._tokens) / self.qps
+        if self.qps:
+            self._tokens -= 1
+        heapq.heappop(self._waiting)
+        return -1
+
+    def _remove(self, entry: Tuple[int, int]):
+        if entry in self._waiting:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+
+    def acquire(self, priority: Optional[int] = None):
+        """Block until the request may be sent."""
+        entry = (get_priority() if priority is None else priority, next(self._counter))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    wait = self._try_acquire(entry)
+                    if wait < 0:
+                        return
+                    # woken up early when the first caller got its token
+                    self._condition.wait(wait or None)
+            finally:
+                self._remove(entry)
+                self._condition.notify_all()
+
+    async def acquire_async(self, priority: Optional[int] = None):
+        """Same as acquire(), but without blocking the event loop."""
+        entry = (get_priority() if priority is None else priority, next(self._counter))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_acquire(entry)
+                if wait < 0:
+                    return
+                # callers behind the first one check again when the next token is due
+                await asyncio.sleep(wait or (1 / self.qps if self.qps else 0.01))
+        finally:
+            with self._condition:
+                self._remove(entry)
+                self._condition.notify_all()
+
+    def pause(self, seconds: float):
+        """Stop all callers for the given time, e.g. after "429 Too Many Requests" with Retry-After."""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            # the API server is overloaded, do not send a burst when resuming
+            self._tokens = min(self._tokens, 1.0)
+            self._condition.notify_all()
+
+
+class PriorityExecutor(Executor):
+
+    """Thread pool running the submitted calls by priority (then in order), e.g. scale-ups before scale-downs."""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "priority"):
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._counter = itertools.count(1)
+        self._threads = [
+            threading.Thread(
+                target=self._run, name=f"{thread_name_prefix}_{i}", daemon=True
+            )
+            for i in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self):
+        while True:
+            item_priority, _, item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                # the rate limiter serves the waiting requests by the same priority
+                with priority(item_priority):
+                    result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+    def submit_with_priority(self, item_priority: int, fn, *args, **kwargs) -> Future:
+        future: Future = Future()
+        self._queue.put(
+            (item_priority, next(self._counter), (future, fn, args, kwargs))
+        )
+        return future
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        return self.submit_with_priority(get_priority(), fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, **kwargs):
+        # queued after all calls, i.e. the workers stop when the queue is empty
+        for _ in self._threads:
+            self._queue.put((float("inf"), next(self._counter), None))
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,213 @@
+import collections
+import datetime
+import gzip
+import json
+import logging
+import threading
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+RECORDING_VERSION = 1
+
+REDACTED = "<redacted>"
+# may contain the full manifest of any object, e.g. of a Secret
+LAST_APPLIED_ANNOTATION = "kubectl.kubernetes.io/last-applied-configuration"
+# only these response headers are needed for replaying, request headers (credentials) are never recorded
+RECORDED_HEADERS = ("Content-Type", "Retry-After")
+
+# the request method and the path with sorted query parameters
+RequestKey = Tuple[str, str]
+
+
+def redact(obj):
+    """Return a copy without Secret data, environment variable values and last applied configurations."""
+    if isinstance(obj, list):
+        return [redact(item) for item in obj]
+    if not isinstance(obj, dict):
+        return obj
+    result = {}
+    for key, value in obj.items():
+        if obj.get("kind") == "Secret" and key in ("data", "stringData"):
+            value = {name: REDACTED for name in value or {}}
+        elif key == "env" and isinstance(value, list):
+            value = [
+                {**redact(env), "value": REDACTED} if "value" in env else redact(env)
+                for env in value
+            ]
+        elif key == "annotations" and isinstance(value, dict):
+            value = {
+                name: REDACTED if name == LAST_APPLIED_ANNOTATION else annotation
+                for name, annotation in value.items()
+            }
+        else:
+            value = redact(value)
+        result[key] = value
+    return result
+
+
+def get_request_key(method: str, url: str) -> RequestKey:
+    """Return the key to match replayed requests, independent of the server address and of the query parameter order."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return method.upper(), parts.path + (f"?{query}" if query else "")
+
+
+def decode_body(body):
+    """Return the parsed JSON body (or the text if it is no JSON)."""
+    if not body:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", "replace")
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body
+
+
+class Recorder:
+
+    """Write every request and response to a gzipped JSON lines file (secrets are redacted), until closed.
+
+    The header with the time of the recorded loop iteration is written by start(), requests recorded
+    before (e.g. the initial LIST of the informers) are kept in memory until then.
+    """
+
+    def __init__(self, path: str, settings: Optional[dict] = None):
+        self.path = path
+        self.settings = settings or {}
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._started = False
+        self._pending: List[dict] = []
+        self.count = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def _write(self, data: dict):
+        self._file.write(json.dumps(data, separators=(",", ":")) + "\n")
+
+    def start(self, now: datetime.datetime):
+        """Write the header, the loop iteration's time is used as "now" when replaying it (see benchmarks/replay.py)."""
+        with self._lock:
+            if not self.closed:
+                self._start(now)
+
+    def _start(self, now: datetime.datetime):
+        if self._started:
+            return
+        self._started = True
+        self._write(
+            {
+                "version": RECORDING_VERSION,
+                "recorded": now.isoformat(),
+                "settings": self.settings,
+            }
+        )
+        for exchange in self._pending:
+            self._write(exchange)
+        self._pending = []
+
+    def record(
+        self, method: str, url: str, request_body, status: int, headers, response_body,
+    ):
+        exchange = {
+            "method": method.upper(),
+            "url": get_request_key(method, url)[1],
+            "request": redact(decode_body(request_body)),
+            "status": status,
+            "headers": {
+                name: headers[name] for name in RECORDED_HEADERS if name in headers
+            },
+            "response": redact(decode_body(response_body)),
+        }
+        with self._lock:
+            if self.closed:
+                return
+            if self._started:
+                self._write(exchange)
+            else:
+                self._pending.append(exchange)
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            if not self.closed:
+                # e.g. the loop iteration failed before it was started
+                self._start(datetime.datetime.now(datetime.timezone.utc))
+                self._file.close()
+                logger.info(f"Recorded {self.count} request(s) to {self.path}")
+
+
+def load_recording(path: str) -> Tuple[dict, List[dict]]:
+    """Return the header (recording time and settings) and all recorded exchanges."""
+    with gzip.open(path, "rt", encoding="utf-8") as fd:
+        header = json.loads(fd.readline())
+        if header.get("version") != RECORDING_VERSION:
+            raise ValueError(f"Unsupported recording version {header.get('version')}")
+        return header, [json.loads(line) for line in fd if line.strip()]
+
+
+class ReplayHTTPAdapter(requests.adapters.BaseAdapter):
+
+    """Answer requests with the recorded responses (in recorded order per request), without any network access.
+
+    Requests which were not recorded get "404 Not Found" and are counted as misses.
+    Responses are served again from the start when all recorded ones were used, e.g. for replaying a cycle repeatedly.
+    """
+
+    def __init__(self, exchanges: List[dict]):
+        super().__init__()
+        self._exchanges: Dict[RequestKey, List[dict]] = collections.defaultdict(list)
+        for exchange in exchanges:
+            self._exchanges[(exchange["method"], exchange["url"])].append(exchange)
+        self._queues: Dict[RequestKey, Deque[dict]] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.misses: List[RequestKey] = []
+
+    def _next(self, key: RequestKey) -> Optional[dict]:
+        with self._lock:
+            self.requests += 1
+            if key not in self._exchanges:
+                self.misses.append(key)
+                return None
+            queue = self._queues.get(key)
+            if not queue:
+                queue = self._queues[key] = collections.deque(self._exchanges[key])
+            return queue.popleft()
+
+    def send(self, request, **kwargs):
+        exchange = self._next(get_request_key(request.method, request.path_url))
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.encoding = "utf-8"
+        if exchange is None:
+            response.status_code = 404
+            response.headers["Content-Type"] = "application/json"
+            body = {"kind": "Status", "code": 404, "message": "not recorded"}
+        else:
+            response.status_code = exchange["status"]
+            response.headers.update(exchange["headers"])
+            body = exchange["response"]
+        response._content = (
+            body.encode("utf-8")
+            if isinstance(body, str)
+            else json.dumps(body).encode("utf-8")
+        )
+        return response
+
+    def close(self):
+        pass
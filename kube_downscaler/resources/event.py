@@ -0,0 +1,10 @@
+from pykube.objects import NamespacedAPIObject
+
+
+class Event(NamespacedAPIObject):
+
+    """Support the events.k8s.io/v1 Event (pykube only has the core v1 Event)."""
+
+    version = "events.k8s.io/v1"
+    endpoint = "events"
+    kind = "Event"
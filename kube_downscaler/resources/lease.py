@@ -0,0 +1,10 @@
+from pykube.objects import NamespacedAPIObject
+
+
+class Lease(NamespacedAPIObject):
+
+    """Support the coordination.k8s.io/v1 Lease used for leader election."""
+
+    version = "coordination.k8s.io/v1"
+    endpoint = "leases"
+    kind = "Lease"
@@ -0,0 +1,169 @@
+import sys
+from typing import Optional
+
+from kube_downscaler.resources.stack import get_autoscaling_max_replicas
+from kube_downscaler.resources.stack import Stack
+
+# all annotations read or written by the downscaler use this prefix
+ANNOTATION_PREFIX = "downscaler/"
+
+METADATA_FIELDS = (
+    "name",
+    "namespace",
+    "uid",
+    "resourceVersion",
+    "creationTimestamp",
+    "ownerReferences",
+)
+# the fields changed by scaling, i.e. replicas, minReplicas (HPA) or suspend (CronJob)
+SPEC_FIELDS = ("replicas", "minReplicas", "suspend")
+# a Stack's autoscaling maxReplicas are needed to reset its replicas to autoscaling
+AUTOSCALING_FIELDS = ("autoscaler", "horizontalPodAutoscaler")
+
+
+def keep_annotation(name: str, deployment_time_annotation: Optional[str]) -> bool:
+    return name.startswith(ANNOTATION_PREFIX) or name == deployment_time_annotation
+
+
+def compact_obj(obj: dict, deployment_time_annotation: Optional[str] = None) -> dict:
+    """Return a copy of the object with only the fields needed for scaling, e.g. to keep in an informer's store."""
+    metadata = obj["metadata"]
+    spec = obj.get("spec") or {}
+    compact_spec = {field: spec[field] for field in SPEC_FIELDS if field in spec}
+    for field in AUTOSCALING_FIELDS:
+        if field in spec:
+            compact_spec[field] = {"maxReplicas": spec[field].get("maxReplicas", 0)}
+    compact_metadata = {
+        field: metadata[field] for field in METADATA_FIELDS if field in metadata
+    }
+    compact_metadata["annotations"] = {
+        name: value
+        for name, value in (metadata.get("annotations") or {}).items()
+        if keep_annotation(name, deployment_time_annotation)
+    }
+    return {
+        "apiVersion": obj.get("apiVersion"),
+        "kind": obj.get("kind"),
+        "metadata": compact_metadata,
+        "spec": compact_spec,
+    }
+
+
+class ResourceRecord:
+
+    """Only the fields of a scalable resource which are needed for scaling, instead of the full pykube object.
+
+    The record can be used in place of the pykube object (name, namespace, metadata, annotations, replicas, obj and patch),
+    but only the downscaler annotations (and the deployment time annotation) are kept.
+    """
+
+    __slots__ = (
+        "api",
+        "resource_class",
+        "namespace",
+        "name",
+        "uid",
+        "resource_version",
+        "creation_timestamp",
+        "owner_references",
+        "annotations",
+        "spec",
+        "max_replicas",
+    )
+
+    def __init__(
+        self,
+        api,
+        resource_class,
+        obj: dict,
+        deployment_time_annotation: Optional[str] = None,
+    ):
+        metadata = obj["metadata"]
+        spec = obj.get("spec") or {}
+        self.api = api
+        self.resource_class = resource_class
+        # the same few namespace names are repeated for all resources
+        self.namespace = sys.intern(metadata.get("namespace") or "")
+        self.name = metadata["name"]
+        self.uid = metadata.get("uid")
+        self.resource_version = metadata.get("resourceVersion")
+        self.creation_timestamp = metadata.get("creationTimestamp")
+        self.owner_references = metadata.get("ownerReferences")
+        self.annotations = {
+            sys.intern(name): value
+            for name, value in (metadata.get("annotations") or {}).items()
+            if keep_annotation(name, deployment_time_annotation)
+        }
+        self.spec = {field: spec[field] for field in SPEC_FIELDS if field in spec}
+        self.max_replicas = (
+            get_autoscaling_max_replicas(spec)
+            if issubclass(resource_class, Stack)
+            else None
+        )
+
+    def __repr__(self):
+        return f"<{self.kind} {self.name}>"
+
+    @property
+    def kind(self) -> str:
+        return self.resource_class.kind
+
+    @property
+    def version(self) -> str:
+        return self.resource_class.version
+
+    @property
+    def endpoint(self) -> str:
+        return self.resource_class.endpoint
+
+    @property
+    def base(self) -> Optional[str]:
+        return self.resource_class.base
+
+    @property
+    def metadata(self) -> dict:
+        metadata = {
+            "name": self.name,
+            "namespace": self.namespace,
+            "annotations": self.annotations,
+        }
+        for field, value in (
+            ("uid", self.uid),
+            ("resourceVersion", self.resource_version),
+            ("creationTimestamp", self.creation_timestamp),
+            ("ownerReferences", self.owner_references),
+        ):
+            if value is not None:
+                metadata[field] = value
+        return metadata
+
+    @property
+    def obj(self) -> dict:
+        """Return the compact object, changes of its spec and annotations are kept."""
+        return {
+            "apiVersion": self.version,
+            "kind": self.kind,
+            "metadata": self.metadata,
+            "spec": self.spec,
+        }
+
+    @property
+    def replicas(self) -> Optional[int]:
+        replicas = self.spec.get("replicas")
+        if replicas is None:
+            # Stacks without replicas are autoscaled
+            return self.max_replicas
+        return replicas
+
+    @replicas.setter
+    def replicas(self, value: Optional[int]):
+        if self.max_replicas is not None and value == self.max_replicas:
+            # reset the Stack to autoscaling (None instead of deleting the property, see Stack.replicas)
+            if "replicas" in self.spec:
+                self.spec["replicas"] = None
+        else:
+            self.spec["replicas"] = value
+
+    def patch(self, strategic_merge_patch: dict):
+        """Send the patch, the response is not kept (the record is only used for one loop iteration)."""
+        self.resource_class(self.api, self.obj).patch(strategic_merge_patch)
@@ -2,6 +2,17 @@ from pykube.objects import NamespacedAPIObject
 from pykube.objects import ReplicatedMixin
 
 
+def get_autoscaling_max_replicas(spec: dict):
+    """Return the HPA maxReplicas of the Stack spec or None if no autoscaling is configured."""
+    if "autoscaler" in spec:
+        # see https://github.com/zalando-incubator/stackset-controller/blob/2baddca617e2b76e34976357765206280cfd382e/pkg/apis/zalando.org/v1/types.go#L116
+        return int(spec["autoscaler"].get("maxReplicas", 0))
+    elif "horizontalPodAutoscaler" in spec:
+        # see https://github.com/zalando-incubator/stackset-controller/blob/2baddca617e2b76e34976357765206280cfd382e/pkg/apis/zalando.org/v1/types.go#L139
+        return int(spec["horizontalPodAutoscaler"].get("maxReplicas", 0))
+    return None
+
+
 class Stack(NamespacedAPIObject, ReplicatedMixin):
 
     """Support the Stack resource (https://github.com/zalando-incubator/stackset-controller)."""
@@ -12,14 +23,7 @@ class Stack(NamespacedAPIObject, ReplicatedMixin):
 
     def get_autoscaling_max_replicas(self):
         """Return the Stack's HPA maxReplicas property or None if no autoscaling is configured."""
-        spec = self.obj["spec"]
-        if "autoscaler" in spec:
-            # see https://github.com/zalando-incubator/stackset-controller/blob/2baddca617e2b76e34976357765206280cfd382e/pkg/apis/zalando.org/v1/types.go#L116
-            return int(spec["autoscaler"].get("maxReplicas", 0))
-        elif "horizontalPodAutoscaler" in spec:
-            # see https://github.com/zalando-incubator/stackset-controller/blob/2baddca617e2b76e34976357765206280cfd382e/pkg/apis/zalando.org/v1/types.go#L139
-            return int(spec["horizontalPodAutoscaler"].get("maxReplicas", 0))
-        return None
+        return get_autoscaling_max_replicas(self.obj["spec"])
 
     @property
     def replicas(self):
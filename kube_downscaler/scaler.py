@@ -1,9 +1,24 @@
-import collections
 import datetime
+import hashlib
+import itertools
 import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from typing import Dict
 from typing import FrozenSet
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
 from typing import Optional
 from typing import Pattern
+from typing import Set
+from typing import Tuple
 
 import pykube
 from pykube import CronJob
@@ -14,7 +29,19 @@ from pykube import StatefulSet
 from pykube.objects import NamespacedAPIObject
 
 from kube_downscaler import helper
+from kube_downscaler import metrics
+from kube_downscaler import ratelimit
+from kube_downscaler.events import EventEmitter
 from kube_downscaler.helper import matches_time_spec
+from kube_downscaler.informer import Informer
+from kube_downscaler.informer import PARTIAL_OBJECT_METADATA_LIST
+from kube_downscaler.leader import check_leadership
+from kube_downscaler.leader import LeadershipLost
+from kube_downscaler.ratelimit import PRIORITY_EVENT
+from kube_downscaler.ratelimit import PRIORITY_SCALE_DOWN
+from kube_downscaler.ratelimit import PRIORITY_SCALE_UP
+from kube_downscaler.ratelimit import PriorityExecutor
+from kube_downscaler.resources.record import ResourceRecord
 from kube_downscaler.resources.stack import Stack
 
 ORIGINAL_REPLICAS_ANNOTATION = "downscaler/original-replicas"
@@ -27,6 +54,17 @@ UPTIME_ANNOTATION = "downscaler/uptime"
 DOWNTIME_ANNOTATION = "downscaler/downtime"
 DOWNTIME_REPLICAS_ANNOTATION = "downscaler/downtime-replicas"
 
+# pods which are not running anymore can never force uptime
+NOT_FINISHED_PODS_FIELD_SELECTOR = "status.phase!=Succeeded,status.phase!=Failed"
+
+# maximum number of resources with a cached decision (least recently used are evicted first)
+DEFAULT_DECISION_CACHE_SIZE = 50000
+# cached decisions are re-evaluated at least this often, even if no time spec transition is known
+DECISION_CACHE_MAX_AGE_SECONDS = 600
+
+# object names which can be used in field selectors as is (DNS subdomain)
+NAME_PATTERN = re.compile(r"[a-z0-9]([-a-z0-9.]*[a-z0-9])?")
+
 RESOURCE_CLASSES = [Deployment, StatefulSet, Stack, CronJob, HorizontalPodAutoscaler]
 
 TIMESTAMP_FORMATS = [
@@ -74,13 +112,40 @@ def within_grace_period(
     return delta.total_seconds() <= grace_period
 
 
-def pods_force_uptime(api, namespace: str):
+def is_forcing_uptime(pod: dict) -> bool:
+    """Return True if the (running) pod requires the deployments to be scaled back up."""
+    if pod.get("status", {}).get("phase") in ("Succeeded", "Failed"):
+        return False
+    annotations = pod["metadata"].get("annotations") or {}
+    return annotations.get(FORCE_UPTIME_ANNOTATION, "").lower() == "true"
+
+
+def pods_force_uptime(
+    api,
+    namespace: str,
+    informer: Optional[Informer] = None,
+    page_size: int = helper.DEFAULT_PAGE_SIZE,
+):
     """Return True if there are any running pods which require the deployments to be scaled back up."""
-    for pod in pykube.Pod.objects(api).filter(namespace=(namespace or pykube.all)):
-        if pod.obj.get("status", {}).get("phase") in ("Succeeded", "Failed"):
-            continue
-        if pod.annotations.get(FORCE_UPTIME_ANNOTATION, "").lower() == "true":
-            logger.info(f"Forced uptime because of {pod.namespace}/{pod.name}")
+    if informer:
+        # the informer only keeps pods matching is_forcing_uptime
+        pods = [pod.obj for pod in informer.list()]
+    else:
+        # pages are fetched lazily, i.e. we stop listing after the first match
+        pods = helper.list_objects(
+            api,
+            pykube.Pod,
+            namespace,
+            params={"fieldSelector": NOT_FINISHED_PODS_FIELD_SELECTOR},
+            headers={"Accept": PARTIAL_OBJECT_METADATA_LIST},
+            page_size=page_size,
+        )
+    for pod in pods:
+        if is_forcing_uptime(pod):
+            metadata = pod["metadata"]
+            logger.info(
+                f"Forced uptime because of {metadata.get('namespace')}/{metadata['name']}"
+            )
             return True
     return False
 
@@ -121,28 +186,34 @@ def ignore_resource(resource: NamespacedAPIObject, now: datetime.datetime) -> bo
     return False
 
 
-def get_replicas(
-    resource: NamespacedAPIObject, original_replicas: Optional[int], uptime: str
-) -> int:
+def get_replicas(resource: NamespacedAPIObject) -> int:
+    """Return the current replicas, i.e. minReplicas for HPAs and 0 or 1 for (un)suspended CronJobs."""
     if resource.kind == "CronJob":
-        suspended = resource.obj["spec"]["suspend"]
-        replicas = 0 if suspended else 1
-        state = "suspended" if suspended else "not suspended"
-        original_state = "suspended" if original_replicas == 0 else "not suspended"
-        logger.debug(
-            f"{resource.kind} {resource.namespace}/{resource.name} is {state} (original: {original_state}, uptime: {uptime})"
-        )
+        return 0 if resource.obj["spec"]["suspend"] else 1
     elif resource.kind == "HorizontalPodAutoscaler":
-        replicas = resource.obj["spec"]["minReplicas"]
-        logger.debug(
-            f"{resource.kind} {resource.namespace}/{resource.name} has {replicas} minReplicas (original: {original_replicas}, uptime: {uptime})"
-        )
-    else:
-        replicas = resource.replicas
-        logger.debug(
-            f"{resource.kind} {resource.namespace}/{resource.name} has {replicas} replicas (original: {original_replicas}, uptime: {uptime})"
-        )
-    return replicas
+        return resource.obj["spec"]["minReplicas"]
+    return resource.replicas
+
+
+def get_event_message(resource: NamespacedAPIObject, scaling_up: bool) -> str:
+    if resource.kind == "CronJob":
+        return "Unsuspending CronJob" if scaling_up else "Suspending CronJob"
+    return "Scaling up replicas" if scaling_up else "Scaling down replicas"
+
+
+def add_event(
+    resource: NamespacedAPIObject,
+    message: str,
+    reason: str,
+    dry_run: bool,
+    event_emitter: Optional[EventEmitter] = None,
+):
+    if not event_emitter:
+        with ratelimit.priority(PRIORITY_EVENT):
+            helper.add_event(resource, message, reason, "Normal", dry_run)
+    elif not dry_run:
+        # sent in the background, i.e. without waiting for the API
+        event_emitter.emit(resource, message, reason, "Normal")
 
 
 def scale_up(
@@ -153,14 +224,13 @@ def scale_up(
     downtime,
     dry_run: bool,
     enable_events: bool,
+    event_emitter: Optional[EventEmitter] = None,
 ):
-    event_message = "Scaling up replicas"
     if resource.kind == "CronJob":
         resource.obj["spec"]["suspend"] = False
         logger.info(
             f"Unsuspending {resource.kind} {resource.namespace}/{resource.name} (uptime: {uptime}, downtime: {downtime})"
         )
-        event_message = "Unsuspending CronJob"
     elif resource.kind == "HorizontalPodAutoscaler":
         resource.obj["spec"]["minReplicas"] = original_replicas
         logger.info(
@@ -172,8 +242,12 @@ def scale_up(
             f"Scaling up {resource.kind} {resource.namespace}/{resource.name} from {replicas} to {original_replicas} replicas (uptime: {uptime}, downtime: {downtime})"
         )
     if enable_events:
-        helper.add_event(
-            resource, event_message, "ScaleUp", "Normal", dry_run,
+        add_event(
+            resource,
+            get_event_message(resource, True),
+            "ScaleUp",
+            dry_run,
+            event_emitter,
         )
     resource.annotations[ORIGINAL_REPLICAS_ANNOTATION] = None
 
@@ -186,14 +260,13 @@ def scale_down(
     downtime,
     dry_run: bool,
     enable_events: bool,
+    event_emitter: Optional[EventEmitter] = None,
 ):
-    event_message = "Scaling down replicas"
     if resource.kind == "CronJob":
         resource.obj["spec"]["suspend"] = True
         logger.info(
             f"Suspending {resource.kind} {resource.namespace}/{resource.name} (uptime: {uptime}, downtime: {downtime})"
         )
-        event_message = "Suspending CronJob"
     elif resource.kind == "HorizontalPodAutoscaler":
         resource.obj["spec"]["minReplicas"] = target_replicas
         logger.info(
@@ -205,12 +278,37 @@ def scale_down(
             f"Scaling down {resource.kind} {resource.namespace}/{resource.name} from {replicas} to {target_replicas} replicas (uptime: {uptime}, downtime: {downtime})"
         )
     if enable_events:
-        helper.add_event(
-            resource, event_message, "ScaleDown", "Normal", dry_run,
+        add_event(
+            resource,
+            get_event_message(resource, False),
+            "ScaleDown",
+            dry_run,
+            event_emitter,
         )
     resource.annotations[ORIGINAL_REPLICAS_ANNOTATION] = str(replicas)
 
 
+def get_scale_patch(resource: NamespacedAPIObject) -> dict:
+    """Return a merge patch with only the fields changed by scale_up/scale_down (instead of sending the whole object)."""
+    if resource.kind == "CronJob":
+        spec = {"suspend": resource.obj["spec"]["suspend"]}
+    elif resource.kind == "HorizontalPodAutoscaler":
+        spec = {"minReplicas": resource.obj["spec"]["minReplicas"]}
+    else:
+        # note that Stacks use "None" to reset the replicas to autoscaling
+        spec = {"replicas": resource.obj["spec"].get("replicas")}
+    return {
+        "metadata": {
+            "annotations": {
+                ORIGINAL_REPLICAS_ANNOTATION: resource.annotations.get(
+                    ORIGINAL_REPLICAS_ANNOTATION
+                )
+            }
+        },
+        "spec": spec,
+    }
+
+
 def get_annotation_value_as_int(
     resource: NamespacedAPIObject, annotation_name: str
 ) -> Optional[int]:
@@ -225,6 +323,316 @@ def get_annotation_value_as_int(
         )
 
 
+class NamespaceDefaults(NamedTuple):
+    excluded: bool
+    upscale_period: str
+    downscale_period: str
+    uptime: str
+    downtime: str
+    downtime_replicas: int
+    forced_uptime: bool
+
+
+# possible Action types
+NO_ACTION = "none"
+EXCLUDED = "excluded"
+SCALE_UP = "scale-up"
+SCALE_DOWN = "scale-down"
+GRACE_PERIOD = "grace-period"
+
+
+class Action(NamedTuple):
+    type: str
+    # current replicas and the replicas to scale to (same as replicas if nothing changes)
+    replicas: Optional[int] = None
+    target_replicas: Optional[int] = None
+    uptime: Optional[str] = None
+    downtime: Optional[str] = None
+
+
+class Schedule(NamedTuple):
+
+    """The effective time specs of a resource, i.e. its annotations or the namespace defaults."""
+
+    upscale_period: str
+    downscale_period: str
+    uptime: str
+    downtime: str
+
+
+class ScheduleResult(NamedTuple):
+    # neither uptime nor downtime, e.g. outside of all upscale/downscale periods
+    ignore: bool
+    is_uptime: bool
+    # the time specs which were used (periods or uptime/downtime)
+    uptime: str
+    downtime: str
+
+
+def evaluate_schedule(schedule: Schedule, now: datetime.datetime) -> ScheduleResult:
+    """Return whether it is uptime, upscale/downscale periods take precedence over uptime/downtime."""
+    if schedule.upscale_period != "never" or schedule.downscale_period != "never":
+        uptime = schedule.upscale_period
+        downtime = schedule.downscale_period
+        if matches_time_spec(now, uptime) and matches_time_spec(now, downtime):
+            # upscale and downscale periods overlap, do nothing
+            return ScheduleResult(True, True, uptime, downtime)
+        elif matches_time_spec(now, uptime):
+            return ScheduleResult(False, True, uptime, downtime)
+        elif matches_time_spec(now, downtime):
+            return ScheduleResult(False, False, uptime, downtime)
+        return ScheduleResult(True, True, uptime, downtime)
+    is_uptime = matches_time_spec(now, schedule.uptime) and not matches_time_spec(
+        now, schedule.downtime
+    )
+    return ScheduleResult(False, is_uptime, schedule.uptime, schedule.downtime)
+
+
+class ScheduleGroups:
+
+    """Group resources by their effective schedule, every distinct schedule is evaluated only once per loop iteration.
+
+    Thousands of resources usually share a handful of schedules, i.e. the evaluation cost depends on
+    the number of distinct schedules instead of the number of resources. The result of a group is
+    shared by all its members.
+    """
+
+    def __init__(self, now: datetime.datetime):
+        self.now = now
+        # the interned schedules and their results (None until a member needs it)
+        self._groups: Dict[Schedule, Optional[ScheduleResult]] = {}
+
+    def __len__(self):
+        return len(self._groups)
+
+    def add(self, schedule: Schedule) -> bool:
+        """Add a member's schedule, returns True if the schedule was not seen before in this loop iteration."""
+        if schedule in self._groups:
+            return False
+        self._groups[schedule] = None
+        return True
+
+    def evaluate(self, schedule: Schedule) -> ScheduleResult:
+        result = self._groups.get(schedule)
+        if result is None:
+            # invalid time specs raise every time, i.e. the error is reported for every member
+            result = self._groups[schedule] = evaluate_schedule(schedule, self.now)
+        return result
+
+
+def decide(
+    resource: NamespacedAPIObject,
+    defaults: NamespaceDefaults,
+    now: datetime.datetime,
+    grace_period: int = 0,
+    deployment_time_annotation: Optional[str] = None,
+    schedule_groups: Optional[ScheduleGroups] = None,
+    schedule: Optional[Schedule] = None,
+) -> Action:
+    """Decide what to do with the resource, only reads the resource (it is neither modified nor any API called).
+
+    The resource's schedule (see get_time_specs) is passed in if the caller already resolved it.
+    """
+    exclude = defaults.excluded or ignore_resource(resource, now)
+    original_replicas = get_annotation_value_as_int(
+        resource, ORIGINAL_REPLICAS_ANNOTATION
+    )
+    downtime_replicas = get_annotation_value_as_int(
+        resource, DOWNTIME_REPLICAS_ANNOTATION
+    )
+    if downtime_replicas is None:
+        downtime_replicas = defaults.downtime_replicas
+
+    if exclude and not original_replicas:
+        return Action(EXCLUDED)
+
+    if defaults.forced_uptime or (exclude and original_replicas):
+        ignore, is_uptime, uptime, downtime = False, True, "forced", "ignored"
+    else:
+        if schedule is None:
+            schedule = get_time_specs(resource, defaults)
+        ignore, is_uptime, uptime, downtime = (
+            schedule_groups.evaluate(schedule)
+            if schedule_groups is not None
+            else evaluate_schedule(schedule, now)
+        )
+
+    replicas = get_replicas(resource)
+
+    if (
+        not ignore
+        and is_uptime
+        and replicas == downtime_replicas
+        and original_replicas
+        and original_replicas > 0
+    ):
+        return Action(SCALE_UP, replicas, original_replicas, uptime, downtime)
+    elif not ignore and not is_uptime and replicas > 0 and replicas > downtime_replicas:
+        if within_grace_period(resource, grace_period, now, deployment_time_annotation):
+            return Action(GRACE_PERIOD, replicas, replicas, uptime, downtime)
+        return Action(SCALE_DOWN, replicas, downtime_replicas, uptime, downtime)
+    return Action(NO_ACTION, replicas, replicas, uptime, downtime)
+
+
+def apply_action(
+    resource: NamespacedAPIObject,
+    action: Action,
+    dry_run: bool,
+    enable_events: bool,
+    grace_period: int = 0,
+    event_emitter: Optional[EventEmitter] = None,
+) -> bool:
+    """Log the action and change the resource in memory accordingly, returns True if the resource needs to be updated."""
+    if action.type == EXCLUDED:
+        metrics.RESOURCES_EXCLUDED.inc(kind=resource.kind)
+        logger.debug(
+            f"{resource.kind} {resource.namespace}/{resource.name} was excluded"
+        )
+        return False
+    logger.debug(
+        f"{resource.kind} {resource.namespace}/{resource.name} has {action.replicas} replicas (uptime: {action.uptime}, downtime: {action.downtime}, action: {action.type})"
+    )
+    if action.type == GRACE_PERIOD:
+        logger.info(
+            f"{resource.kind} {resource.namespace}/{resource.name} within grace period ({grace_period}s), not scaling down (yet)"
+        )
+    elif action.type == SCALE_UP:
+        scale_up(
+            resource,
+            action.replicas,
+            action.target_replicas,
+            action.uptime,
+            action.downtime,
+            dry_run=dry_run,
+            enable_events=enable_events,
+            event_emitter=event_emitter,
+        )
+        metrics.RESOURCES_SCALED_UP.inc(kind=resource.kind)
+        return True
+    elif action.type == SCALE_DOWN:
+        scale_down(
+            resource,
+            action.replicas,
+            action.target_replicas,
+            action.uptime,
+            action.downtime,
+            dry_run=dry_run,
+            enable_events=enable_events,
+            event_emitter=event_emitter,
+        )
+        metrics.RESOURCES_SCALED_DOWN.inc(kind=resource.kind)
+        return True
+    return False
+
+
+class DecisionCache:
+
+    """Remember the Action per resource version and namespace defaults until any time spec changes its value."""
+
+    def __init__(self, max_size: int = DEFAULT_DECISION_CACHE_SIZE):
+        self.max_size = max_size
+        # the epoch changes whenever a time spec might have flipped, i.e. all cached actions become invalid
+        self.epoch = 0
+        # None if unknown, e.g. because the last cycle failed
+        self.valid_until: Optional[datetime.datetime] = None
+        self._cycle_start: Optional[datetime.datetime] = None
+        # (resourceVersion, namespace defaults, epoch, action) by uid
+        self._entries: "OrderedDict[str, Tuple[str, NamespaceDefaults, int, Action]]"
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start_cycle(self, now: datetime.datetime):
+        if self.valid_until is None or now >= self.valid_until:
+            self.epoch += 1
+        # unknown until the cycle completes, a failed cycle might not have seen all time specs
+        self.valid_until = None
+        self._cycle_start = now
+
+    def end_cycle(self, next_transition: Optional[datetime.datetime]):
+        """Keep the cached actions until the next transition of the cycle's time specs, but at most DECISION_CACHE_MAX_AGE_SECONDS."""
+        max_valid_until = self._cycle_start + datetime.timedelta(
+            seconds=DECISION_CACHE_MAX_AGE_SECONDS
+        )
+        if next_transition is None or next_transition > max_valid_until:
+            # a wrongly computed (or missing) transition must not keep stale decisions forever
+            self.valid_until = max_valid_until
+        else:
+            self.valid_until = next_transition
+
+    def get(
+        self, resource: NamespacedAPIObject, defaults: NamespaceDefaults
+    ) -> Optional[Action]:
+        uid = resource.metadata.get("uid")
+        if not uid:
+            return None
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is None:
+                return None
+            resource_version, cached_defaults, epoch, action = entry
+            if (
+                resource_version != resource.metadata.get("resourceVersion")
+                or cached_defaults != defaults
+                or epoch != self.epoch
+            ):
+                return None
+            self._entries.move_to_end(uid)
+        return action
+
+    def set(
+        self, resource: NamespacedAPIObject, defaults: NamespaceDefaults, action: Action
+    ):
+        uid = resource.metadata.get("uid")
+        resource_version = resource.metadata.get("resourceVersion")
+        # the grace period and exclude-until annotation depend on the current time, not only on time specs
+        if (
+            not uid
+            or not resource_version
+            or action.type == GRACE_PERIOD
+            or EXCLUDE_UNTIL_ANNOTATION in resource.annotations
+        ):
+            return
+        with self._lock:
+            self._entries[uid] = (resource_version, defaults, self.epoch, action)
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, obj: dict):
+        """Forget the object, e.g. when the informer receives a DELETED event."""
+        with self._lock:
+            self._entries.pop(obj["metadata"].get("uid"), None)
+
+
+def get_action(
+    resource: NamespacedAPIObject,
+    defaults: NamespaceDefaults,
+    now: datetime.datetime,
+    grace_period: int = 0,
+    deployment_time_annotation: Optional[str] = None,
+    decision_cache: Optional[DecisionCache] = None,
+    schedule_groups: Optional[ScheduleGroups] = None,
+    schedule: Optional[Schedule] = None,
+) -> Action:
+    """Same as decide, but skip the evaluation if the resource and its namespace did not change since the last cycle."""
+    action = decision_cache.get(resource, defaults) if decision_cache else None
+    if action is None:
+        action = decide(
+            resource,
+            defaults,
+            now,
+            grace_period,
+            deployment_time_annotation,
+            schedule_groups,
+            schedule,
+        )
+        if decision_cache:
+            decision_cache.set(resource, defaults, action)
+    else:
+        metrics.DECISION_CACHE_HITS.inc(kind=resource.kind)
+    return action
+
+
 def autoscale_resource(
     resource: NamespacedAPIObject,
     upscale_period: str,
@@ -239,116 +647,234 @@ def autoscale_resource(
     namespace_excluded=False,
     deployment_time_annotation: Optional[str] = None,
     enable_events: bool = False,
-):
+    executor: Optional[Executor] = None,
+    decision_cache: Optional[DecisionCache] = None,
+    event_emitter: Optional[EventEmitter] = None,
+    schedule_groups: Optional[ScheduleGroups] = None,
+    is_leader: Optional[Callable[[], bool]] = None,
+    schedule: Optional[Schedule] = None,
+) -> Optional[Future]:
+    """Scale the resource up or down if needed, returns a Future if the update was submitted to the executor."""
+    metrics.RESOURCES_EVALUATED.inc(kind=resource.kind)
     try:
-        exclude = namespace_excluded or ignore_resource(resource, now)
-        original_replicas = get_annotation_value_as_int(
-            resource, ORIGINAL_REPLICAS_ANNOTATION
+        defaults = NamespaceDefaults(
+            excluded=namespace_excluded,
+            upscale_period=upscale_period,
+            downscale_period=downscale_period,
+            uptime=default_uptime,
+            downtime=default_downtime,
+            downtime_replicas=downtime_replicas,
+            forced_uptime=forced_uptime,
         )
-        downtime_replicas_from_annotation = get_annotation_value_as_int(
-            resource, DOWNTIME_REPLICAS_ANNOTATION
+        action = get_action(
+            resource,
+            defaults,
+            now,
+            grace_period,
+            deployment_time_annotation,
+            decision_cache,
+            schedule_groups,
+            schedule,
         )
-        if downtime_replicas_from_annotation is not None:
-            downtime_replicas = downtime_replicas_from_annotation
-
-        if exclude and not original_replicas:
-            logger.debug(
-                f"{resource.kind} {resource.namespace}/{resource.name} was excluded"
-            )
-        else:
-            ignore = False
-            is_uptime = True
-
-            upscale_period = resource.annotations.get(
-                UPSCALE_PERIOD_ANNOTATION, upscale_period
-            )
-            downscale_period = resource.annotations.get(
-                DOWNSCALE_PERIOD_ANNOTATION, downscale_period
-            )
-            if forced_uptime or (exclude and original_replicas):
-                uptime = "forced"
-                downtime = "ignored"
-                is_uptime = True
-            elif upscale_period != "never" or downscale_period != "never":
-                uptime = upscale_period
-                downtime = downscale_period
-                if matches_time_spec(now, uptime) and matches_time_spec(now, downtime):
-                    logger.debug("Upscale and downscale periods overlap, do nothing")
-                    ignore = True
-                elif matches_time_spec(now, uptime):
-                    is_uptime = True
-                elif matches_time_spec(now, downtime):
-                    is_uptime = False
-                else:
-                    ignore = True
-                logger.debug(
-                    f"Periods checked: upscale={upscale_period}, downscale={downscale_period}, ignore={ignore}, is_uptime={is_uptime}"
+        if not dry_run and action.type in (SCALE_UP, SCALE_DOWN):
+            # neither the update nor its event are sent if another replica might already be the leader
+            check_leadership(is_leader)
+        if apply_action(
+            resource, action, dry_run, enable_events, grace_period, event_emitter
+        ):
+            if dry_run:
+                logger.info(
+                    f"**DRY-RUN**: would update {resource.kind} {resource.namespace}/{resource.name}"
                 )
             else:
-                uptime = resource.annotations.get(UPTIME_ANNOTATION, default_uptime)
-                downtime = resource.annotations.get(
-                    DOWNTIME_ANNOTATION, default_downtime
-                )
-                is_uptime = matches_time_spec(now, uptime) and not matches_time_spec(
-                    now, downtime
-                )
-
-            replicas = get_replicas(resource, original_replicas, uptime)
-            update_needed = False
-
-            if (
-                not ignore
-                and is_uptime
-                and replicas == downtime_replicas
-                and original_replicas
-                and original_replicas > 0
-            ):
-
-                scale_up(
-                    resource,
-                    replicas,
-                    original_replicas,
-                    uptime,
-                    downtime,
-                    dry_run=dry_run,
-                    enable_events=enable_events,
-                )
-                update_needed = True
-            elif (
-                not ignore
-                and not is_uptime
-                and replicas > 0
-                and replicas > downtime_replicas
-            ):
-                if within_grace_period(
-                    resource, grace_period, now, deployment_time_annotation
+                patch = get_scale_patch(resource)
+                # scale-ups first, e.g. when the downtime ends for many resources at once
+                with ratelimit.priority(
+                    PRIORITY_SCALE_UP
+                    if action.type == SCALE_UP
+                    else PRIORITY_SCALE_DOWN
                 ):
-                    logger.info(
-                        f"{resource.kind} {resource.namespace}/{resource.name} within grace period ({grace_period}s), not scaling down (yet)"
-                    )
-                else:
-                    scale_down(
-                        resource,
-                        replicas,
-                        downtime_replicas,
-                        uptime,
-                        downtime,
-                        dry_run=dry_run,
-                        enable_events=enable_events,
-                    )
-                    update_needed = True
-
-            if update_needed:
-                if dry_run:
-                    logger.info(
-                        f"**DRY-RUN**: would update {resource.kind} {resource.namespace}/{resource.name}"
-                    )
-                else:
-                    resource.update()
+                    if executor:
+                        return executor.submit(
+                            update_resource, resource, patch, is_leader
+                        )
+                    update_resource(resource, patch, is_leader)
+    except LeadershipLost:
+        raise
     except Exception as e:
         logger.exception(
             f"Failed to process {resource.kind} {resource.namespace}/{resource.name}: {e}"
         )
+    return None
+
+
+def update_resource(
+    resource: NamespacedAPIObject,
+    patch: dict,
+    is_leader: Optional[Callable[[], bool]] = None,
+):
+    """Send the update, unless the leadership was lost in the meantime (e.g. while it was queued)."""
+    check_leadership(is_leader)
+    resource.patch(patch)
+
+
+def wait_for_updates(pending_updates: List[Tuple[NamespacedAPIObject, Future]]):
+    """Wait for all submitted updates, errors are logged in submission order.
+
+    LeadershipLost is raised (once) after all updates finished if any of them was not sent because of it.
+    """
+    lost = None
+    for resource, future in pending_updates:
+        try:
+            future.result()
+        except LeadershipLost as e:
+            lost = e
+        except Exception as e:
+            logger.exception(
+                f"Failed to process {resource.kind} {resource.namespace}/{resource.name}: {e}"
+            )
+    if lost:
+        raise lost
+
+
+def get_namespace_defaults(
+    namespace_obj: NamespacedAPIObject,
+    upscale_period: str,
+    downscale_period: str,
+    default_uptime: str,
+    default_downtime: str,
+    forced_uptime: bool,
+    now: datetime.datetime,
+    downtime_replicas: int,
+) -> NamespaceDefaults:
+    """Override the global defaults with (optional) annotations from the Namespace."""
+    excluded = ignore_resource(namespace_obj, now)
+
+    default_downtime_replicas_for_namespace = get_annotation_value_as_int(
+        namespace_obj, DOWNTIME_REPLICAS_ANNOTATION
+    )
+    if default_downtime_replicas_for_namespace is None:
+        default_downtime_replicas_for_namespace = downtime_replicas
+
+    forced_uptime_value_for_namespace = str(
+        namespace_obj.annotations.get(FORCE_UPTIME_ANNOTATION, forced_uptime)
+    )
+    if forced_uptime_value_for_namespace.lower() == "true":
+        forced_uptime_for_namespace = True
+    elif forced_uptime_value_for_namespace.lower() == "false":
+        forced_uptime_for_namespace = False
+    elif forced_uptime_value_for_namespace:
+        forced_uptime_for_namespace = matches_time_spec(
+            now, forced_uptime_value_for_namespace
+        )
+    else:
+        forced_uptime_for_namespace = False
+
+    return NamespaceDefaults(
+        excluded=excluded,
+        upscale_period=namespace_obj.annotations.get(
+            UPSCALE_PERIOD_ANNOTATION, upscale_period
+        ),
+        downscale_period=namespace_obj.annotations.get(
+            DOWNSCALE_PERIOD_ANNOTATION, downscale_period
+        ),
+        uptime=namespace_obj.annotations.get(UPTIME_ANNOTATION, default_uptime),
+        downtime=namespace_obj.annotations.get(DOWNTIME_ANNOTATION, default_downtime),
+        downtime_replicas=default_downtime_replicas_for_namespace,
+        forced_uptime=forced_uptime_for_namespace,
+    )
+
+
+def get_time_specs(
+    resource: NamespacedAPIObject, defaults: NamespaceDefaults
+) -> Schedule:
+    """Return the effective (upscale period, downscale period, uptime, downtime) specs of the resource."""
+    return Schedule(
+        resource.annotations.get(UPSCALE_PERIOD_ANNOTATION, defaults.upscale_period),
+        resource.annotations.get(
+            DOWNSCALE_PERIOD_ANNOTATION, defaults.downscale_period
+        ),
+        resource.annotations.get(UPTIME_ANNOTATION, defaults.uptime),
+        resource.annotations.get(DOWNTIME_ANNOTATION, defaults.downtime),
+    )
+
+
+def get_next_transition(
+    now: datetime.datetime, time_specs: Set[str]
+) -> Optional[datetime.datetime]:
+    """Return the earliest instant when any of the given time specs changes its value."""
+    next_transition = None
+    for spec in time_specs:
+        try:
+            transition = helper.get_next_time_spec_transition(now, spec)
+        except ValueError:
+            # invalid time specs are already reported when processing the resource
+            continue
+        if transition and (next_transition is None or transition < next_transition):
+            next_transition = transition
+    return next_transition
+
+
+def filter_resources(
+    kind,
+    current_namespace: str,
+    resources: Iterable[NamespacedAPIObject],
+    exclude_namespaces: FrozenSet[Pattern],
+    exclude_names: FrozenSet[str],
+) -> List[NamespacedAPIObject]:
+    """Return the resources of one namespace which are neither excluded by namespace pattern nor by name."""
+    if any([pattern.fullmatch(current_namespace) for pattern in exclude_namespaces]):
+        logger.debug(
+            f"Namespace {current_namespace} was excluded (exclusion list regex matches)"
+        )
+        metrics.RESOURCES_EXCLUDED.inc(sum(1 for _ in resources), kind=kind.kind)
+        return []
+
+    result = []
+    for resource in resources:
+        if resource.name in exclude_names:
+            metrics.RESOURCES_EXCLUDED.inc(kind=kind.kind)
+            logger.debug(
+                f"{resource.kind} {resource.namespace}/{resource.name} was excluded (name matches exclusion list)"
+            )
+            continue
+        result.append(resource)
+    return result
+
+
+def get_list_params(
+    exclude_namespaces: FrozenSet[Pattern],
+    exclude_names: FrozenSet[str],
+    label_selector: Optional[str] = None,
+) -> Dict[str, str]:
+    """Return LIST query parameters to let the API server drop excluded resources instead of sending them.
+
+    Field selectors only support exact matches, i.e. regex patterns are still applied by filter_resources.
+    """
+    selectors = [
+        f"metadata.namespace!={pattern.pattern}"
+        for pattern in sorted(exclude_namespaces, key=lambda pattern: pattern.pattern)
+        if NAME_PATTERN.fullmatch(pattern.pattern)
+    ]
+    selectors += [
+        f"metadata.name!={name}"
+        for name in sorted(exclude_names)
+        if NAME_PATTERN.fullmatch(name)
+    ]
+    params = {}
+    if selectors:
+        params["fieldSelector"] = ",".join(selectors)
+    if label_selector:
+        params["labelSelector"] = label_selector
+    return params
+
+
+def get_namespace_time_specs(namespace_obj: NamespacedAPIObject) -> Set[str]:
+    """Return the namespace's force-uptime time spec (if any), i.e. the annotation is neither "true" nor "false"."""
+    force_uptime = namespace_obj.annotations.get(FORCE_UPTIME_ANNOTATION)
+    if force_uptime and force_uptime.lower() not in ("true", "false"):
+        return {force_uptime}
+    return set()
 
 
 def autoscale_resources(
@@ -368,83 +894,176 @@ def autoscale_resources(
     downtime_replicas: int,
     deployment_time_annotation: Optional[str] = None,
     enable_events: bool = False,
-):
-    resources_by_namespace = collections.defaultdict(list)
-    for resource in kind.objects(api, namespace=(namespace or pykube.all)):
-        if resource.name in exclude_names:
-            logger.debug(
-                f"{resource.kind} {resource.namespace}/{resource.name} was excluded (name matches exclusion list)"
+    informer: Optional[Informer] = None,
+    namespaces: Optional[Dict[str, NamespacedAPIObject]] = None,
+    namespace_defaults: Optional[Dict[str, NamespaceDefaults]] = None,
+    executor: Optional[Executor] = None,
+    time_specs: Optional[Set[str]] = None,
+    page_size: int = helper.DEFAULT_PAGE_SIZE,
+    pages: Optional[Iterable[dict]] = None,
+    decision_cache: Optional[DecisionCache] = None,
+    event_emitter: Optional[EventEmitter] = None,
+    params: Optional[dict] = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    schedule_groups: Optional[ScheduleGroups] = None,
+    is_leader: Optional[Callable[[], bool]] = None,
+) -> List[Tuple[NamespacedAPIObject, Future]]:
+    """Scale all resources of the given kind, the LIST pages can be passed in if they were already (pre)fetched."""
+    pending_updates: List[Tuple[NamespacedAPIObject, Future]] = []
+    if namespace_defaults is None:
+        namespace_defaults = {}
+    if schedule_groups is None:
+        schedule_groups = ScheduleGroups(now)
+
+    start = time.monotonic()
+    if informer:
+        # read from the local cache instead of listing all objects again
+        objs: Iterable[dict] = (resource.obj for resource in informer.list())
+    else:
+        if pages is None:
+            pages = helper.list_pages(
+                api, kind, namespace, params=params, page_size=page_size
             )
-            continue
-        resources_by_namespace[resource.namespace].append(resource)
+        objs = (obj for page in pages for obj in page.get("items") or [])
+    # every object is reduced to a compact record as soon as it was received (the full object is not kept),
+    # time spent waiting for the LIST pages is recorded separately from the evaluation
+    listed = metrics.TimedIterator(
+        ResourceRecord(api, kind, obj, deployment_time_annotation) for obj in objs
+    )
 
-    for current_namespace, resources in sorted(resources_by_namespace.items()):
+    # the API server returns objects ordered by namespace and name, so every namespace
+    # is processed as soon as its objects were received (without keeping the whole list in memory)
+    for current_namespace, group in itertools.groupby(
+        listed, key=lambda resource: resource.namespace
+    ):
 
-        if any(
-            [pattern.fullmatch(current_namespace) for pattern in exclude_namespaces]
-        ):
-            logger.debug(
-                f"Namespace {current_namespace} was excluded (exclusion list regex matches)"
-            )
+        if shard_count > 1 and get_shard(current_namespace, shard_count) != shard_index:
+            # another replica is responsible for this namespace (only when listing all namespaces at once)
             continue
 
-        logger.debug(
-            f"Processing {len(resources)} {kind.endpoint} in namespace {current_namespace}.."
+        resources = filter_resources(
+            kind, current_namespace, group, exclude_namespaces, exclude_names
         )
+        if not resources:
+            continue
 
-        # Override defaults with (optional) annotations from Namespace
-        namespace_obj = Namespace.objects(api).get_by_name(current_namespace)
-
-        excluded = ignore_resource(namespace_obj, now)
-
-        default_uptime_for_namespace = namespace_obj.annotations.get(
-            UPTIME_ANNOTATION, default_uptime
-        )
-        default_downtime_for_namespace = namespace_obj.annotations.get(
-            DOWNTIME_ANNOTATION, default_downtime
-        )
-        default_downtime_replicas_for_namespace = get_annotation_value_as_int(
-            namespace_obj, DOWNTIME_REPLICAS_ANNOTATION
+        logger.debug(
+            f"Processing {len(resources)} {kind.endpoint} in namespace {current_namespace}.."
         )
-        if default_downtime_replicas_for_namespace is None:
-            default_downtime_replicas_for_namespace = downtime_replicas
 
-        upscale_period_for_namespace = namespace_obj.annotations.get(
-            UPSCALE_PERIOD_ANNOTATION, upscale_period
-        )
-        downscale_period_for_namespace = namespace_obj.annotations.get(
-            DOWNSCALE_PERIOD_ANNOTATION, downscale_period
-        )
-        forced_uptime_value_for_namespace = str(
-            namespace_obj.annotations.get(FORCE_UPTIME_ANNOTATION, forced_uptime)
-        )
-        if forced_uptime_value_for_namespace.lower() == "true":
-            forced_uptime_for_namespace = True
-        elif forced_uptime_value_for_namespace.lower() == "false":
-            forced_uptime_for_namespace = False
-        elif forced_uptime_value_for_namespace:
-            forced_uptime_for_namespace = matches_time_spec(
-                now, forced_uptime_value_for_namespace
+        defaults = namespace_defaults.get(current_namespace)
+        if defaults is None:
+            namespace_obj = (namespaces or {}).get(current_namespace)
+            if namespace_obj is None:
+                # the namespace was not (yet) listed, e.g. because it was just created
+                namespace_obj = Namespace.objects(api).get_by_name(current_namespace)
+            defaults = get_namespace_defaults(
+                namespace_obj,
+                upscale_period,
+                downscale_period,
+                default_uptime,
+                default_downtime,
+                forced_uptime,
+                now,
+                downtime_replicas,
             )
-        else:
-            forced_uptime_for_namespace = False
+            namespace_defaults[current_namespace] = defaults
+            if time_specs is not None:
+                time_specs.update(get_namespace_time_specs(namespace_obj))
 
         for resource in resources:
-            autoscale_resource(
+            schedule = get_time_specs(resource, defaults)
+            if schedule_groups.add(schedule) and time_specs is not None:
+                time_specs.update(schedule)
+            future = autoscale_resource(
                 resource,
-                upscale_period_for_namespace,
-                downscale_period_for_namespace,
-                default_uptime_for_namespace,
-                default_downtime_for_namespace,
-                forced_uptime_for_namespace,
+                defaults.upscale_period,
+                defaults.downscale_period,
+                defaults.uptime,
+                defaults.downtime,
+                defaults.forced_uptime,
                 dry_run,
                 now,
                 grace_period,
-                default_downtime_replicas_for_namespace,
-                namespace_excluded=excluded,
+                defaults.downtime_replicas,
+                namespace_excluded=defaults.excluded,
                 deployment_time_annotation=deployment_time_annotation,
                 enable_events=enable_events,
+                executor=executor,
+                decision_cache=decision_cache,
+                event_emitter=event_emitter,
+                schedule_groups=schedule_groups,
+                is_leader=is_leader,
+                schedule=schedule,
+            )
+            if future:
+                pending_updates.append((resource, future))
+
+    metrics.PHASE_DURATION.observe(listed.seconds, phase="list", kind=kind.kind)
+    metrics.PHASE_DURATION.observe(
+        time.monotonic() - start - listed.seconds, phase="evaluate", kind=kind.kind
+    )
+    return pending_updates
+
+
+def get_namespace_names(namespace: Optional[str]) -> List[str]:
+    """Return the sorted names of a comma-separated list of namespaces, an empty list means all namespaces."""
+    return sorted(
+        {name.strip() for name in (namespace or "").split(",") if name.strip()}
+    )
+
+
+def get_namespaces(
+    api,
+    namespace: str,
+    informer: Optional[Informer] = None,
+    page_size: int = helper.DEFAULT_PAGE_SIZE,
+    namespace_selector: Optional[str] = None,
+) -> Dict[str, NamespacedAPIObject]:
+    """Return all relevant Namespace objects by name, using a single (paginated) LIST or GET call."""
+    if informer:
+        namespace_objs = informer.list()
+    elif namespace:
+        namespace_objs = [Namespace.objects(api).get_by_name(namespace)]
+    else:
+        params = {"labelSelector": namespace_selector} if namespace_selector else None
+        namespace_objs = (
+            Namespace(api, obj)
+            for obj in helper.list_objects(
+                api, Namespace, params=params, page_size=page_size
             )
+        )
+    return {namespace_obj.name: namespace_obj for namespace_obj in namespace_objs}
+
+
+def get_shard(namespace: str, shard_count: int) -> int:
+    """Return the shard of a namespace by jump consistent hash, i.e. only 1/n of the namespaces move when adding the n-th shard."""
+    key = int.from_bytes(
+        hashlib.blake2b(namespace.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+    shard, next_shard = -1, 0
+    while next_shard < shard_count:
+        shard = next_shard
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        next_shard = int((shard + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return shard
+
+
+def get_target_namespaces(
+    namespace: Optional[str],
+    namespaces: Optional[Dict[str, NamespacedAPIObject]] = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+) -> List[Optional[str]]:
+    """Return the namespaces to list resources in (None for all namespaces), the selected namespaces are passed in if a namespace selector (or sharding) is used."""
+    if namespaces is not None:
+        names = sorted(namespaces)
+    else:
+        names = get_namespace_names(namespace)
+        if not names:
+            return [None]
+    return [name for name in names if get_shard(name, shard_count) == shard_index]
 
 
 def scale(
@@ -461,16 +1080,137 @@ def scale(
     downtime_replicas: int = 0,
     deployment_time_annotation: Optional[str] = None,
     enable_events: bool = False,
-):
-    api = helper.get_kube_api()
+    informers: Optional[Dict[str, Informer]] = None,
+    max_concurrent_updates: int = 1,
+    api=None,
+    list_page_size: int = helper.DEFAULT_PAGE_SIZE,
+    decision_cache: Optional[DecisionCache] = None,
+    event_emitter: Optional[EventEmitter] = None,
+    label_selector: Optional[str] = None,
+    namespace_selector: Optional[str] = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    now: Optional[datetime.datetime] = None,
+    is_leader: Optional[Callable[[], bool]] = None,
+) -> Optional[datetime.datetime]:
+    """Scale all resources and return the next instant when any of the used time specs changes.
+
+    The namespace can be a comma-separated list of namespaces, alternatively namespaces
+    can be selected by label. Every namespace is then listed separately (and concurrently),
+    i.e. no cluster-wide LIST permission is needed for the resources.
+
+    With sharding, only the namespaces of the given shard are listed and processed.
+
+    With leader election, LeadershipLost aborts the loop iteration as soon as is_leader returns False before an update.
+    """
+    if api is None:
+        api = helper.get_kube_api()
+
+    start = time.monotonic()
+    # a fixed time is only given for the recorded loop iteration (and when replaying it)
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if decision_cache:
+        decision_cache.start_cycle(now)
+    kinds = [clazz for clazz in RESOURCE_CLASSES if clazz.endpoint in include_resources]
+
+    def check_pods(target_namespace):
+        with metrics.PHASE_DURATION.time(phase="pods", kind=pykube.Pod.kind):
+            return pods_force_uptime(
+                api,
+                target_namespace,
+                informers.get("pods") if informers else None,
+                list_page_size,
+            )
+
+    def list_namespaces(target_namespace):
+        with metrics.PHASE_DURATION.time(phase="namespaces", kind=Namespace.kind):
+            try:
+                return get_namespaces(
+                    api,
+                    target_namespace,
+                    informers.get("namespaces") if informers else None,
+                    list_page_size,
+                    namespace_selector,
+                )
+            except pykube.exceptions.ObjectDoesNotExist:
+                if len(names) < 2:
+                    raise
+                # do not fail all other namespaces of the list
+                logger.warning(f"Namespace {target_namespace} does not exist")
+                return {}
+
+    names = get_namespace_names(namespace)
+    selected = None
+    if namespace_selector or (shard_count > 1 and not names):
+        # the selected namespaces must be known before their resources can be listed
+        selected = list_namespaces(None)
+    targets = (
+        [None]
+        if informers
+        else get_target_namespaces(namespace, selected, shard_index, shard_count)
+    )
+    pod_targets = targets
+    if shard_count > 1 and not informers:
+        # pods in any of the namespaces (not only the shard's) force the uptime, same as without sharding
+        pod_targets = get_target_namespaces(
+            namespace, selected if namespace_selector else None
+        )
 
-    now = datetime.datetime.now(datetime.timezone.utc)
-    forced_uptime = pods_force_uptime(api, namespace)
+    # all LIST calls run concurrently, the cycle only waits for the slowest one,
+    # the number of threads (and connections) is bounded by the connection pool size
+    jobs = (len(kinds) + 1) * len(targets) + len(pod_targets)
+    fetcher = ThreadPoolExecutor(
+        max_workers=max(1, min(jobs, helper.DEFAULT_POOL_SIZE)),
+        thread_name_prefix="fetch",
+    )
+    # the blocking prefetchers are submitted last, i.e. they can not starve these
+    forced_uptime_futures = [
+        fetcher.submit(check_pods, target) for target in pod_targets
+    ]
+    namespaces_futures = (
+        []
+        if selected is not None
+        else [fetcher.submit(list_namespaces, target) for target in targets]
+    )
+    # excluded resources are filtered by the API server (as far as possible)
+    params = get_list_params(exclude_namespaces, exclude_deployments, label_selector)
+    prefetchers: Dict[str, List[helper.Prefetcher]] = {}
+    for clazz in kinds:
+        if not (informers and clazz.endpoint in informers):
+            # the namespaces are processed in order, one after another
+            prefetchers[clazz.endpoint] = [
+                helper.Prefetcher(
+                    helper.list_pages(
+                        api, clazz, target, params=params, page_size=list_page_size
+                    ),
+                    fetcher,
+                )
+                for target in targets
+            ]
+
+    # decisions are made one after another, but API updates can run in parallel
+    executor = None
+    if max_concurrent_updates > 1:
+        # queued updates are sent by priority (scale-ups first)
+        executor = PriorityExecutor(
+            max_workers=max_concurrent_updates, thread_name_prefix="update"
+        )
+
+    pending_updates: List[Tuple[NamespacedAPIObject, Future]] = []
+    time_specs: Set[str] = set()
+    # shared by all kinds, resources of different kinds often have the same schedule
+    schedule_groups = ScheduleGroups(now)
+    try:
+        forced_uptime = any([future.result() for future in forced_uptime_futures])
+        # Namespace annotations are resolved once per loop iteration and shared by all kinds
+        namespaces = selected or {}
+        for future in namespaces_futures:
+            namespaces.update(future.result())
+        namespace_defaults: Dict[str, NamespaceDefaults] = {}
 
-    for clazz in RESOURCE_CLASSES:
-        plural = clazz.endpoint
-        if plural in include_resources:
-            autoscale_resources(
+        for clazz in kinds:
+            plural = clazz.endpoint
+            pending_updates += autoscale_resources(
                 api,
                 clazz,
                 namespace,
@@ -487,4 +1227,39 @@ def scale(
                 downtime_replicas,
                 deployment_time_annotation,
                 enable_events,
+                informer=informers.get(plural) if informers else None,
+                namespaces=namespaces,
+                namespace_defaults=namespace_defaults,
+                executor=executor,
+                time_specs=time_specs,
+                page_size=list_page_size,
+                pages=(
+                    itertools.chain.from_iterable(prefetchers[plural])
+                    if plural in prefetchers
+                    else None
+                ),
+                decision_cache=decision_cache,
+                event_emitter=event_emitter,
+                shard_index=shard_index,
+                shard_count=shard_count,
+                schedule_groups=schedule_groups,
+                is_leader=is_leader,
             )
+    finally:
+        # queued LIST calls are cancelled, e.g. if processing an earlier kind failed
+        for future in forced_uptime_futures + namespaces_futures:
+            future.cancel()
+        for prefetcher in itertools.chain.from_iterable(prefetchers.values()):
+            prefetcher.close()
+        fetcher.shutdown()
+        with metrics.PHASE_DURATION.time(phase="updates", kind=""):
+            wait_for_updates(pending_updates)
+        if executor:
+            executor.shutdown()
+
+    metrics.CYCLE_DURATION.observe(time.monotonic() - start)
+    metrics.LAST_SUCCESSFUL_CYCLE.set(time.time())
+    next_transition = get_next_transition(now, time_specs)
+    if decision_cache:
+        decision_cache.end_cycle(next_transition)
+    return next_transition
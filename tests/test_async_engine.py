@@ -0,0 +1,407 @@
+import asyncio
+import re
+
+import pykube
+import pytest
+from pykube import Deployment
+
+from kube_downscaler.events import EVENTS_API
+from kube_downscaler.leader import LeadershipLost
+from kube_downscaler.scaler import ORIGINAL_REPLICAS_ANNOTATION
+
+pytest.importorskip("aiohttp")
+
+from kube_downscaler import async_engine  # noqa: E402
+from kube_downscaler.async_engine import APIError  # noqa: E402
+from kube_downscaler.async_engine import AsyncKubeClient  # noqa: E402
+
+
+class FakeClient(AsyncKubeClient):
+    def __init__(self, responses):
+        super().__init__(pykube.KubeConfig.from_url("http://localhost:8080"), 1)
+        self.responses = responses
+        self.calls = []
+
+    async def request(self, method, path, params=None, headers=None, data=None, **kw):
+        self.calls.append((method, path, params, data))
+        response = self.responses.get((method, path), {"items": []})
+        if isinstance(response, list):
+            response = response.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def scale(client, **kwargs):
+    args = dict(
+        namespace=None,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=frozenset([re.compile("kube-system")]),
+        exclude_deployments=frozenset(["kube-downscaler"]),
+        dry_run=False,
+        grace_period=0,
+        max_concurrent_updates=4,
+    )
+    args.update(kwargs)
+    return run(async_engine.scale(client, **args))
+
+
+def get_deployments():
+    return {
+        "items": [
+            {
+                "metadata": {
+                    "name": "deploy-1",
+                    "namespace": "default",
+                    "creationTimestamp": "2019-03-01T16:38:00Z",
+                },
+                "spec": {"replicas": 2},
+            },
+            {
+                "metadata": {
+                    "name": "kube-downscaler",
+                    "namespace": "default",
+                    "creationTimestamp": "2019-03-01T16:38:00Z",
+                },
+                "spec": {"replicas": 1},
+            },
+            {
+                "metadata": {
+                    "name": "coredns",
+                    "namespace": "kube-system",
+                    "creationTimestamp": "2019-03-01T16:38:00Z",
+                },
+                "spec": {"replicas": 2},
+            },
+        ]
+    }
+
+
+def test_get_path():
+    assert (
+        async_engine.get_path(Deployment, "default", "my-deploy")
+        == "/apis/apps/v1/namespaces/default/deployments/my-deploy"
+    )
+    assert async_engine.get_path(pykube.Namespace) == "/api/v1/namespaces"
+    assert (
+        async_engine.get_path(pykube.Pod, "default")
+        == "/api/v1/namespaces/default/pods"
+    )
+
+
+def test_get_auth_headers():
+    config = pykube.KubeConfig.from_url("https://localhost:9443")
+    assert async_engine.get_auth_headers(config) == {}
+    config = pykube.KubeConfig(
+        {
+            "clusters": [{"name": "c", "cluster": {"server": "https://localhost"}}],
+            "users": [{"name": "u", "user": {"token": "my-token"}}],
+            "contexts": [{"name": "ctx", "context": {"cluster": "c", "user": "u"}}],
+            "current-context": "ctx",
+        }
+    )
+    assert async_engine.get_auth_headers(config) == {"Authorization": "Bearer my-token"}
+
+
+@pytest.mark.parametrize(
+    "user",
+    [
+        {"exec": {"apiVersion": "client.authentication.k8s.io/v1beta1"}},
+        {"auth-provider": {"name": "oidc", "config": {}}},
+    ],
+)
+def test_get_auth_headers_unsupported(user):
+    config = pykube.KubeConfig(
+        {
+            "clusters": [{"name": "c", "cluster": {"server": "https://localhost"}}],
+            "users": [{"name": "u", "user": user}],
+            "contexts": [{"name": "ctx", "context": {"cluster": "c", "user": "u"}}],
+            "current-context": "ctx",
+        }
+    )
+    # the requests would be sent without any credentials
+    with pytest.raises(ValueError, match="not supported by --engine=async"):
+        AsyncKubeClient(config, 1)
+
+
+def test_list_pages_continue():
+    client = FakeClient(
+        {
+            ("GET", "/api/v1/namespaces"): [
+                {
+                    "metadata": {"continue": "abc"},
+                    "items": [{"metadata": {"name": "a"}}],
+                },
+                {"metadata": {}, "items": [{"metadata": {"name": "b"}}]},
+            ]
+        }
+    )
+
+    async def list_all():
+        return [page async for page in client.list_pages(pykube.Namespace, page_size=1)]
+
+    pages = run(list_all())
+    assert [page["items"][0]["metadata"]["name"] for page in pages] == ["a", "b"]
+    assert client.calls[1][2] == {"limit": 1, "continue": "abc"}
+
+
+def test_list_pages_expired_continue_token():
+    client = FakeClient(
+        {
+            ("GET", "/api/v1/namespaces"): [
+                {"metadata": {"continue": "abc"}, "items": []},
+                APIError(410, "expired", {"metadata": {"continue": "def"}}),
+                {"metadata": {}, "items": [{"metadata": {"name": "b"}}]},
+            ]
+        }
+    )
+
+    async def list_all():
+        return [page async for page in client.list_pages(pykube.Namespace)]
+
+    pages = run(list_all())
+    assert len(pages) == 2
+    assert client.calls[2][2]["continue"] == "def"
+
+
+def test_scale_down():
+    client = FakeClient(
+        {
+            ("GET", "/apis/apps/v1/deployments"): get_deployments(),
+            ("GET", "/api/v1/namespaces"): {
+                "items": [
+                    {"metadata": {"name": "default"}},
+                    {"metadata": {"name": "kube-system"}},
+                ]
+            },
+        }
+    )
+    scale(client)
+
+    patches = [call for call in client.calls if call[0] == "PATCH"]
+    assert patches == [
+        (
+            "PATCH",
+            "/apis/apps/v1/namespaces/default/deployments/deploy-1",
+            None,
+            {
+                "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: "2"}},
+                "spec": {"replicas": 0},
+            },
+        )
+    ]
+
+
+def test_scale_down_dry_run():
+    client = FakeClient(
+        {
+            ("GET", "/apis/apps/v1/deployments"): get_deployments(),
+            ("GET", "/api/v1/namespaces"): {
+                "items": [{"metadata": {"name": "default"}}]
+            },
+        }
+    )
+    scale(client, dry_run=True)
+
+    assert [call for call in client.calls if call[0] != "GET"] == []
+
+
+def test_scale_down_with_event():
+    client = FakeClient(
+        {
+            ("GET", "/apis/apps/v1/deployments"): get_deployments(),
+            ("GET", "/api/v1/namespaces"): {
+                "items": [{"metadata": {"name": "default"}}]
+            },
+            ("POST", "/api/v1/namespaces/default/events"): {
+                "metadata": {"name": "kube-downscaler-abc"}
+            },
+        }
+    )
+    scale(client, enable_events=True)
+
+    # events are not listed before creating them
+    assert [path for _, path, _, _ in client.calls if path.endswith("/events")] == [
+        "/api/v1/namespaces/default/events"
+    ]
+    posts = [call for call in client.calls if call[0] == "POST"]
+    assert len(posts) == 1
+    method, path, _, event = posts[0]
+    assert path == "/api/v1/namespaces/default/events"
+    assert event["reason"] == "ScaleDown"
+    assert event["message"] == "Scaling down replicas"
+    assert event["involvedObject"]["name"] == "deploy-1"
+
+
+def test_event_emitter_updates_created_event():
+    client = FakeClient(
+        {
+            ("GET", "/apis/apps/v1/deployments"): get_deployments(),
+            ("GET", "/api/v1/namespaces"): {
+                "items": [{"metadata": {"name": "default"}}]
+            },
+            ("POST", "/api/v1/namespaces/default/events"): {
+                "metadata": {"name": "kube-downscaler-abc"}
+            },
+        }
+    )
+    emitter = async_engine.AsyncEventEmitter(client)
+    scale(client, enable_events=True, event_emitter=emitter)
+    # e.g. the deployment was scaled up again by someone else
+    scale(client, enable_events=True, event_emitter=emitter)
+
+    writes = [
+        (method, path, data)
+        for method, path, _, data in client.calls
+        if path.startswith("/api/v1/namespaces/default/events")
+    ]
+    assert [(method, path) for method, path, _ in writes] == [
+        ("POST", "/api/v1/namespaces/default/events"),
+        ("PATCH", "/api/v1/namespaces/default/events/kube-downscaler-abc"),
+    ]
+    assert writes[1][2]["count"] == 2
+
+
+def test_event_emitter_events_api():
+    client = FakeClient(
+        {
+            ("GET", "/apis/apps/v1/deployments"): get_deployments(),
+            ("GET", "/api/v1/namespaces"): {
+                "items": [{"metadata": {"name": "default"}}]
+            },
+            ("POST", "/apis/events.k8s.io/v1/namespaces/default/events"): {
+                "metadata": {"name": "kube-downscaler-abc"}
+            },
+        }
+    )
+    emitter = async_engine.AsyncEventEmitter(client, EVENTS_API)
+    scale(client, enable_events=True, event_emitter=emitter)
+
+    posts = [call for call in client.calls if call[0] == "POST"]
+    assert len(posts) == 1
+    method, path, _, event = posts[0]
+    assert path == "/apis/events.k8s.io/v1/namespaces/default/events"
+    assert event["note"] == "Scaling down replicas"
+    assert event["regarding"]["name"] == "deploy-1"
+
+
+def test_scale_update_failure_does_not_stop_cycle():
+    client = FakeClient(
+        {
+            ("GET", "/apis/apps/v1/deployments"): get_deployments(),
+            ("GET", "/api/v1/namespaces"): {
+                "items": [{"metadata": {"name": "default"}}]
+            },
+            (
+                "PATCH",
+                "/apis/apps/v1/namespaces/default/deployments/deploy-1",
+            ): APIError(409, "conflict", {}),
+        }
+    )
+    # the failed update is logged and does not abort the cycle
+    scale(client)
+
+    assert [call[0] for call in client.calls].count("PATCH") == 1
+
+
+def test_scale_leadership_lost():
+    client = FakeClient(
+        {
+            ("GET", "/apis/apps/v1/deployments"): get_deployments(),
+            ("GET", "/api/v1/namespaces"): {
+                "items": [{"metadata": {"name": "default"}}]
+            },
+        }
+    )
+    with pytest.raises(LeadershipLost):
+        scale(client, is_leader=lambda: False)
+
+    assert [call for call in client.calls if call[0] != "GET"] == []
+
+
+def test_scale_namespace_list():
+    deployment = get_deployments()["items"][0]
+    client = FakeClient(
+        {
+            ("GET", "/api/v1/namespaces/team-a"): {"metadata": {"name": "team-a"}},
+            ("GET", "/apis/apps/v1/namespaces/team-a/deployments"): {
+                "items": [
+                    {
+                        **deployment,
+                        "metadata": {**deployment["metadata"], "namespace": "team-a"},
+                    }
+                ]
+            },
+            ("GET", "/api/v1/namespaces/team-b"): APIError(404, "not found", {}),
+        }
+    )
+    scale(client, namespace="team-b,team-a")
+
+    paths = sorted(path for method, path, _, _ in client.calls if method == "GET")
+    assert paths == [
+        "/api/v1/namespaces/team-a",
+        "/api/v1/namespaces/team-a/pods",
+        "/api/v1/namespaces/team-b",
+        "/api/v1/namespaces/team-b/pods",
+        "/apis/apps/v1/namespaces/team-a/deployments",
+        "/apis/apps/v1/namespaces/team-b/deployments",
+    ]
+    patches = [path for method, path, _, _ in client.calls if method == "PATCH"]
+    assert patches == ["/apis/apps/v1/namespaces/team-a/deployments/deploy-1"]
+
+
+def test_client_retry_after(monkeypatch):
+    client = AsyncKubeClient(pykube.KubeConfig.from_url("http://localhost:8080"), 1)
+    error = APIError(429, "too many requests", {})
+    error.retry_after = 0.01
+    responses = [error, {"kind": "Deployment"}]
+    calls = []
+
+    async def request(method, path, kwargs):
+        calls.append((method, path))
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(client, "_request", request)
+
+    assert run(client.request("PATCH", "/apis/apps/v1/deployments")) == {
+        "kind": "Deployment"
+    }
+    assert len(calls) == 2
+
+
+def test_scale_shard_namespace_selector():
+    names = [f"team-{i}" for i in range(10)]
+    own = [name for name in names if async_engine.get_shard(name, 3) == 1]
+    client = FakeClient(
+        {
+            ("GET", "/api/v1/namespaces"): {
+                "items": [{"metadata": {"name": name}} for name in names]
+            }
+        }
+    )
+    scale(client, namespace_selector="team", shard_index=1, shard_count=3)
+
+    paths = [path for method, path, _, _ in client.calls if method == "GET"]
+    assert own
+    # pods are checked in all selected namespaces, not only in the shard's
+    assert sorted(path for path in paths if path.endswith("/pods")) == sorted(
+        f"/api/v1/namespaces/{name}/pods" for name in names
+    )
+    assert sorted(path for path in paths if path.endswith("/deployments")) == sorted(
+        f"/apis/apps/v1/namespaces/{name}/deployments" for name in own
+    )
@@ -1,6 +1,7 @@
 import json
 import logging
 from datetime import datetime
+from datetime import timedelta
 from datetime import timezone
 from unittest.mock import MagicMock
 
@@ -9,14 +10,34 @@ import pytest
 from pykube import Deployment
 from pykube import HorizontalPodAutoscaler
 
+from kube_downscaler.leader import LeadershipLost
 from kube_downscaler.resources.stack import Stack
+from kube_downscaler.scaler import Action
 from kube_downscaler.scaler import autoscale_resource
+from kube_downscaler.scaler import decide
+from kube_downscaler.scaler import DECISION_CACHE_MAX_AGE_SECONDS
+from kube_downscaler.scaler import DecisionCache
 from kube_downscaler.scaler import DOWNSCALE_PERIOD_ANNOTATION
 from kube_downscaler.scaler import DOWNTIME_REPLICAS_ANNOTATION
 from kube_downscaler.scaler import EXCLUDE_ANNOTATION
 from kube_downscaler.scaler import EXCLUDE_UNTIL_ANNOTATION
+from kube_downscaler.scaler import evaluate_schedule
+from kube_downscaler.scaler import EXCLUDED
+from kube_downscaler.scaler import get_action
+from kube_downscaler.scaler import get_next_transition
+from kube_downscaler.scaler import get_time_specs
+from kube_downscaler.scaler import GRACE_PERIOD
+from kube_downscaler.scaler import NamespaceDefaults
+from kube_downscaler.scaler import NO_ACTION
 from kube_downscaler.scaler import ORIGINAL_REPLICAS_ANNOTATION
+from kube_downscaler.scaler import SCALE_DOWN
+from kube_downscaler.scaler import SCALE_UP
+from kube_downscaler.scaler import Schedule
+from kube_downscaler.scaler import ScheduleGroups
+from kube_downscaler.scaler import ScheduleResult
+from kube_downscaler.scaler import update_resource
 from kube_downscaler.scaler import UPSCALE_PERIOD_ANNOTATION
+from kube_downscaler.scaler import wait_for_updates
 
 
 @pytest.fixture
@@ -41,7 +62,7 @@ def test_swallow_exception(monkeypatch, resource, caplog):
         resource, "never", "never", "never", "always", False, False, now, 0, 0
     )
     assert resource.replicas == 1
-    resource.update.assert_not_called()
+    resource.patch.assert_not_called()
     # check that the failure was logged
     msg = "Failed to process MockResource mock/res-1: time data 'invalid-timestamp!' does not match any format (%Y-%m-%dT%H:%M:%SZ, %Y-%m-%dT%H:%M, %Y-%m-%d %H:%M, %Y-%m-%d)"
     assert caplog.record_tuples == [("kube_downscaler.scaler", logging.ERROR, msg)]
@@ -72,7 +93,7 @@ def test_swallow_exception_with_event(monkeypatch, resource, caplog):
         enable_events=True,
     )
     assert resource.replicas == 1
-    resource.update.assert_not_called()
+    resource.patch.assert_not_called()
     # check that the failure was logged
     msg = "Failed to process MockResource mock/res-1: time data 'invalid-timestamp!' does not match any format (%Y-%m-%dT%H:%M:%SZ, %Y-%m-%dT%H:%M, %Y-%m-%d %H:%M, %Y-%m-%d)"
     assert caplog.record_tuples == [("kube_downscaler.scaler", logging.ERROR, msg)]
@@ -89,7 +110,7 @@ def test_exclude(resource):
         resource, "never", "never", "never", "always", False, False, now, 0, 0
     )
     assert resource.replicas == 1
-    resource.update.assert_not_called()
+    resource.patch.assert_not_called()
     assert ORIGINAL_REPLICAS_ANNOTATION not in resource.annotations
 
 
@@ -114,7 +135,7 @@ def test_exclude_until_invalid_time(resource, caplog):
     assert resource.replicas == 0
     assert resource.annotations[ORIGINAL_REPLICAS_ANNOTATION] == "1"
     # dry run will update the object properties, but won't call the Kubernetes API (update)
-    resource.update.assert_not_called()
+    resource.patch.assert_not_called()
 
     # check that the warning was logged
     msg = "Invalid annotation value for 'downscaler/exclude-until' on mock/res-1: time data 'some-invalid-timestamp' does not match any format (%Y-%m-%dT%H:%M:%SZ, %Y-%m-%dT%H:%M, %Y-%m-%d %H:%M, %Y-%m-%d)"
@@ -144,7 +165,7 @@ def test_dry_run(resource):
     assert resource.replicas == 0
     assert resource.annotations[ORIGINAL_REPLICAS_ANNOTATION] == "1"
     # dry run will update the object properties, but won't call the Kubernetes API (update)
-    resource.update.assert_not_called()
+    resource.patch.assert_not_called()
 
 
 def test_grace_period(resource):
@@ -170,7 +191,7 @@ def test_grace_period(resource):
     )
     assert resource.replicas == 1
     assert resource.annotations == {}
-    resource.update.assert_not_called()
+    resource.patch.assert_not_called()
 
 
 def test_downtime_always(resource):
@@ -184,7 +205,7 @@ def test_downtime_always(resource):
         resource, "never", "never", "never", "always", False, False, now, 0, 0
     )
     assert resource.replicas == 0
-    resource.update.assert_called_once()
+    resource.patch.assert_called_once()
     assert resource.annotations[ORIGINAL_REPLICAS_ANNOTATION] == "1"
 
 
@@ -208,7 +229,7 @@ def test_downtime_interval(resource):
         0,
     )
     assert resource.replicas == 0
-    resource.update.assert_called_once()
+    resource.patch.assert_called_once()
     assert resource.annotations[ORIGINAL_REPLICAS_ANNOTATION] == "1"
 
 
@@ -232,7 +253,7 @@ def test_forced_uptime(resource):
         0,
     )
     assert resource.replicas == 1
-    resource.update.assert_not_called()
+    resource.patch.assert_not_called()
 
 
 def test_autoscale_bad_resource():
@@ -271,7 +292,7 @@ def test_scale_up(resource):
         0,
     )
     assert resource.replicas == 3
-    resource.update.assert_called_once()
+    resource.patch.assert_called_once()
 
 
 def test_scale_up_downtime_replicas_annotation(resource):
@@ -298,7 +319,7 @@ def test_scale_up_downtime_replicas_annotation(resource):
         1,
     )
     assert resource.replicas == 1
-    resource.update.assert_called_once()
+    resource.patch.assert_called_once()
 
 
 def test_downtime_replicas_annotation_invalid(resource):
@@ -312,7 +333,7 @@ def test_downtime_replicas_annotation_invalid(resource):
         resource, "never", "never", "never", "always", False, False, now, 0, 0
     )
     assert resource.replicas == 2
-    resource.update.assert_not_called()
+    resource.patch.assert_not_called()
 
 
 def test_downtime_replicas_annotation_valid(resource):
@@ -326,7 +347,7 @@ def test_downtime_replicas_annotation_valid(resource):
         resource, "never", "never", "never", "always", False, False, now, 0, 0
     )
     assert resource.replicas == 1
-    resource.update.assert_called_once()
+    resource.patch.assert_called_once()
     assert resource.annotations[ORIGINAL_REPLICAS_ANNOTATION] == "2"
 
 
@@ -340,7 +361,7 @@ def test_downtime_replicas_invalid(resource):
         resource, "never", "never", "never", "always", False, False, now, 0, "x"
     )
     assert resource.replicas == 2
-    resource.update.assert_not_called()
+    resource.patch.assert_not_called()
 
 
 def test_downtime_replicas_valid(resource):
@@ -353,7 +374,7 @@ def test_downtime_replicas_valid(resource):
         resource, "never", "never", "never", "always", False, False, now, 0, 1
     )
     assert resource.replicas == 1
-    resource.update.assert_called_once()
+    resource.patch.assert_called_once()
 
 
 def test_set_annotation():
@@ -377,11 +398,7 @@ def test_set_annotation():
     patch_data = json.loads(api.patch.call_args[1]["data"])
     # ensure the original replicas annotation is send to the server
     assert patch_data == {
-        "metadata": {
-            "name": "foo",
-            "creationTimestamp": "2019-03-15T21:55:00Z",
-            "annotations": {ORIGINAL_REPLICAS_ANNOTATION: "1"},
-        },
+        "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: "1"}},
         "spec": {"replicas": 0},
     }
 
@@ -397,7 +414,7 @@ def test_downscale_always(resource):
         resource, "never", "always", "always", "never", False, False, now, 0, 0
     )
     assert resource.replicas == 0
-    resource.update.assert_called_once()
+    resource.patch.assert_called_once()
     assert resource.annotations[ORIGINAL_REPLICAS_ANNOTATION] == "1"
 
 
@@ -421,7 +438,7 @@ def test_downscale_period(resource):
         0,
     )
     assert resource.replicas == 0
-    resource.update.assert_called_once()
+    resource.patch.assert_called_once()
     assert resource.annotations[ORIGINAL_REPLICAS_ANNOTATION] == "1"
 
 
@@ -445,7 +462,7 @@ def test_downscale_period_overlaps(resource):
         0,
     )
     assert resource.replicas == 2
-    resource.update.assert_not_called()
+    resource.patch.assert_not_called()
 
 
 def test_downscale_period_not_match(resource):
@@ -468,7 +485,7 @@ def test_downscale_period_not_match(resource):
         0,
     )
     assert resource.replicas == 2
-    resource.update.assert_not_called()
+    resource.patch.assert_not_called()
 
 
 def test_downscale_period_resource_overrides_never(resource):
@@ -484,7 +501,7 @@ def test_downscale_period_resource_overrides_never(resource):
         resource, "never", "never", "always", "never", False, False, now, 0, 0
     )
     assert resource.replicas == 0
-    resource.update.assert_called_once()
+    resource.patch.assert_called_once()
 
 
 def test_downscale_period_resource_overrides_namespace(resource):
@@ -509,7 +526,7 @@ def test_downscale_period_resource_overrides_namespace(resource):
         0,
     )
     assert resource.replicas == 0
-    resource.update.assert_called_once()
+    resource.patch.assert_called_once()
 
 
 def test_upscale_period_resource_overrides_never(resource):
@@ -575,7 +592,7 @@ def test_downscale_stack_deployment_ignored():
         resource, "never", "never", "never", "always", False, False, now, 0, 0
     )
     assert resource.replicas == 1
-    resource.update.assert_not_called()
+    resource.patch.assert_not_called()
     assert ORIGINAL_REPLICAS_ANNOTATION not in resource.annotations
 
 
@@ -596,7 +613,7 @@ def test_downscale_replicas_not_zero(resource):
     )
     assert resource.replicas == 1
     assert resource.annotations[ORIGINAL_REPLICAS_ANNOTATION] == "3"
-    resource.update.assert_called_once()
+    resource.patch.assert_called_once()
 
 
 def test_downscale_stack_with_autoscaling():
@@ -724,3 +741,512 @@ def test_upscale_hpa_with_autoscaling():
     )
     assert hpa.obj["spec"]["minReplicas"] == 4
     assert hpa.obj["metadata"]["annotations"][ORIGINAL_REPLICAS_ANNOTATION] is None
+
+
+def test_scale_down_with_executor(resource):
+    resource.annotations = {}
+    resource.replicas = 1
+    now = datetime.strptime("2018-10-23T21:56:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    resource.metadata = {"creationTimestamp": "2018-10-23T21:55:00Z"}
+    executor = MagicMock()
+    future = autoscale_resource(
+        resource,
+        "never",
+        "never",
+        "never",
+        "always",
+        False,
+        False,
+        now,
+        executor=executor,
+    )
+    assert resource.replicas == 0
+    assert future == executor.submit.return_value
+    executor.submit.assert_called_once()
+    func, updated, patch, is_leader = executor.submit.call_args[0]
+    assert func == update_resource
+    assert updated is resource
+    assert is_leader is None
+    assert patch["metadata"] == {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: "1"}}
+    # the update is only done by the executor
+    resource.patch.assert_not_called()
+
+
+def test_scale_down_leadership_lost(resource):
+    resource.annotations = {}
+    resource.replicas = 1
+    now = datetime.strptime("2018-10-23T21:56:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    resource.metadata = {"creationTimestamp": "2018-10-23T21:55:00Z"}
+    with pytest.raises(LeadershipLost):
+        autoscale_resource(
+            resource,
+            "never",
+            "never",
+            "never",
+            "always",
+            False,
+            False,
+            now,
+            is_leader=lambda: False,
+        )
+    assert resource.replicas == 1
+    resource.patch.assert_not_called()
+
+
+def test_update_resource_leadership_lost(resource):
+    leading = [True, False]
+    update_resource(resource, {}, lambda: leading.pop(0))
+    resource.patch.assert_called_once_with({})
+
+    # e.g. the update was queued while the leadership was lost
+    with pytest.raises(LeadershipLost):
+        update_resource(resource, {}, lambda: leading.pop(0))
+    resource.patch.assert_called_once()
+
+
+def test_wait_for_updates(resource, caplog):
+    caplog.set_level(logging.ERROR)
+    future1 = MagicMock()
+    future1.result.side_effect = Exception("update failed")
+    future2 = MagicMock()
+    resource2 = MagicMock()
+    resource2.kind = "MockResource"
+    resource2.namespace = "mock"
+    resource2.name = "res-2"
+
+    wait_for_updates([(resource, future1), (resource2, future2)])
+
+    future1.result.assert_called_once()
+    future2.result.assert_called_once()
+    assert caplog.record_tuples == [
+        (
+            "kube_downscaler.scaler",
+            logging.ERROR,
+            "Failed to process MockResource mock/res-1: update failed",
+        )
+    ]
+
+
+def test_scale_patch_cronjob():
+    api = MagicMock()
+    cronjob = pykube.CronJob(
+        api,
+        {
+            "metadata": {
+                "name": "my-cronjob",
+                "namespace": "my-ns",
+                "creationTimestamp": "2018-10-23T21:55:00Z",
+            },
+            "spec": {"suspend": False, "jobTemplate": {"spec": {}}},
+        },
+    )
+    now = datetime.strptime("2018-10-23T22:15:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    autoscale_resource(
+        cronjob,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        forced_uptime=False,
+        dry_run=False,
+        now=now,
+    )
+    api.patch.assert_called_once()
+    assert api.patch.call_args[1]["url"] == "/cronjobs/my-cronjob"
+    assert json.loads(api.patch.call_args[1]["data"]) == {
+        "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: "1"}},
+        "spec": {"suspend": True},
+    }
+
+
+def test_scale_patch_stack_with_autoscaling():
+    api = MagicMock()
+    stack = Stack(
+        api,
+        {
+            "metadata": {
+                "name": "my-stack",
+                "namespace": "my-ns",
+                "creationTimestamp": "2018-10-23T21:55:00Z",
+                "annotations": {ORIGINAL_REPLICAS_ANNOTATION: "4"},
+            },
+            "spec": {"autoscaler": {"maxReplicas": 4}, "replicas": 0},
+        },
+    )
+    now = datetime.strptime("2018-10-23T21:56:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    autoscale_resource(
+        stack,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="always",
+        default_downtime="never",
+        forced_uptime=False,
+        dry_run=False,
+        now=now,
+    )
+    api.patch.assert_called_once()
+    # "null" removes the fields with a JSON merge patch
+    assert json.loads(api.patch.call_args[1]["data"]) == {
+        "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: None}},
+        "spec": {"replicas": None},
+    }
+    assert (
+        api.patch.call_args[1]["headers"]["Content-Type"]
+        == "application/merge-patch+json"
+    )
+
+
+def get_defaults(**kwargs):
+    defaults = dict(
+        excluded=False,
+        upscale_period="never",
+        downscale_period="never",
+        uptime="never",
+        downtime="always",
+        downtime_replicas=0,
+        forced_uptime=False,
+    )
+    defaults.update(kwargs)
+    return NamespaceDefaults(**defaults)
+
+
+def test_decide_scale_down_does_not_modify_resource(resource):
+    resource.replicas = 2
+    resource.metadata = {"creationTimestamp": "2018-10-23T21:55:00Z"}
+    now = datetime.strptime("2018-10-23T21:56:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    action = decide(resource, get_defaults(), now)
+    assert action == Action(SCALE_DOWN, 2, 0, "never", "always")
+    assert resource.replicas == 2
+    assert resource.annotations == {}
+    resource.patch.assert_not_called()
+
+
+def test_decide_scale_up(resource):
+    resource.replicas = 0
+    resource.annotations = {ORIGINAL_REPLICAS_ANNOTATION: "3"}
+    now = datetime.strptime("2018-10-23T21:56:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    action = decide(resource, get_defaults(uptime="always", downtime="never"), now)
+    assert action == Action(SCALE_UP, 0, 3, "always", "never")
+
+
+def test_decide_grace_period(resource):
+    resource.replicas = 2
+    resource.metadata = {"creationTimestamp": "2018-10-23T21:55:00Z"}
+    now = datetime.strptime("2018-10-23T21:56:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    action = decide(resource, get_defaults(), now, grace_period=300)
+    assert action.type == GRACE_PERIOD
+    assert action.target_replicas == 2
+
+
+def test_decide_excluded_and_no_action(resource):
+    resource.replicas = 2
+    now = datetime.strptime("2018-10-23T21:56:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    assert decide(resource, get_defaults(excluded=True), now) == Action(EXCLUDED)
+    action = decide(resource, get_defaults(uptime="always", downtime="never"), now)
+    assert action.type == NO_ACTION
+
+
+def test_evaluate_schedule():
+    now = datetime.strptime("2018-10-23T21:56:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    assert evaluate_schedule(
+        Schedule("never", "never", "always", "never"), now
+    ) == ScheduleResult(False, True, "always", "never")
+    assert evaluate_schedule(
+        Schedule("never", "never", "always", "always"), now
+    ) == ScheduleResult(False, False, "always", "always")
+    # periods take precedence over uptime/downtime
+    assert evaluate_schedule(
+        Schedule("never", "always", "always", "never"), now
+    ) == ScheduleResult(False, False, "never", "always")
+    # overlapping periods
+    assert evaluate_schedule(
+        Schedule("always", "always", "always", "never"), now
+    ) == ScheduleResult(True, True, "always", "always")
+    # outside of all periods
+    assert evaluate_schedule(
+        Schedule("Sat-Sun 00:00-01:00 UTC", "never", "always", "never"), now
+    ).ignore
+
+
+def test_schedule_groups(monkeypatch):
+    evaluate = MagicMock(return_value=ScheduleResult(False, True, "always", "never"))
+    monkeypatch.setattr("kube_downscaler.scaler.evaluate_schedule", evaluate)
+    now = datetime.strptime("2018-10-23T21:56:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    groups = ScheduleGroups(now)
+    schedule = Schedule("never", "never", "always", "never")
+
+    assert groups.add(schedule)
+    assert not groups.add(Schedule("never", "never", "always", "never"))
+    assert groups.add(Schedule("never", "never", "never", "always"))
+    assert len(groups) == 2
+    for _ in range(3):
+        assert groups.evaluate(schedule).is_uptime
+
+    evaluate.assert_called_once_with(schedule, now)
+
+
+def test_decide_with_schedule_groups(resource):
+    resource.replicas = 2
+    resource.metadata = {"creationTimestamp": "2018-10-23T21:55:00Z"}
+    now = datetime.strptime("2018-10-23T21:56:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    groups = ScheduleGroups(now)
+    for defaults in (
+        get_defaults(),
+        get_defaults(uptime="always", downtime="never"),
+        get_defaults(downscale_period="always"),
+        get_defaults(forced_uptime=True),
+    ):
+        assert decide(resource, defaults, now, schedule_groups=groups) == decide(
+            resource, defaults, now
+        )
+
+
+def test_decide_with_resolved_schedule(resource, monkeypatch):
+    resource.replicas = 2
+    resource.metadata = {"creationTimestamp": "2018-10-23T21:55:00Z"}
+    now = datetime.strptime("2018-10-23T21:56:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    get_time_specs = MagicMock(side_effect=AssertionError("schedule resolved twice"))
+    monkeypatch.setattr("kube_downscaler.scaler.get_time_specs", get_time_specs)
+    schedule = Schedule("always", "never", "never", "never")
+    action = decide(resource, get_defaults(), now, schedule=schedule)
+    assert action == Action(NO_ACTION, 2, 2, "always", "never")
+    get_time_specs.assert_not_called()
+
+
+def test_decision_cache(resource):
+    resource.replicas = 2
+    resource.metadata = {
+        "uid": "uid-1",
+        "resourceVersion": "1",
+        "creationTimestamp": "2018-10-23T21:55:00Z",
+    }
+    now = datetime.strptime("2018-10-23T21:56:00Z", "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+    defaults = get_defaults(uptime="always", downtime="never")
+    cache = DecisionCache()
+    cache.start_cycle(now)
+    assert cache.get(resource, defaults) is None
+    cache.set(resource, defaults, Action(NO_ACTION, 2, 2, "always", "never"))
+    cache.end_cycle(None)
+
+    cache.start_cycle(now)
+    assert cache.get(resource, defaults) == Action(NO_ACTION, 2, 2, "always", "never")
+    # namespace annotations changed
+    assert cache.get(resource, defaults._replace(downtime="always")) is None
+    # resource changed
+    resource.metadata["resourceVersion"] = "2"
+    assert cache.get(resource, defaults) is None
+
+
+def test_decision_cache_epoch(resource):
+    resource.metadata = {"uid": "uid-1", "resourceVersion": "1"}
+    now = datetime(2018, 10, 23, 21, 56, tzinfo=timezone.utc)
+    defaults = get_defaults()
+    cache = DecisionCache()
+    cache.start_cycle(now)
+    cache.set(resource, defaults, Action(NO_ACTION))
+    cache.end_cycle(datetime(2018, 10, 23, 22, 0, tzinfo=timezone.utc))
+
+    cache.start_cycle(datetime(2018, 10, 23, 21, 59, tzinfo=timezone.utc))
+    assert cache.get(resource, defaults) == Action(NO_ACTION)
+    cache.end_cycle(datetime(2018, 10, 23, 22, 0, tzinfo=timezone.utc))
+
+    # a time spec changes its value
+    cache.start_cycle(datetime(2018, 10, 23, 22, 0, tzinfo=timezone.utc))
+    assert cache.get(resource, defaults) is None
+
+
+def test_decision_cache_max_age(resource):
+    resource.metadata = {"uid": "uid-1", "resourceVersion": "1"}
+    now = datetime(2018, 10, 23, 21, 56, tzinfo=timezone.utc)
+    defaults = get_defaults()
+    cache = DecisionCache()
+    cache.start_cycle(now)
+    cache.set(resource, defaults, Action(NO_ACTION))
+    # no time spec ever changes its value
+    cache.end_cycle(None)
+    assert cache.valid_until == now + timedelta(seconds=DECISION_CACHE_MAX_AGE_SECONDS)
+
+    cache.start_cycle(now + timedelta(seconds=DECISION_CACHE_MAX_AGE_SECONDS))
+    assert cache.get(resource, defaults) is None
+
+
+def test_decision_cache_time_zone_transition(resource):
+    resource.replicas = 0
+    resource.annotations = {ORIGINAL_REPLICAS_ANNOTATION: "3"}
+    resource.metadata = {"uid": "uid-1", "resourceVersion": "1"}
+    defaults = get_defaults(
+        uptime="Mon-Fri 08:00-18:00 America/New_York", downtime="never"
+    )
+    cache = DecisionCache()
+
+    def run_cycle(now):
+        cache.start_cycle(now)
+        action = get_action(resource, defaults, now, decision_cache=cache)
+        cache.end_cycle(
+            get_next_transition(now, set(get_time_specs(resource, defaults)))
+        )
+        return action.type
+
+    # Tuesday, 07:00 and 07:50 in New York (EDT)
+    assert run_cycle(datetime(2020, 4, 7, 11, 0, tzinfo=timezone.utc)) == NO_ACTION
+    assert run_cycle(datetime(2020, 4, 7, 11, 50, tzinfo=timezone.utc)) == NO_ACTION
+    # 08:00 in New York
+    assert cache.valid_until == datetime(2020, 4, 7, 12, 0, tzinfo=timezone.utc)
+    # 09:00 in New York, the uptime started while the cache was warm
+    assert run_cycle(datetime(2020, 4, 7, 13, 0, tzinfo=timezone.utc)) == SCALE_UP
+
+
+def test_decision_cache_failed_cycle(resource):
+    resource.metadata = {"uid": "uid-1", "resourceVersion": "1"}
+    now = datetime(2018, 10, 23, 21, 56, tzinfo=timezone.utc)
+    defaults = get_defaults()
+    cache = DecisionCache()
+    cache.start_cycle(now)
+    cache.set(resource, defaults, Action(NO_ACTION))
+    # end_cycle is not called, e.g. because listing another kind failed
+
+    cache.start_cycle(now)
+    assert cache.get(resource, defaults) is None
+
+
+def test_decision_cache_not_cached(resource):
+    resource.metadata = {"uid": "uid-1", "resourceVersion": "1"}
+    now = datetime(2018, 10, 23, 21, 56, tzinfo=timezone.utc)
+    defaults = get_defaults()
+    cache = DecisionCache()
+    cache.start_cycle(now)
+    # the grace period ends independently of any time spec
+    cache.set(resource, defaults, Action(GRACE_PERIOD, 1, 1))
+    assert cache.get(resource, defaults) is None
+    resource.annotations = {EXCLUDE_UNTIL_ANNOTATION: "2018-10-24"}
+    cache.set(resource, defaults, Action(EXCLUDED))
+    assert cache.get(resource, defaults) is None
+
+
+def test_decision_cache_size_and_evict():
+    now = datetime(2018, 10, 23, 21, 56, tzinfo=timezone.utc)
+    defaults = get_defaults()
+    cache = DecisionCache(max_size=2)
+    cache.start_cycle(now)
+    resources = []
+    for i in range(3):
+        res = MagicMock()
+        res.annotations = {}
+        res.metadata = {"uid": f"uid-{i}", "resourceVersion": "1"}
+        cache.set(res, defaults, Action(NO_ACTION))
+        resources.append(res)
+
+    # the least recently used entry was evicted
+    assert cache.get(resources[0], defaults) is None
+    assert cache.get(resources[1], defaults) == Action(NO_ACTION)
+    cache.evict({"metadata": resources[1].metadata})
+    assert cache.get(resources[1], defaults) is None
+    assert cache.get(resources[2], defaults) == Action(NO_ACTION)
+
+
+def test_autoscale_resource_decision_cache(resource, monkeypatch):
+    resource.replicas = 2
+    resource.metadata = {
+        "uid": "uid-1",
+        "resourceVersion": "1",
+        "creationTimestamp": "2018-10-23T21:55:00Z",
+    }
+    now = datetime(2018, 10, 23, 21, 56, tzinfo=timezone.utc)
+    cache = DecisionCache()
+    cache.start_cycle(now)
+    for _ in range(2):
+        autoscale_resource(
+            resource,
+            "never",
+            "never",
+            "always",
+            "never",
+            False,
+            False,
+            now,
+            decision_cache=cache,
+        )
+    mock_decide = MagicMock()
+    monkeypatch.setattr("kube_downscaler.scaler.decide", mock_decide)
+    autoscale_resource(
+        resource,
+        "never",
+        "never",
+        "always",
+        "never",
+        False,
+        False,
+        now,
+        decision_cache=cache,
+    )
+    mock_decide.assert_not_called()
+    resource.patch.assert_not_called()
+
+
+def test_scale_down_event_emitter(resource, monkeypatch):
+    add_event = MagicMock()
+    monkeypatch.setattr("kube_downscaler.scaler.helper.add_event", add_event)
+    resource.replicas = 1
+    resource.metadata = {"creationTimestamp": "2018-10-23T21:55:00Z"}
+    now = datetime(2018, 10, 23, 21, 56, tzinfo=timezone.utc)
+    event_emitter = MagicMock()
+    for dry_run in (True, False):
+        resource.replicas = 1
+        autoscale_resource(
+            resource,
+            "never",
+            "never",
+            "never",
+            "always",
+            False,
+            dry_run,
+            now,
+            enable_events=True,
+            event_emitter=event_emitter,
+        )
+    # no event in dry-run mode
+    event_emitter.emit.assert_called_once_with(
+        resource, "Scaling down replicas", "ScaleDown", "Normal"
+    )
+    add_event.assert_not_called()
+
+
+def test_wait_for_updates_leadership_lost(resource, caplog):
+    caplog.set_level(logging.ERROR)
+    lost = MagicMock()
+    lost.result.side_effect = LeadershipLost("lost")
+    failed = MagicMock()
+    failed.result.side_effect = Exception("update failed")
+
+    with pytest.raises(LeadershipLost):
+        wait_for_updates([(resource, lost), (resource, failed)])
+
+    # all updates are waited for, other errors are still logged
+    failed.result.assert_called_once()
+    assert "update failed" in caplog.text
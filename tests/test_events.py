@@ -1,15 +1,25 @@
+import datetime
+import json
 from unittest.mock import MagicMock
 
 import pytest
+from pykube.exceptions import HTTPError
 from pykube.query import Query
 
 from kube_downscaler import helper
+from kube_downscaler.events import aggregate
+from kube_downscaler.events import EventEmitter
+from kube_downscaler.events import EVENTS_API
+from kube_downscaler.events import QueuedEvent
+
+NOW = datetime.datetime(2020, 10, 5, 8, 0)
 
 
 @pytest.fixture
 def resource():
     res = MagicMock()
     res.kind = "MockResource"
+    res.version = "v1"
     res.namespace = "mock"
     res.name = "res-1"
     res.annotations = {}
@@ -50,3 +60,84 @@ def test_add_event(monkeypatch, resource, event):
     e = helper.add_event(resource, "test message", "reason", "Normal", False)
     assert e.obj["count"] == 1
     event.update.assert_not_called()
+
+
+@pytest.fixture
+def api():
+    api = MagicMock()
+    created = MagicMock()
+    created.json.return_value = {
+        "metadata": {"name": "kube-downscaler-abc", "namespace": "mock"}
+    }
+    api.post.return_value = created
+    patched = MagicMock()
+    patched.json.return_value = {
+        "metadata": {"name": "kube-downscaler-abc", "namespace": "mock"}
+    }
+    api.patch.return_value = patched
+    return api
+
+
+def test_event_emitter_aggregates_without_list(api, resource):
+    emitter = EventEmitter(api)
+    emitter.start()
+    emitter.emit(resource, "Scaling down replicas", "ScaleDown", "Normal")
+    emitter.flush()
+    emitter.emit(resource, "Scaling down replicas", "ScaleDown", "Normal")
+    emitter.stop()
+
+    api.get.assert_not_called()
+    api.post.assert_called_once()
+    body = json.loads(api.post.call_args[1]["data"])
+    assert body["count"] == 1
+    assert body["involvedObject"]["uid"] == "id-1"
+    api.patch.assert_called_once()
+    assert api.patch.call_args[1]["url"].endswith("events/kube-downscaler-abc")
+    assert json.loads(api.patch.call_args[1]["data"])["count"] == 2
+
+
+def test_event_emitter_other_message(api, resource):
+    emitter = EventEmitter(api)
+    emitter.send(
+        QueuedEvent(helper.get_involved_object(resource), "a", "R", "Normal", NOW)
+    )
+    emitter.send(
+        QueuedEvent(helper.get_involved_object(resource), "b", "R", "Normal", NOW)
+    )
+    assert api.post.call_count == 2
+    api.patch.assert_not_called()
+
+
+def test_event_emitter_event_expired(api, resource):
+    emitter = EventEmitter(api)
+    event = QueuedEvent(helper.get_involved_object(resource), "a", "R", "Normal", NOW)
+    emitter.send(event)
+    api.raise_for_status.side_effect = [HTTPError(404, "not found"), None]
+    emitter.send(event)
+    api.patch.assert_called_once()
+    assert api.post.call_count == 2
+
+
+def test_event_emitter_batch(resource):
+    event = QueuedEvent(helper.get_involved_object(resource), "a", "R", "Normal", NOW)
+    other = event._replace(message="b")
+    assert aggregate([event, other, event]) == [(event, 2), (other, 1)]
+
+
+def test_event_emitter_events_api(api, resource):
+    emitter = EventEmitter(api, EVENTS_API)
+    event = QueuedEvent(helper.get_involved_object(resource), "a", "R", "Normal", NOW)
+    emitter.send(event, 2)
+    assert api.post.call_args[1]["version"] == "events.k8s.io/v1"
+    body = json.loads(api.post.call_args[1]["data"])
+    assert body["note"] == "a"
+    assert body["regarding"]["uid"] == "id-1"
+    assert body["series"] == {
+        "count": 2,
+        "lastObservedTime": "2020-10-05T08:00:00.000000Z",
+    }
+
+    emitter.send(event)
+    assert json.loads(api.patch.call_args[1]["data"]) == {
+        "series": {"count": 3, "lastObservedTime": "2020-10-05T08:00:00.000000Z"}
+    }
@@ -0,0 +1,272 @@
+import json
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from pykube import Deployment
+from pykube import Namespace
+from pykube.exceptions import HTTPError
+
+from kube_downscaler.informer import Informer
+from kube_downscaler.informer import InformerGroup
+from kube_downscaler.informer import PARTIAL_OBJECT_METADATA
+from kube_downscaler.informer import PARTIAL_OBJECT_METADATA_LIST
+
+
+def deployment(name, namespace="default", resource_version="1", replicas=1):
+    return {
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "resourceVersion": resource_version,
+        },
+        "spec": {"replicas": replicas},
+    }
+
+
+def watch_response(*events):
+    response = MagicMock()
+    response.iter_lines.return_value = [
+        json.dumps({"type": event_type, "object": obj}).encode("utf-8")
+        for event_type, obj in events
+    ]
+    return response
+
+
+def list_response(items, resource_version):
+    response = MagicMock()
+    response.json.return_value = {
+        "metadata": {"resourceVersion": resource_version},
+        "items": items,
+    }
+    return response
+
+
+def test_informer_not_synced():
+    informer = Informer(MagicMock(), Deployment)
+    with pytest.raises(RuntimeError):
+        informer.list()
+
+
+def test_informer_relist():
+    api = MagicMock()
+    api.get.return_value = list_response(
+        [deployment("deploy-2"), deployment("deploy-1", namespace="a")], "10"
+    )
+    informer = Informer(api, Deployment)
+    informer.relist()
+
+    assert informer.synced
+    assert informer.resource_version == "10"
+    assert [(d.namespace, d.name) for d in informer.list()] == [
+        ("a", "deploy-1"),
+        ("default", "deploy-2"),
+    ]
+    assert api.get.call_args[1]["url"] == "deployments"
+    assert "namespace" not in api.get.call_args[1]
+
+
+def test_informer_watch():
+    api = MagicMock()
+    api.get.return_value = list_response(
+        [deployment("deploy-1"), deployment("deploy-2")], "10"
+    )
+    informer = Informer(api, Deployment, namespace="default")
+    informer.relist()
+
+    api.get.return_value = watch_response(
+        ("MODIFIED", deployment("deploy-1", resource_version="11", replicas=0)),
+        ("DELETED", deployment("deploy-2", resource_version="12")),
+        ("ADDED", deployment("deploy-3", resource_version="13")),
+        ("BOOKMARK", {"metadata": {"resourceVersion": "14"}}),
+    )
+    informer.watch()
+
+    params = api.get.call_args[1]["params"]
+    assert params["watch"] == "true"
+    assert params["resourceVersion"] == "10"
+    assert api.get.call_args[1]["namespace"] == "default"
+    assert informer.resource_version == "14"
+    assert [(d.name, d.replicas) for d in informer.list()] == [
+        ("deploy-1", 0),
+        ("deploy-3", 1),
+    ]
+
+
+def test_informer_list_returns_copies():
+    api = MagicMock()
+    api.get.return_value = list_response([deployment("deploy-1")], "10")
+    informer = Informer(api, Deployment)
+    informer.relist()
+
+    informer.list()[0].replicas = 5
+
+    assert informer.list()[0].replicas == 1
+
+
+def test_informer_watch_gone():
+    api = MagicMock()
+    api.get.return_value = list_response([], "10")
+    informer = Informer(api, Deployment)
+    informer.relist()
+
+    api.get.return_value = watch_response(
+        ("ERROR", {"kind": "Status", "code": 410, "message": "too old"})
+    )
+    with pytest.raises(HTTPError):
+        informer.watch()
+
+
+def test_informer_run_relists_when_gone():
+    api = MagicMock()
+    informer = Informer(api, Deployment)
+    responses = [
+        list_response([deployment("deploy-1")], "10"),
+        watch_response(("ERROR", {"kind": "Status", "code": 410, "message": "gone"})),
+        list_response([deployment("deploy-2")], "20"),
+    ]
+
+    def get(**kwargs):
+        if not responses:
+            informer.stop()
+            return watch_response()
+        return responses.pop(0)
+
+    api.get = get
+    informer.run()
+
+    assert informer.resource_version == "20"
+    assert [d.name for d in informer.list()] == ["deploy-2"]
+
+
+def test_informer_params():
+    api = MagicMock()
+    api.get.return_value = list_response([], "10")
+    informer = Informer(
+        api, Namespace, params={"fieldSelector": "metadata.name=default"}
+    )
+    informer.relist()
+
+    assert api.get.call_args[1]["url"] == "namespaces"
+    assert api.get.call_args[1]["params"] == {
+        "fieldSelector": "metadata.name=default",
+        "limit": 500,
+    }
+
+    api.get.return_value = watch_response()
+    informer.watch()
+
+    assert api.get.call_args[1]["params"]["fieldSelector"] == "metadata.name=default"
+    assert api.get.call_args[1]["params"]["watch"] == "true"
+
+
+def test_informer_metadata_only_predicate():
+    api = MagicMock()
+    api.get.return_value = list_response(
+        [deployment("deploy-1", replicas=0), deployment("deploy-2", replicas=1),], "10",
+    )
+    informer = Informer(
+        api,
+        Deployment,
+        metadata_only=True,
+        predicate=lambda obj: obj["spec"]["replicas"] > 0,
+    )
+    informer.relist()
+
+    assert api.get.call_args[1]["headers"] == {"Accept": PARTIAL_OBJECT_METADATA_LIST}
+    assert [d.name for d in informer.list()] == ["deploy-2"]
+
+    api.get.return_value = watch_response(
+        ("MODIFIED", deployment("deploy-1", resource_version="11", replicas=1)),
+        ("MODIFIED", deployment("deploy-2", resource_version="12", replicas=0)),
+    )
+    informer.watch()
+
+    assert api.get.call_args[1]["headers"] == {"Accept": PARTIAL_OBJECT_METADATA}
+    assert [d.name for d in informer.list()] == ["deploy-1"]
+
+
+def test_informer_changed():
+    api = MagicMock()
+    api.get.return_value = list_response([deployment("deploy-1")], "10")
+    changed = threading.Event()
+    informer = Informer(api, Deployment, changed=changed)
+    informer.relist()
+    assert changed.is_set()
+    changed.clear()
+
+    status_update = deployment("deploy-1", resource_version="11")
+    status_update["status"] = {"readyReplicas": 1}
+    informer.handle_event("MODIFIED", status_update)
+    assert not changed.is_set()
+
+    informer.handle_event(
+        "MODIFIED", deployment("deploy-1", resource_version="12", replicas=0)
+    )
+    assert changed.is_set()
+    changed.clear()
+
+    informer.handle_event("DELETED", deployment("deploy-2", resource_version="13"))
+    assert not changed.is_set()
+
+    informer.handle_event("DELETED", deployment("deploy-1", resource_version="14"))
+    assert changed.is_set()
+
+
+def test_informer_on_delete():
+    api = MagicMock()
+    api.get.return_value = list_response([deployment("deploy-1")], "10")
+    on_delete = MagicMock()
+    informer = Informer(api, Deployment, on_delete=on_delete)
+    informer.relist()
+
+    informer.handle_event("MODIFIED", deployment("deploy-1", resource_version="11"))
+    on_delete.assert_not_called()
+
+    deleted = deployment("deploy-1", resource_version="12")
+    informer.handle_event("DELETED", deleted)
+    on_delete.assert_called_once_with(deleted)
+
+
+def test_informer_transform():
+    api = MagicMock()
+    api.get.return_value = list_response([deployment("deploy-1")], "10")
+    informer = Informer(
+        api, Deployment, transform=lambda obj: {**obj, "status": "transformed"}
+    )
+    informer.relist()
+
+    api.get.return_value = watch_response(
+        ("ADDED", deployment("deploy-2", resource_version="11")),
+    )
+    informer.watch()
+
+    assert [d.obj["status"] for d in informer.list()] == ["transformed"] * 2
+
+
+def test_informer_group():
+    api = MagicMock()
+
+    def get(**kwargs):
+        namespace = kwargs["namespace"]
+        return list_response([deployment("deploy-1", namespace=namespace)], "10")
+
+    api.get = get
+    group = InformerGroup(
+        [Informer(api, Deployment, "team-b"), Informer(api, Deployment, "team-a")]
+    )
+    assert not group.synced
+
+    for informer in group.informers:
+        informer.relist()
+
+    assert group.synced
+    assert group.wait_for_sync(0)
+    assert [(d.namespace, d.name) for d in group.list()] == [
+        ("team-a", "deploy-1"),
+        ("team-b", "deploy-1"),
+    ]
+
+    new_api = MagicMock()
+    group.api = new_api
+    assert all(informer.api is new_api for informer in group.informers)
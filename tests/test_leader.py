@@ -0,0 +1,168 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from pykube.exceptions import HTTPError
+
+from kube_downscaler.leader import get_default_namespace
+from kube_downscaler.leader import LeaderElector
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = MagicMock(return_value=1000.0)
+    monkeypatch.setattr("kube_downscaler.leader.time.monotonic", clock)
+    return clock
+
+
+def lease_response(holder, resource_version="1", duration=15, transitions=0):
+    response = MagicMock()
+    response.ok = True
+    response.json.return_value = {
+        "metadata": {
+            "name": "kube-downscaler",
+            "namespace": "default",
+            "resourceVersion": resource_version,
+        },
+        "spec": {
+            "holderIdentity": holder,
+            "leaseDurationSeconds": duration,
+            "acquireTime": "2020-01-01T00:00:00.000000Z",
+            "leaseTransitions": transitions,
+        },
+    }
+    return response
+
+
+def not_found():
+    response = MagicMock()
+    response.ok = False
+    response.status_code = 404
+    return response
+
+
+def get_patch(api):
+    return json.loads(api.patch.call_args[1]["data"])
+
+
+def test_acquire_new_lease():
+    api = MagicMock()
+    api.get.return_value = not_found()
+    elector = LeaderElector(api, "default", identity="me")
+
+    assert elector.try_acquire_or_renew()
+
+    body = json.loads(api.post.call_args[1]["data"])
+    assert body["metadata"] == {"name": "kube-downscaler", "namespace": "default"}
+    assert body["spec"]["holderIdentity"] == "me"
+    assert body["spec"]["leaseDurationSeconds"] == 15
+
+
+def test_acquire_lease_held_by_other(clock):
+    api = MagicMock()
+    api.get.return_value = lease_response("other", transitions=3)
+    elector = LeaderElector(api, "default", identity="me")
+
+    assert not elector.try_acquire_or_renew()
+    clock.return_value += 10
+    assert not elector.try_acquire_or_renew()
+    api.patch.assert_not_called()
+
+    # the other replica did not renew the lease in time
+    clock.return_value += 6
+    assert elector.try_acquire_or_renew()
+    patch = get_patch(api)
+    assert patch["metadata"] == {"resourceVersion": "1"}
+    assert patch["spec"]["holderIdentity"] == "me"
+    assert patch["spec"]["leaseTransitions"] == 4
+
+
+def test_acquire_released_lease():
+    api = MagicMock()
+    api.get.return_value = lease_response(None)
+    elector = LeaderElector(api, "default", identity="me")
+
+    assert elector.try_acquire_or_renew()
+    assert get_patch(api)["spec"]["holderIdentity"] == "me"
+
+
+def test_renew_lease():
+    api = MagicMock()
+    api.get.return_value = lease_response("me", resource_version="7", transitions=2)
+    elector = LeaderElector(api, "default", identity="me")
+
+    assert elector.try_acquire_or_renew()
+    patch = get_patch(api)
+    assert patch["metadata"] == {"resourceVersion": "7"}
+    assert patch["spec"]["acquireTime"] == "2020-01-01T00:00:00.000000Z"
+    assert patch["spec"]["leaseTransitions"] == 2
+
+
+def test_acquire_conflict():
+    api = MagicMock()
+    api.get.return_value = lease_response(None)
+    api.raise_for_status.side_effect = HTTPError(409, "conflict")
+    elector = LeaderElector(api, "default", identity="me")
+
+    assert not elector.try_acquire_or_renew()
+
+
+def test_is_leader(clock):
+    elector = LeaderElector(MagicMock(), "default", identity="me")
+    assert not elector.is_leader
+
+    elector._renewed = clock.return_value
+    assert elector.is_leader
+    # not renewed within the renew deadline
+    clock.return_value += 10
+    assert not elector.is_leader
+
+
+def test_wait_for_leadership_renew_deadline_passed(clock):
+    elector = LeaderElector(MagicMock(), "default", identity="me")
+    elector._stopped = MagicMock()
+    elector._stopped.wait.return_value = False
+    # the elector thread did not clear _leading yet
+    elector._leading.set()
+    elector._renewed = clock.return_value
+    clock.return_value += 10
+
+    assert not elector.wait_for_leadership(30)
+    # waits instead of returning right away (i.e. the main loop does not spin)
+    elector._stopped.wait.assert_called_once_with(2)
+
+    elector._stopped.wait.reset_mock()
+    assert not elector.wait_for_leadership(0.5)
+    elector._stopped.wait.assert_called_once_with(0.5)
+
+
+def test_run_and_release(clock):
+    api = MagicMock()
+    api.get.return_value = lease_response("me")
+    changed = MagicMock()
+    elector = LeaderElector(api, "default", identity="me", changed=changed)
+    elector._stopped.wait = lambda timeout: elector._stopped.set()
+
+    elector.run()
+
+    assert elector.is_leader
+    assert elector.wait_for_leadership(0)
+    changed.set.assert_called_once()
+
+    elector.stop()
+
+    assert not elector.is_leader
+    assert get_patch(api) == {
+        "metadata": {"resourceVersion": "1"},
+        "spec": {"holderIdentity": None, "leaseDurationSeconds": 1},
+    }
+
+
+def test_get_default_namespace(tmpdir, monkeypatch):
+    namespace = tmpdir.join("namespace")
+    monkeypatch.setattr(
+        "kube_downscaler.leader.SERVICE_ACCOUNT_NAMESPACE_PATH", str(namespace)
+    )
+    assert get_default_namespace() == "default"
+    namespace.write("kube-downscaler\n")
+    assert get_default_namespace() == "kube-downscaler"
@@ -0,0 +1,184 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import pytest
+from pykube import CronJob
+from pykube import Deployment
+from pykube.exceptions import HTTPError
+
+from kube_downscaler.helper import list_objects
+from kube_downscaler.helper import list_pages
+from kube_downscaler.helper import Prefetcher
+
+
+def deployment(name):
+    return {"metadata": {"name": name, "namespace": "default"}}
+
+
+def get_api(pages):
+    """Return an API mock serving the given pages, keyed by the continue token of the request."""
+    api = MagicMock()
+
+    def get(url, version, params, **kwargs):
+        response = MagicMock()
+        response.json.return_value = pages[params.get("continue")]
+        return response
+
+    api.get = MagicMock(side_effect=get)
+    return api
+
+
+def test_list_pages():
+    api = get_api(
+        {
+            None: {
+                "metadata": {"resourceVersion": "10", "continue": "token-1"},
+                "items": [deployment("deploy-1"), deployment("deploy-2")],
+            },
+            "token-1": {
+                "metadata": {"resourceVersion": "10"},
+                "items": [deployment("deploy-3")],
+            },
+        }
+    )
+    pages = list(list_pages(api, Deployment, page_size=2))
+    assert len(pages) == 2
+    assert [call[1]["params"] for call in api.get.call_args_list] == [
+        {"limit": 2},
+        {"limit": 2, "continue": "token-1"},
+    ]
+    assert api.get.call_args[1]["url"] == "deployments"
+    assert "namespace" not in api.get.call_args[1]
+
+    names = [obj["metadata"]["name"] for obj in list_objects(api, Deployment)]
+    assert names == ["deploy-1", "deploy-2", "deploy-3"]
+
+
+def test_list_pages_lazy():
+    api = get_api(
+        {
+            None: {
+                "metadata": {"continue": "token-1"},
+                "items": [deployment("deploy-1")],
+            }
+        }
+    )
+    objects = list_objects(api, Deployment, namespace="default", page_size=1)
+    assert next(objects)["metadata"]["name"] == "deploy-1"
+    # the next page is only requested when needed
+    assert api.get.call_count == 1
+    assert api.get.call_args[1]["namespace"] == "default"
+
+
+def test_list_pages_without_limit():
+    api = get_api({None: {"metadata": {}, "items": []}})
+    assert (
+        list(list_objects(api, CronJob, params={"labelSelector": "a=b"}, page_size=0))
+        == []
+    )
+    kwargs = api.get.call_args[1]
+    assert kwargs["params"] == {"labelSelector": "a=b"}
+    assert kwargs["version"] == "batch/v1"
+
+
+def test_list_pages_expired_continue_token():
+    api = MagicMock()
+    first_page = MagicMock()
+    first_page.json.return_value = {
+        "metadata": {"continue": "token-1"},
+        "items": [deployment("deploy-1")],
+    }
+    expired = MagicMock()
+    # the Status object contains a token to continue with an inconsistent list
+    expired.json.return_value = {"code": 410, "metadata": {"continue": "token-2"}}
+    last_page = MagicMock()
+    last_page.json.return_value = {"metadata": {}, "items": [deployment("deploy-2")]}
+    api.get.side_effect = [first_page, expired, last_page]
+
+    def raise_for_status(response):
+        if response is expired:
+            raise HTTPError(410, "The provided continue parameter is too old")
+
+    api.raise_for_status = raise_for_status
+
+    names = [obj["metadata"]["name"] for obj in list_objects(api, Deployment)]
+    assert names == ["deploy-1", "deploy-2"]
+    assert api.get.call_args[1]["params"]["continue"] == "token-2"
+
+    # no token to resume with
+    expired.json.return_value = {"code": 410, "metadata": {}}
+    api.get.side_effect = [first_page, expired]
+    with pytest.raises(HTTPError):
+        list(list_objects(api, Deployment))
+
+
+def test_list_pages_gone_without_continue_token():
+    api = MagicMock()
+    api.raise_for_status.side_effect = HTTPError(410, "Gone")
+    with pytest.raises(HTTPError):
+        list(list_pages(api, Deployment))
+
+
+def test_prefetcher():
+    fetched = []
+
+    def pages():
+        for i in range(3):
+            fetched.append(i)
+            yield i
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        prefetcher = Prefetcher(pages(), executor)
+        items = iter(prefetcher)
+        assert next(items) == 0
+        assert list(items) == [1, 2]
+    assert fetched == [0, 1, 2]
+
+
+def test_prefetcher_error():
+    def pages():
+        yield 1
+        raise HTTPError(500, "Internal Server Error")
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        items = iter(Prefetcher(pages(), executor))
+        assert next(items) == 1
+        with pytest.raises(HTTPError):
+            next(items)
+
+
+def test_prefetcher_close():
+    def pages():
+        while True:
+            yield 1
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    prefetcher = Prefetcher(pages(), executor)
+    prefetcher.close()
+    # the background thread stops although nobody consumes the items
+    executor.shutdown(wait=True)
+
+
+def test_prefetcher_close_before_start():
+    fetched = []
+
+    def pages():
+        fetched.append(1)
+        yield 1
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        started = threading.Event()
+        blocked = threading.Event()
+
+        def block():
+            started.set()
+            blocked.wait()
+
+        executor.submit(block)
+        started.wait()
+        prefetcher = Prefetcher(pages(), executor)
+        prefetcher.close()
+        blocked.set()
+    # the queued prefetcher never started fetching
+    assert fetched == []
@@ -1,15 +1,23 @@
+import datetime
 import os.path
 import re
 from unittest.mock import MagicMock
+from unittest.mock import PropertyMock
 
 import pytest
 
+from kube_downscaler import helper
+from kube_downscaler.leader import LeadershipLost
+from kube_downscaler.main import get_sleep_seconds
 from kube_downscaler.main import main
+from kube_downscaler.main import TRANSITION_DELAY_SECONDS
+from kube_downscaler.recording import load_recording
 
 
 @pytest.fixture
-def kubeconfig(tmpdir):
+def kubeconfig(tmpdir, monkeypatch):
     kubeconfig = tmpdir.join("kubeconfig")
+    monkeypatch.setenv("KUBECONFIG", str(kubeconfig))
     kubeconfig.write(
         """
 apiVersion: v1
@@ -74,3 +82,193 @@ def test_main_exclude_namespaces(kubeconfig, monkeypatch):
     assert mock_scale.call_args.kwargs["exclude_namespaces"] == frozenset(
         [re.compile("foo"), re.compile(".*-infra-.*")]
     )
+
+
+def test_get_sleep_seconds():
+    now = datetime.datetime(2020, 10, 5, 7, 59, 30, tzinfo=datetime.timezone.utc)
+    assert get_sleep_seconds(30, None, now) == 30
+    assert (
+        get_sleep_seconds(30, now + datetime.timedelta(seconds=10), now)
+        == 10 + TRANSITION_DELAY_SECONDS
+    )
+    assert get_sleep_seconds(30, now + datetime.timedelta(hours=1), now) == 30
+    assert get_sleep_seconds(30, now - datetime.timedelta(seconds=10), now) == 0
+
+
+def test_main_reuses_api(kubeconfig, monkeypatch):
+    mock_shutdown = MagicMock()
+    mock_handler = MagicMock()
+    mock_handler.shutdown_now = False
+    mock_shutdown.GracefulShutdown.return_value = mock_handler
+
+    get_kube_api = MagicMock()
+    monkeypatch.setattr("kube_downscaler.main.helper.get_kube_api", get_kube_api)
+    monkeypatch.setattr(
+        "kube_downscaler.main.helper.get_connection_count", MagicMock(return_value=0)
+    )
+    # token is rotated before the third loop iteration
+    token_mtimes = iter([1, 1, 1, 2, 2])
+    monkeypatch.setattr(
+        "kube_downscaler.main.helper.get_service_account_token_mtime",
+        lambda: next(token_mtimes),
+    )
+
+    calls = []
+
+    def mock_scale(*args, **kwargs):
+        calls.append(kwargs["api"])
+        if len(calls) == 4:
+            mock_handler.shutdown_now = True
+
+    monkeypatch.setattr("kube_downscaler.main.scale", mock_scale)
+    monkeypatch.setattr("kube_downscaler.main.shutdown", mock_shutdown)
+
+    main(["--dry-run", "--interval=0", "--max-concurrent-updates=5"])
+
+    assert get_kube_api.call_count == 2
+    assert get_kube_api.call_args[0][0] == 15
+    assert calls[0] is calls[1]
+    assert calls[2] is calls[3]
+
+
+def test_get_service_account_token_mtime(tmpdir, monkeypatch):
+    token = tmpdir.join("token")
+    monkeypatch.setattr("kube_downscaler.helper.SERVICE_ACCOUNT_TOKEN_PATH", str(token))
+    assert helper.get_service_account_token_mtime() is None
+    token.write("my-token")
+    assert helper.get_service_account_token_mtime() == os.stat(str(token)).st_mtime
+
+
+def test_main_leader_election(kubeconfig, monkeypatch):
+    monkeypatch.setattr(os.path, "expanduser", lambda x: str(kubeconfig))
+
+    elector = MagicMock()
+    # standby in the first loop iteration
+    type(elector).is_leader = PropertyMock(side_effect=[False, True])
+    mock_elector = MagicMock(return_value=elector)
+    monkeypatch.setattr("kube_downscaler.main.LeaderElector", mock_elector)
+    mock_scale = MagicMock()
+    monkeypatch.setattr("kube_downscaler.main.scale", mock_scale)
+
+    main(
+        [
+            "--dry-run",
+            "--once",
+            "--leader-election",
+            "--leader-election-namespace=kube-system",
+        ]
+    )
+
+    assert mock_elector.call_args[0][1:] == ("kube-system", "kube-downscaler")
+    elector.start.assert_called_once()
+    elector.wait_for_leadership.assert_called_once_with(30)
+    mock_scale.assert_called_once()
+    # the lease is released on exit
+    elector.stop.assert_called_once()
+
+
+def test_main_leadership_lost(kubeconfig, monkeypatch, caplog):
+    monkeypatch.setattr(os.path, "expanduser", lambda x: str(kubeconfig))
+
+    elector = MagicMock()
+    leading = [True, True, False]
+    type(elector).is_leader = PropertyMock(side_effect=lambda: leading.pop(0))
+    monkeypatch.setattr(
+        "kube_downscaler.main.LeaderElector", MagicMock(return_value=elector)
+    )
+
+    def mock_scale(is_leader, **kwargs):
+        # leading when the loop iteration started and before the first update
+        assert is_leader()
+        if not is_leader():
+            raise LeadershipLost("lost")
+
+    monkeypatch.setattr("kube_downscaler.main.scale", mock_scale)
+
+    main(["--once", "--leader-election"])
+
+    assert leading == []
+    # the aborted loop iteration is not an error
+    assert "Aborted the loop iteration: lost" in caplog.text
+    assert "Failed to autoscale" not in caplog.text
+
+
+def test_main_shard(kubeconfig, monkeypatch):
+    monkeypatch.setattr(os.path, "expanduser", lambda x: str(kubeconfig))
+
+    mock_elector = MagicMock()
+    mock_elector.return_value.is_leader = True
+    monkeypatch.setattr("kube_downscaler.main.LeaderElector", mock_elector)
+    mock_scale = MagicMock()
+    monkeypatch.setattr("kube_downscaler.main.scale", mock_scale)
+
+    main(["--once", "--shard-count=3", "--shard-index=2", "--leader-election"])
+
+    assert mock_scale.call_args.kwargs["shard_index"] == 2
+    assert mock_scale.call_args.kwargs["shard_count"] == 3
+    assert mock_elector.call_args[0][2] == "kube-downscaler-2"
+
+    with pytest.raises(SystemExit):
+        main(["--once", "--shard-count=3", "--shard-index=3"])
+
+
+def test_main_async_engine_events_api(kubeconfig, monkeypatch):
+    pytest.importorskip("aiohttp")
+    monkeypatch.setattr(os.path, "expanduser", lambda x: str(kubeconfig))
+
+    emitters = []
+
+    async def mock_scale(client, event_emitter=None, **kwargs):
+        emitters.append(event_emitter)
+
+    monkeypatch.setattr("kube_downscaler.async_engine.scale", mock_scale)
+
+    main(
+        [
+            "--once",
+            "--engine=async",
+            "--enable-events",
+            "--events-api=events.k8s.io/v1",
+        ]
+    )
+
+    # the async engine sends the events of the selected API
+    assert len(emitters) == 1
+    assert emitters[0].events_api == "events.k8s.io/v1"
+
+
+def test_main_record(kubeconfig, monkeypatch, tmpdir):
+    mock_shutdown = MagicMock()
+    mock_handler = MagicMock()
+    mock_handler.shutdown_now = False
+    mock_shutdown.GracefulShutdown.return_value = mock_handler
+    monkeypatch.setattr("kube_downscaler.main.shutdown", mock_shutdown)
+    get_kube_api = MagicMock()
+    monkeypatch.setattr("kube_downscaler.main.helper.get_kube_api", get_kube_api)
+    monkeypatch.setattr(
+        "kube_downscaler.main.helper.get_connection_count", MagicMock(return_value=0)
+    )
+
+    recorder_closed = []
+    now = []
+
+    def mock_scale(*args, **kwargs):
+        recorder = get_kube_api.call_args[0][2]
+        recorder_closed.append(recorder.closed)
+        now.append(kwargs["now"])
+        if len(recorder_closed) == 2:
+            mock_handler.shutdown_now = True
+
+    monkeypatch.setattr("kube_downscaler.main.scale", mock_scale)
+
+    path = str(tmpdir.join("recording.jsonl.gz"))
+    main(["--dry-run", "--interval=0", f"--record={path}"])
+
+    # only the first loop iteration is recorded
+    assert recorder_closed == [False, True]
+    # the time is only fixed for the recorded loop iteration
+    assert now[1] is None
+    header, exchanges = load_recording(path)
+    assert header["recorded"] == now[0].isoformat()
+    assert header["settings"]["dry_run"]
+    assert exchanges == []
@@ -0,0 +1,160 @@
+import datetime
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock
+
+import pytest
+from pykube import Deployment
+
+from kube_downscaler import metrics
+from kube_downscaler.scaler import autoscale_resource
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+
+
+def test_counter(registry):
+    counter = metrics.Counter("my_requests_total", "My requests", ["verb"])
+    counter.inc(verb="GET")
+    counter.inc(2, verb="GET")
+    counter.inc(verb='PATCH "x"')
+    assert counter.get(verb="GET") == 3
+    assert metrics.generate_latest() == (
+        "# HELP my_requests_total My requests\n"
+        "# TYPE my_requests_total counter\n"
+        'my_requests_total{verb="GET"} 3.0\n'
+        'my_requests_total{verb="PATCH \\"x\\""} 1.0\n'
+    )
+    with pytest.raises(ValueError):
+        counter.inc(resource="pods")
+
+
+def test_label_escaping(registry):
+    counter = metrics.Counter("my_events_total", "My events", ["reason"])
+    counter.inc(reason='quote " backslash \\ newline \n end')
+    assert metrics.generate_latest().splitlines()[2] == (
+        'my_events_total{reason="quote \\" backslash \\\\ newline \\n end"} 1.0'
+    )
+
+
+def test_gauge(registry):
+    gauge = metrics.Gauge("my_timestamp_seconds", "My timestamp")
+    assert gauge.get() is None
+    gauge.set(1600000000.5)
+    assert gauge.get() == 1600000000.5
+    assert "my_timestamp_seconds 1600000000.5\n" in metrics.generate_latest()
+
+
+def test_histogram(registry):
+    histogram = metrics.Histogram(
+        "my_duration_seconds", "My duration", ["phase"], buckets=(0.1, 1)
+    )
+    histogram.observe(0.05, phase="list")
+    histogram.observe(0.5, phase="list")
+    histogram.observe(5, phase="list")
+    assert histogram.get_count(phase="list") == 3
+    assert histogram.get_count(phase="evaluate") == 0
+    lines = metrics.generate_latest().splitlines()
+    assert lines[2:] == [
+        'my_duration_seconds_bucket{phase="list",le="0.1"} 1.0',
+        'my_duration_seconds_bucket{phase="list",le="1.0"} 2.0',
+        'my_duration_seconds_bucket{phase="list",le="+Inf"} 3.0',
+        'my_duration_seconds_sum{phase="list"} 5.55',
+        'my_duration_seconds_count{phase="list"} 3.0',
+    ]
+
+    with histogram.time(phase="evaluate"):
+        pass
+    assert histogram.get_count(phase="evaluate") == 1
+
+
+def test_timed_iterator():
+    items = metrics.TimedIterator(iter([1, 2, 3]))
+    assert list(items) == [1, 2, 3]
+    assert items.seconds > 0
+
+
+def test_get_resource_from_path():
+    assert metrics.get_resource_from_path("/api/v1/pods") == "pods"
+    assert metrics.get_resource_from_path("/api/v1/namespaces") == "namespaces"
+    assert metrics.get_resource_from_path("/api/v1/namespaces/default") == "namespaces"
+    assert (
+        metrics.get_resource_from_path("/api/v1/namespaces/default/events") == "events"
+    )
+    assert (
+        metrics.get_resource_from_path(
+            "/apis/apps/v1/namespaces/default/deployments/my-deploy"
+        )
+        == "deployments"
+    )
+    assert metrics.get_resource_from_path("/apis/zalando.org/v1/stacks") == "stacks"
+
+
+def test_observe_response():
+    response = MagicMock()
+    response.request.method = "GET"
+    response.request.url = "https://k8s.example.org/apis/apps/v1/deployments?limit=500"
+    response.status_code = 200
+    response.elapsed = datetime.timedelta(milliseconds=20)
+    before = metrics.API_REQUESTS.get(verb="GET", resource="deployments", code="200")
+    metrics.observe_response(response)
+    assert (
+        metrics.API_REQUESTS.get(verb="GET", resource="deployments", code="200")
+        == before + 1
+    )
+
+    response.request.url = "https://k8s.example.org/api/v1/pods?watch=true"
+    before = metrics.API_REQUEST_DURATION.get_count(verb="WATCH", resource="pods")
+    metrics.observe_response(response)
+    assert (
+        metrics.API_REQUEST_DURATION.get_count(verb="WATCH", resource="pods")
+        == before + 1
+    )
+
+
+def test_start_http_server():
+    server = metrics.start_http_server(0, "127.0.0.1")
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+            body = response.read().decode("utf-8")
+        assert "# TYPE kube_downscaler_cycle_duration_seconds histogram" in body
+
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def deployment(annotations=None):
+    return Deployment(
+        MagicMock(),
+        {
+            "metadata": {
+                "name": "deploy-1",
+                "namespace": "default",
+                "creationTimestamp": "2019-03-01T16:38:00Z",
+                "annotations": annotations or {},
+            },
+            "spec": {"replicas": 1},
+        },
+    )
+
+
+def test_autoscale_resource_metrics():
+    resource = deployment()
+    evaluated = metrics.RESOURCES_EVALUATED.get(kind="Deployment")
+    scaled_down = metrics.RESOURCES_SCALED_DOWN.get(kind="Deployment")
+    excluded = metrics.RESOURCES_EXCLUDED.get(kind="Deployment")
+    now = datetime.datetime(2019, 4, 1, 0, 0, tzinfo=datetime.timezone.utc)
+    autoscale_resource(resource, "never", "never", "never", "always", False, True, now)
+    assert metrics.RESOURCES_EVALUATED.get(kind="Deployment") == evaluated + 1
+    assert metrics.RESOURCES_SCALED_DOWN.get(kind="Deployment") == scaled_down + 1
+
+    resource = deployment({"downscaler/exclude": "true"})
+    autoscale_resource(resource, "never", "never", "never", "always", False, True, now)
+    assert metrics.RESOURCES_EXCLUDED.get(kind="Deployment") == excluded + 1
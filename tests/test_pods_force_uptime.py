@@ -1,37 +1,118 @@
 from unittest.mock import MagicMock
-from unittest.mock import patch
 
+from kube_downscaler.informer import PARTIAL_OBJECT_METADATA_LIST
 from kube_downscaler.scaler import FORCE_UPTIME_ANNOTATION
+from kube_downscaler.scaler import is_forcing_uptime
 from kube_downscaler.scaler import pods_force_uptime
 
 
-@patch("pykube.Pod")
-@patch("pykube.HTTPClient")
-def test_pods_force_uptime_non_running(c, p):
-    pod1 = MagicMock()
-    pod1.obj = {"status": {"phase": "Succeeded"}}
-    pod1.annotations = {FORCE_UPTIME_ANNOTATION: "true"}
-    pod2 = MagicMock()
-    pod2.obj = {"status": {"phase": "Succeeded"}}
-    pod2.annotations = {FORCE_UPTIME_ANNOTATION: "true"}
-    p.objects.return_value.filter.return_value = [pod1, pod2]
-    force = pods_force_uptime(c, namespace="")
+def get_api(items):
+    api = MagicMock()
+    api.get.return_value.json.return_value = {"items": items}
+    return api
+
+
+def test_pods_force_uptime_non_running():
+    pod1 = {
+        "metadata": {
+            "name": "pod-1",
+            "namespace": "default",
+            "annotations": {FORCE_UPTIME_ANNOTATION: "true"},
+        },
+        "status": {"phase": "Succeeded"},
+    }
+    pod2 = {
+        "metadata": {
+            "name": "pod-2",
+            "namespace": "default",
+            "annotations": {FORCE_UPTIME_ANNOTATION: "true"},
+        },
+        "status": {"phase": "Failed"},
+    }
+    api = get_api([pod1, pod2])
+    force = pods_force_uptime(api, namespace="")
     assert not force
 
 
-@patch("pykube.Pod")
-@patch("pykube.HTTPClient")
-def test_pods_force_uptime(c, p):
-    pod1 = MagicMock()
-    pod1.obj = {"status": {"phase": "Running"}}
-    pod1.annotations = {FORCE_UPTIME_ANNOTATION: "true"}
-    p.objects.return_value.filter.return_value = [pod1]
-    force = pods_force_uptime(c, namespace="")
+def test_pods_force_uptime():
+    pod1 = {
+        "metadata": {
+            "name": "pod-1",
+            "namespace": "default",
+            "annotations": {FORCE_UPTIME_ANNOTATION: "true"},
+        },
+        "status": {"phase": "Running"},
+    }
+    api = get_api([pod1])
+    force = pods_force_uptime(api, namespace="")
     assert force
 
-    pod1 = MagicMock()
-    pod1.obj = {"status": {"phase": "Running"}}
-    pod1.annotations = {FORCE_UPTIME_ANNOTATION: "true"}
-    p.objects.return_value.filter.return_value = [pod1]
-    force = pods_force_uptime(c, namespace="")
+    # metadata-only response (PartialObjectMetadata) has no status
+    pod1 = {
+        "metadata": {
+            "name": "pod-1",
+            "namespace": "default",
+            "annotations": {FORCE_UPTIME_ANNOTATION: "TRUE"},
+        }
+    }
+    api = get_api([pod1])
+    force = pods_force_uptime(api, namespace="")
     assert force
+
+
+def test_pods_force_uptime_request():
+    api = get_api([{"metadata": {"name": "pod-1", "namespace": "default"}}])
+    force = pods_force_uptime(api, namespace="my-ns")
+    assert not force
+
+    kwargs = api.get.call_args[1]
+    assert kwargs["url"] == "pods"
+    assert kwargs["namespace"] == "my-ns"
+    assert kwargs["headers"] == {"Accept": PARTIAL_OBJECT_METADATA_LIST}
+    assert kwargs["params"] == {
+        "fieldSelector": "status.phase!=Succeeded,status.phase!=Failed",
+        "limit": 500,
+    }
+
+    pods_force_uptime(api, namespace=None)
+    assert "namespace" not in api.get.call_args[1]
+
+
+def test_pods_force_uptime_informer():
+    api = MagicMock()
+    informer = MagicMock()
+    pod1 = MagicMock()
+    pod1.obj = {
+        "metadata": {
+            "name": "pod-1",
+            "namespace": "default",
+            "annotations": {FORCE_UPTIME_ANNOTATION: "true"},
+        }
+    }
+    informer.list.return_value = [pod1]
+    assert pods_force_uptime(api, namespace="", informer=informer)
+    api.get.assert_not_called()
+
+    informer.list.return_value = []
+    assert not pods_force_uptime(api, namespace="", informer=informer)
+
+
+def test_is_forcing_uptime():
+    assert not is_forcing_uptime({"metadata": {"name": "pod-1"}})
+    assert not is_forcing_uptime({"metadata": {"name": "pod-1", "annotations": None}})
+    assert not is_forcing_uptime(
+        {
+            "metadata": {
+                "name": "pod-1",
+                "annotations": {FORCE_UPTIME_ANNOTATION: "false"},
+            }
+        }
+    )
+    assert is_forcing_uptime(
+        {
+            "metadata": {
+                "name": "pod-1",
+                "annotations": {FORCE_UPTIME_ANNOTATION: "true"},
+            }
+        }
+    )
@@ -0,0 +1,236 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pykube
+from pykube.http import KubernetesHTTPAdapter
+
+from kube_downscaler.helper import RateLimitedHTTPAdapter
+from kube_downscaler.ratelimit import get_priority
+from kube_downscaler.ratelimit import get_retry_after
+from kube_downscaler.ratelimit import is_exempt
+from kube_downscaler.ratelimit import priority
+from kube_downscaler.ratelimit import PRIORITY_DEFAULT
+from kube_downscaler.ratelimit import PRIORITY_EVENT
+from kube_downscaler.ratelimit import PRIORITY_SCALE_DOWN
+from kube_downscaler.ratelimit import PRIORITY_SCALE_UP
+from kube_downscaler.ratelimit import PriorityExecutor
+from kube_downscaler.ratelimit import RateLimiter
+
+
+def test_priority():
+    assert get_priority() == PRIORITY_DEFAULT
+    with priority(PRIORITY_SCALE_UP):
+        assert get_priority() == PRIORITY_SCALE_UP
+        with priority(PRIORITY_EVENT):
+            assert get_priority() == PRIORITY_EVENT
+        assert get_priority() == PRIORITY_SCALE_UP
+    assert get_priority() == PRIORITY_DEFAULT
+
+
+def test_get_retry_after():
+    assert get_retry_after({"Retry-After": "3"}) == 3
+    assert get_retry_after({"Retry-After": "1000"}) == 60
+    assert get_retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 1
+    assert get_retry_after({}) == 1
+
+
+def test_rate_limiter_burst():
+    limiter = RateLimiter(qps=50, burst=3)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    # the burst is sent at once, the remaining two requests wait for new tokens
+    assert 0.03 <= time.monotonic() - start < 1
+
+
+def test_rate_limiter_no_limit():
+    limiter = RateLimiter(qps=0)
+    start = time.monotonic()
+    for _ in range(1000):
+        limiter.acquire()
+    assert time.monotonic() - start < 1
+
+
+def test_rate_limiter_priority():
+    limiter = RateLimiter(qps=20, burst=1)
+    limiter.acquire()
+    order = []
+
+    def acquire(value):
+        limiter.acquire(value)
+        order.append(value)
+
+    threads = []
+    for value in (PRIORITY_EVENT, PRIORITY_SCALE_DOWN, PRIORITY_SCALE_UP):
+        thread = threading.Thread(target=acquire, args=(value,))
+        thread.start()
+        threads.append(thread)
+        # make sure all are waiting before the next token is due
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join()
+
+    assert order == [PRIORITY_SCALE_UP, PRIORITY_SCALE_DOWN, PRIORITY_EVENT]
+
+
+def test_rate_limiter_pause():
+    limiter = RateLimiter(qps=0)
+    limiter.pause(0.05)
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.04
+
+
+def test_rate_limiter_async():
+    limiter = RateLimiter(qps=50, burst=1)
+    order = []
+
+    async def acquire(value):
+        await limiter.acquire_async(value)
+        order.append(value)
+
+    async def run():
+        await limiter.acquire_async()
+        await asyncio.gather(
+            acquire(PRIORITY_EVENT),
+            acquire(PRIORITY_SCALE_UP),
+            acquire(PRIORITY_SCALE_DOWN),
+        )
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+    assert order == [PRIORITY_SCALE_UP, PRIORITY_SCALE_DOWN, PRIORITY_EVENT]
+
+
+def test_priority_executor():
+    executor = PriorityExecutor(max_workers=1)
+    started = threading.Event()
+    blocked = threading.Event()
+    order = []
+
+    def block():
+        started.set()
+        blocked.wait(5)
+
+    executor.submit(block)
+    started.wait(5)
+    futures = [
+        executor.submit_with_priority(
+            value, lambda value=value: order.append((value, get_priority()))
+        )
+        for value in (
+            PRIORITY_SCALE_DOWN,
+            PRIORITY_EVENT,
+            PRIORITY_SCALE_UP,
+            PRIORITY_SCALE_DOWN,
+        )
+    ]
+    blocked.set()
+    executor.shutdown()
+
+    assert all(future.done() for future in futures)
+    # the priority is also used for rate limited requests sent by the call
+    assert order == [
+        (PRIORITY_SCALE_UP, PRIORITY_SCALE_UP),
+        (PRIORITY_SCALE_DOWN, PRIORITY_SCALE_DOWN),
+        (PRIORITY_SCALE_DOWN, PRIORITY_SCALE_DOWN),
+        (PRIORITY_EVENT, PRIORITY_EVENT),
+    ]
+
+
+def test_priority_executor_exception():
+    executor = PriorityExecutor(max_workers=2)
+    future = executor.submit(lambda: 1 / 0)
+    executor.shutdown()
+    assert isinstance(future.exception(), ZeroDivisionError)
+
+
+def response(status_code, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    return response
+
+
+def test_adapter_retry_after(monkeypatch):
+    responses = [response(429, {"Retry-After": "2"}), response(200)]
+    send = MagicMock(side_effect=responses)
+    monkeypatch.setattr(KubernetesHTTPAdapter, "_do_send", send)
+    sleep = MagicMock()
+    monkeypatch.setattr("kube_downscaler.helper.time.sleep", sleep)
+    limiter = MagicMock()
+    adapter = RateLimitedHTTPAdapter(
+        pykube.KubeConfig.from_url("http://localhost"), limiter
+    )
+
+    assert (
+        adapter._do_send(
+            MagicMock(method="PATCH", path_url="/apis/apps/v1/deployments")
+        )
+        is responses[1]
+    )
+
+    assert send.call_count == 2
+    assert limiter.acquire.call_count == 2
+    limiter.pause.assert_called_once_with(2)
+    sleep.assert_called_once_with(2)
+
+
+def test_adapter_read_not_rate_limited(monkeypatch):
+    responses = [response(429), response(429), response(200)]
+    monkeypatch.setattr(
+        KubernetesHTTPAdapter, "_do_send", MagicMock(side_effect=responses)
+    )
+    monkeypatch.setattr("kube_downscaler.helper.time.sleep", MagicMock())
+    monkeypatch.setattr("kube_downscaler.ratelimit.MAX_RETRIES", 1)
+    limiter = MagicMock()
+    adapter = RateLimitedHTTPAdapter(
+        pykube.KubeConfig.from_url("http://localhost"), limiter
+    )
+
+    # gives up after the configured number of retries
+    assert (
+        adapter._do_send(MagicMock(method="GET", path_url="/api/v1/pods")).status_code
+        == 429
+    )
+    limiter.acquire.assert_not_called()
+
+
+def test_is_exempt():
+    assert is_exempt(
+        "/apis/coordination.k8s.io/v1/namespaces/default/leases/kube-downscaler"
+    )
+    assert not is_exempt("/apis/apps/v1/namespaces/default/deployments/deploy-1")
+
+
+def test_adapter_lease_not_paused(monkeypatch):
+    responses = [response(200), response(429)]
+    send = MagicMock(side_effect=responses)
+    monkeypatch.setattr(KubernetesHTTPAdapter, "_do_send", send)
+    sleep = MagicMock()
+    monkeypatch.setattr("kube_downscaler.helper.time.sleep", sleep)
+    limiter = RateLimiter(qps=0)
+    # e.g. a throttled burst of scale-ups
+    limiter.pause(60)
+    adapter = RateLimitedHTTPAdapter(
+        pykube.KubeConfig.from_url("http://localhost"), limiter
+    )
+    path = "/apis/coordination.k8s.io/v1/namespaces/default/leases/kube-downscaler"
+
+    # the Lease is renewed right away
+    start = time.monotonic()
+    assert adapter._do_send(MagicMock(method="PATCH", path_url=path)) is responses[0]
+    assert time.monotonic() - start < 1
+
+    # a throttled renewal is neither retried nor pauses the other writes
+    limiter._paused_until = 0
+    assert adapter._do_send(MagicMock(method="PATCH", path_url=path)) is responses[1]
+    assert send.call_count == 2
+    sleep.assert_not_called()
+    assert limiter._paused_until == 0
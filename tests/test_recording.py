@@ -0,0 +1,213 @@
+import datetime
+import json
+import re
+from unittest.mock import MagicMock
+
+import pykube
+import requests
+from pykube.http import KubernetesHTTPAdapter
+
+from kube_downscaler.helper import RateLimitedHTTPAdapter
+from kube_downscaler.recording import get_request_key
+from kube_downscaler.recording import LAST_APPLIED_ANNOTATION
+from kube_downscaler.recording import load_recording
+from kube_downscaler.recording import Recorder
+from kube_downscaler.recording import REDACTED
+from kube_downscaler.recording import redact
+from kube_downscaler.recording import ReplayHTTPAdapter
+from kube_downscaler.scaler import scale
+
+NOW = datetime.datetime(2020, 10, 5, 8, 0, tzinfo=datetime.timezone.utc)
+
+
+def test_redact():
+    obj = {
+        "kind": "List",
+        "items": [
+            {"kind": "Secret", "data": {"password": "c2VjcmV0"}},
+            {
+                "kind": "Deployment",
+                "metadata": {
+                    "annotations": {
+                        LAST_APPLIED_ANNOTATION: "{}",
+                        "downscaler/uptime": "always",
+                    }
+                },
+                "spec": {
+                    "template": {
+                        "spec": {
+                            "containers": [
+                                {
+                                    "env": [
+                                        {"name": "TOKEN", "value": "secret"},
+                                        {"name": "REF", "valueFrom": {}},
+                                    ]
+                                }
+                            ]
+                        }
+                    }
+                },
+            },
+        ],
+    }
+
+    redacted = redact(obj)
+
+    assert redacted["items"][0]["data"] == {"password": REDACTED}
+    metadata = redacted["items"][1]["metadata"]
+    assert metadata["annotations"] == {
+        LAST_APPLIED_ANNOTATION: REDACTED,
+        "downscaler/uptime": "always",
+    }
+    container = redacted["items"][1]["spec"]["template"]["spec"]["containers"][0]
+    assert container["env"] == [
+        {"name": "TOKEN", "value": REDACTED},
+        {"name": "REF", "valueFrom": {}},
+    ]
+    # the original is not changed
+    assert obj["items"][0]["data"] == {"password": "c2VjcmV0"}
+
+
+def test_get_request_key():
+    assert get_request_key(
+        "get", "https://example.org/api/v1/pods?limit=500&fieldSelector=a%3Db"
+    ) == ("GET", "/api/v1/pods?fieldSelector=a%3Db&limit=500")
+    assert get_request_key("PATCH", "/apis/apps/v1/deployments") == (
+        "PATCH",
+        "/apis/apps/v1/deployments",
+    )
+
+
+def get_response(request, status_code, body):
+    response = requests.Response()
+    response.request = request
+    response.url = request.url
+    response.status_code = status_code
+    response.headers["Content-Type"] = "application/json"
+    response._content = json.dumps(body).encode("utf-8")
+    return response
+
+
+def fake_api_server(request, **kwargs):
+    """Answer like the API server for a cluster with one deployment."""
+    path = request.path_url.split("?")[0]
+    if request.method == "PATCH":
+        return get_response(request, 200, json.loads(request.body))
+    items = []
+    if path == "/apis/apps/v1/deployments":
+        items = [
+            {
+                "metadata": {
+                    "name": "deploy-1",
+                    "namespace": "default",
+                    "uid": "123",
+                    "resourceVersion": "1",
+                    "creationTimestamp": "2019-03-01T16:38:00Z",
+                },
+                "spec": {
+                    "replicas": 2,
+                    "template": {
+                        "spec": {"containers": [{"env": [{"name": "A", "value": "b"}]}]}
+                    },
+                },
+            }
+        ]
+    elif path == "/api/v1/namespaces":
+        items = [{"metadata": {"name": "default"}}]
+    return get_response(request, 200, {"metadata": {}, "items": items})
+
+
+def run_scale(api):
+    return scale(
+        namespace=None,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=frozenset([re.compile("kube-system")]),
+        exclude_deployments=frozenset(),
+        dry_run=False,
+        grace_period=300,
+        api=api,
+        now=NOW,
+    )
+
+
+def test_record_and_replay(tmpdir, monkeypatch):
+    send = MagicMock(side_effect=fake_api_server)
+    monkeypatch.setattr(KubernetesHTTPAdapter, "_do_send", send)
+    path = str(tmpdir.join("recording.jsonl.gz"))
+    recorder = Recorder(path, {"default_downtime": "always"})
+    config = pykube.KubeConfig.from_url("https://localhost:9443")
+    api = pykube.HTTPClient(
+        config, http_adapter=RateLimitedHTTPAdapter(config, recorder=recorder)
+    )
+
+    run_scale(api)
+    recorder.close()
+
+    header, exchanges = load_recording(path)
+    assert header["settings"] == {"default_downtime": "always"}
+    assert sorted((e["method"], e["url"].split("?")[0]) for e in exchanges) == [
+        ("GET", "/api/v1/namespaces"),
+        ("GET", "/api/v1/pods"),
+        ("GET", "/apis/apps/v1/deployments"),
+        ("PATCH", "/apis/apps/v1/namespaces/default/deployments/deploy-1"),
+    ]
+    deployments = next(e for e in exchanges if "deployments?" in e["url"])
+    container = deployments["response"]["items"][0]["spec"]["template"]["spec"][
+        "containers"
+    ][0]
+    assert container["env"] == [{"name": "A", "value": REDACTED}]
+
+    # the same cycle offline, e.g. for profiling
+    send.reset_mock()
+    adapter = ReplayHTTPAdapter(exchanges)
+    replay_api = pykube.HTTPClient(
+        pykube.KubeConfig.from_url("http://replay"), http_adapter=adapter
+    )
+    run_scale(replay_api)
+
+    send.assert_not_called()
+    assert adapter.requests == 4
+    assert adapter.misses == []
+
+
+def test_replay_miss():
+    adapter = ReplayHTTPAdapter([])
+    api = pykube.HTTPClient(
+        pykube.KubeConfig.from_url("http://replay"), http_adapter=adapter
+    )
+
+    response = api.get(url="namespaces/default")
+
+    assert response.status_code == 404
+    assert adapter.misses == [("GET", "/api/v1/namespaces/default")]
+
+
+def test_recorder_closed(tmpdir):
+    path = str(tmpdir.join("recording.jsonl.gz"))
+    recorder = Recorder(path)
+    recorder.record("GET", "/api/v1/namespaces", None, 200, {}, b"{}")
+    recorder.close()
+    recorder.record("GET", "/api/v1/pods", None, 200, {}, b"{}")
+
+    _, exchanges = load_recording(path)
+    assert [e["url"] for e in exchanges] == ["/api/v1/namespaces"]
+    assert recorder.count == 1
+
+
+def test_recorder_start(tmpdir):
+    path = str(tmpdir.join("recording.jsonl.gz"))
+    recorder = Recorder(path)
+    # e.g. the informers' initial LIST before the loop iteration started
+    recorder.record("GET", "/api/v1/namespaces", None, 200, {}, b"{}")
+    recorder.start(NOW)
+    recorder.record("GET", "/api/v1/pods", None, 200, {}, b"{}")
+    recorder.start(NOW + datetime.timedelta(minutes=1))
+    recorder.close()
+
+    header, exchanges = load_recording(path)
+    assert header["recorded"] == NOW.isoformat()
+    assert [e["url"] for e in exchanges] == ["/api/v1/namespaces", "/api/v1/pods"]
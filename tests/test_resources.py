@@ -1,9 +1,12 @@
+import json
 from unittest.mock import MagicMock
 
 from pykube import Deployment
 from pykube import StatefulSet
 from pykube.objects import NamespacedAPIObject
 
+from kube_downscaler.resources.record import compact_obj
+from kube_downscaler.resources.record import ResourceRecord
 from kube_downscaler.resources.stack import Stack
 
 
@@ -39,3 +42,102 @@ def test_stack():
     assert r == 3
     d.replicas = 10
     assert scalable_mock["spec"]["replicas"] == 10
+
+
+def test_resource_record():
+    api_mock = MagicMock(name="APIMock")
+    obj = {
+        "metadata": {
+            "name": "deploy-1",
+            "namespace": "default",
+            "uid": "123",
+            "resourceVersion": "7",
+            "creationTimestamp": "2020-10-05T08:00:00Z",
+            "annotations": {
+                "downscaler/uptime": "always",
+                "deployment-time": "2020-10-05T09:00:00Z",
+                "kubectl.kubernetes.io/last-applied-configuration": "{}",
+            },
+            "managedFields": [{"manager": "kubectl"}],
+        },
+        "spec": {"replicas": 3, "template": {"spec": {"containers": []}}},
+        "status": {"replicas": 3},
+    }
+    record = ResourceRecord(api_mock, Deployment, obj, "deployment-time")
+
+    assert (record.kind, record.version, record.namespace, record.name) == (
+        "Deployment",
+        "apps/v1",
+        "default",
+        "deploy-1",
+    )
+    assert record.annotations == {
+        "downscaler/uptime": "always",
+        "deployment-time": "2020-10-05T09:00:00Z",
+    }
+    assert record.metadata == {
+        "name": "deploy-1",
+        "namespace": "default",
+        "uid": "123",
+        "resourceVersion": "7",
+        "creationTimestamp": "2020-10-05T08:00:00Z",
+        "annotations": record.annotations,
+    }
+    assert record.obj["spec"] == {"replicas": 3}
+    assert not hasattr(record, "__dict__")
+
+    record.replicas = 0
+    record.patch({"spec": {"replicas": 0}})
+
+    assert record.replicas == 0
+    kwargs = api_mock.patch.call_args[1]
+    assert kwargs["url"] == "/deployments/deploy-1"
+    assert kwargs["namespace"] == "default"
+    assert json.loads(kwargs["data"]) == {"spec": {"replicas": 0}}
+
+
+def test_resource_record_stack():
+    obj = {
+        "metadata": {"name": "stack-1", "namespace": "default"},
+        "spec": {"replicas": 3, "autoscaler": {"maxReplicas": 5, "metrics": []}},
+    }
+    record = ResourceRecord(None, Stack, obj)
+
+    assert record.replicas == 3
+    record.replicas = 5
+    # reset to autoscaling
+    assert record.spec == {"replicas": None}
+    assert record.replicas == 5
+
+
+def test_compact_obj():
+    obj = {
+        "apiVersion": "zalando.org/v1",
+        "kind": "Stack",
+        "metadata": {
+            "name": "stack-1",
+            "namespace": "default",
+            "labels": {"application": "foo"},
+            "annotations": {"downscaler/exclude": "true", "other": "value"},
+        },
+        "spec": {
+            "replicas": 3,
+            "autoscaler": {"maxReplicas": 5, "metrics": []},
+            "podTemplate": {},
+        },
+        "status": {},
+    }
+
+    compact = compact_obj(obj)
+
+    assert compact == {
+        "apiVersion": "zalando.org/v1",
+        "kind": "Stack",
+        "metadata": {
+            "name": "stack-1",
+            "namespace": "default",
+            "annotations": {"downscaler/exclude": "true"},
+        },
+        "spec": {"replicas": 3, "autoscaler": {"maxReplicas": 5}},
+    }
+    assert ResourceRecord(None, Stack, compact).max_replicas == 5
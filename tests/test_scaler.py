@@ -1,10 +1,17 @@
 import datetime
 import json
 import re
+import threading
 from unittest.mock import MagicMock
 
+import pytest
+from pykube import Deployment
+
 from kube_downscaler.scaler import DOWNTIME_REPLICAS_ANNOTATION
 from kube_downscaler.scaler import EXCLUDE_ANNOTATION
+from kube_downscaler.scaler import get_list_params
+from kube_downscaler.scaler import get_namespace_names
+from kube_downscaler.scaler import get_shard
 from kube_downscaler.scaler import ORIGINAL_REPLICAS_ANNOTATION
 from kube_downscaler.scaler import scale
 
@@ -33,8 +40,8 @@ def test_scaler_always_up(monkeypatch):
             data = {"items": []}
         elif url == "cronjobs":
             data = {"items": []}
-        elif url == "namespaces/ns-1":
-            data = {"metadata": {}}
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "ns-1"}}]}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -93,8 +100,8 @@ def test_scaler_namespace_excluded(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/default":
-            data = {"metadata": {}}
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "default"}}]}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -124,12 +131,7 @@ def test_scaler_namespace_excluded(monkeypatch):
 
     # make sure that deploy-2 was updated (namespace of sysdep-1 was excluded)
     patch_data = {
-        "metadata": {
-            "name": "deploy-2",
-            "namespace": "default",
-            "creationTimestamp": "2019-03-01T16:38:00Z",
-            "annotations": {ORIGINAL_REPLICAS_ANNOTATION: "2"},
-        },
+        "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: "2"}},
         "spec": {"replicas": 0},
     }
     assert api.patch.call_args[1]["url"] == "/deployments/deploy-2"
@@ -166,8 +168,8 @@ def test_scaler_namespace_excluded_regex(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/default":
-            data = {"metadata": {}}
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "default"}}]}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -200,12 +202,7 @@ def test_scaler_namespace_excluded_regex(monkeypatch):
 
     # make sure that deploy-2 was updated (namespace of sysdep-1 was excluded)
     patch_data = {
-        "metadata": {
-            "name": "deploy-2",
-            "namespace": "default",
-            "creationTimestamp": "2019-03-01T16:38:00Z",
-            "annotations": {ORIGINAL_REPLICAS_ANNOTATION: "2"},
-        },
+        "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: "2"}},
         "spec": {"replicas": 0},
     }
     assert api.patch.call_args[1]["url"] == "/deployments/deploy-2"
@@ -242,10 +239,18 @@ def test_scaler_namespace_excluded_via_annotation(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/ns-1":
-            data = {"metadata": {"annotations": {"downscaler/exclude": "true"}}}
-        elif url == "namespaces/ns-2":
-            data = {"metadata": {}}
+        elif url == "namespaces":
+            data = {
+                "items": [
+                    {
+                        "metadata": {
+                            "name": "ns-1",
+                            "annotations": {"downscaler/exclude": "true"},
+                        }
+                    },
+                    {"metadata": {"name": "ns-2"}},
+                ]
+            }
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -275,12 +280,7 @@ def test_scaler_namespace_excluded_via_annotation(monkeypatch):
 
     # make sure that deploy-2 was updated (deploy-1 was excluded via annotation on ns-1)
     patch_data = {
-        "metadata": {
-            "name": "deploy-2",
-            "namespace": "ns-2",
-            "creationTimestamp": "2019-03-01T16:38:00Z",
-            "annotations": {ORIGINAL_REPLICAS_ANNOTATION: "2"},
-        },
+        "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: "2"}},
         "spec": {"replicas": 0},
     }
     assert api.patch.call_args[1]["url"] == "/deployments/deploy-2"
@@ -314,8 +314,8 @@ def test_scaler_down_to(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/default":
-            data = {"metadata": {}}
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "default"}}]}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -377,8 +377,8 @@ def test_scaler_down_to_upscale(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/default":
-            data = {"metadata": {}}
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "default"}}]}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -438,8 +438,8 @@ def test_scaler_upscale_on_exclude(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/default":
-            data = {"metadata": {}}
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "default"}}]}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -501,8 +501,17 @@ def test_scaler_upscale_on_exclude_namespace(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/default":
-            data = {"metadata": {"annotations": {EXCLUDE_ANNOTATION: "true"}}}
+        elif url == "namespaces":
+            data = {
+                "items": [
+                    {
+                        "metadata": {
+                            "name": "default",
+                            "annotations": {EXCLUDE_ANNOTATION: "true"},
+                        }
+                    }
+                ]
+            }
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -561,8 +570,8 @@ def test_scaler_always_upscale(monkeypatch):
             data = {"items": []}
         elif url == "stacks":
             data = {"items": []}
-        elif url == "namespaces/ns-1":
-            data = {"metadata": {}}
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "ns-1"}}]}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -614,11 +623,17 @@ def test_scaler_namespace_annotation_replicas(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/default":
+        elif url == "namespaces":
             data = {
-                "metadata": {"annotations": {"downscaler/downtime-replicas": SCALE_TO}}
+                "items": [
+                    {
+                        "metadata": {
+                            "name": "default",
+                            "annotations": {"downscaler/downtime-replicas": SCALE_TO},
+                        }
+                    }
+                ]
             }
-            # data = {'metadata': {}}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -674,9 +689,17 @@ def test_scaler_cronjob_suspend(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/default":
-            data = {"metadata": {"annotations": {"downscaler/uptime": "never"}}}
-            # data = {'metadata': {}}
+        elif url == "namespaces":
+            data = {
+                "items": [
+                    {
+                        "metadata": {
+                            "name": "default",
+                            "annotations": {"downscaler/uptime": "never"},
+                        }
+                    }
+                ]
+            }
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -706,12 +729,7 @@ def test_scaler_cronjob_suspend(monkeypatch):
     assert api.patch.call_args[1]["url"] == "/cronjobs/cronjob-1"
 
     patch_data = {
-        "metadata": {
-            "name": "cronjob-1",
-            "namespace": "default",
-            "creationTimestamp": "2019-03-01T16:38:00Z",
-            "annotations": {ORIGINAL_REPLICAS_ANNOTATION: "1"},
-        },
+        "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: "1"}},
         "spec": {"suspend": True},
     }
     assert json.loads(api.patch.call_args[1]["data"]) == patch_data
@@ -743,16 +761,20 @@ def test_scaler_cronjob_unsuspend(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/default":
+        elif url == "namespaces":
             data = {
-                "metadata": {
-                    "annotations": {
-                        "downscaler/uptime": "always",
-                        "downscaler/downtime": "never",
+                "items": [
+                    {
+                        "metadata": {
+                            "name": "default",
+                            "annotations": {
+                                "downscaler/uptime": "always",
+                                "downscaler/downtime": "never",
+                            },
+                        }
                     }
-                }
+                ]
             }
-            # data = {'metadata': {}}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -782,12 +804,7 @@ def test_scaler_cronjob_unsuspend(monkeypatch):
     assert api.patch.call_args[1]["url"] == "/cronjobs/cronjob-1"
 
     patch_data = {
-        "metadata": {
-            "name": "cronjob-1",
-            "namespace": "default",
-            "creationTimestamp": "2019-03-01T16:38:00Z",
-            "annotations": {ORIGINAL_REPLICAS_ANNOTATION: None},
-        },
+        "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: None}},
         "spec": {"suspend": False},
     }
     assert json.loads(api.patch.call_args[1]["data"]) == patch_data
@@ -816,8 +833,8 @@ def test_scaler_downscale_period_no_error(monkeypatch, caplog):
                     },
                 ]
             }
-        elif url == "namespaces/default":
-            data = {"metadata": {}}
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "default"}}]}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -895,8 +912,8 @@ def test_scaler_deployment_excluded_until(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/my-ns":
-            data = {"metadata": {}}
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "my-ns"}}]}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -923,16 +940,9 @@ def test_scaler_deployment_excluded_until(monkeypatch):
     assert api.patch.call_count == 1
 
     # make sure that deploy-2 was updated (deploy-1 was excluded via annotation)
+    # only the changed fields are sent, i.e. not the other annotations
     patch_data = {
-        "metadata": {
-            "name": "deploy-2",
-            "namespace": "my-ns",
-            "creationTimestamp": "2020-04-04T16:38:00Z",
-            "annotations": {
-                ORIGINAL_REPLICAS_ANNOTATION: "2",
-                "downscaler/exclude-until": "2020-04-04",
-            },
-        },
+        "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: "2"}},
         "spec": {"replicas": 0},
     }
     assert api.patch.call_args[1]["url"] == "/deployments/deploy-2"
@@ -969,14 +979,20 @@ def test_scaler_namespace_excluded_until(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/ns-1":
+        elif url == "namespaces":
             data = {
-                "metadata": {
-                    "annotations": {"downscaler/exclude-until": "2032-01-01T02:20"}
-                }
+                "items": [
+                    {
+                        "metadata": {
+                            "name": "ns-1",
+                            "annotations": {
+                                "downscaler/exclude-until": "2032-01-01T02:20"
+                            },
+                        }
+                    },
+                    {"metadata": {"name": "ns-2"}},
+                ]
             }
-        elif url == "namespaces/ns-2":
-            data = {"metadata": {}}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -1005,12 +1021,7 @@ def test_scaler_namespace_excluded_until(monkeypatch):
 
     # make sure that deploy-2 was updated (deploy-1 was excluded via annotation on ns-1)
     patch_data = {
-        "metadata": {
-            "name": "deploy-2",
-            "namespace": "ns-2",
-            "creationTimestamp": "2019-03-01T16:38:00Z",
-            "annotations": {ORIGINAL_REPLICAS_ANNOTATION: "2"},
-        },
+        "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: "2"}},
         "spec": {"replicas": 0},
     }
     assert api.patch.call_args[1]["url"] == "/deployments/deploy-2"
@@ -1047,8 +1058,8 @@ def test_scaler_name_excluded(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/default":
-            data = {"metadata": {}}
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "default"}}]}
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -1076,12 +1087,7 @@ def test_scaler_name_excluded(monkeypatch):
 
     # make sure that deploy-2 was updated (sysdep-1 was excluded)
     patch_data = {
-        "metadata": {
-            "name": "deploy-2",
-            "namespace": "default",
-            "creationTimestamp": "2019-03-01T16:38:00Z",
-            "annotations": {ORIGINAL_REPLICAS_ANNOTATION: "2"},
-        },
+        "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: "2"}},
         "spec": {"replicas": 0},
     }
     assert api.patch.call_args[1]["url"] == "/deployments/deploy-2"
@@ -1110,8 +1116,17 @@ def test_scaler_namespace_force_uptime_true(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/ns-1":
-            data = {"metadata": {"annotations": {"downscaler/force-uptime": "true"}}}
+        elif url == "namespaces":
+            data = {
+                "items": [
+                    {
+                        "metadata": {
+                            "name": "ns-1",
+                            "annotations": {"downscaler/force-uptime": "true"},
+                        }
+                    }
+                ]
+            }
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -1160,8 +1175,17 @@ def test_scaler_namespace_force_uptime_false(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/ns-1":
-            data = {"metadata": {"annotations": {"downscaler/force-uptime": "false"}}}
+        elif url == "namespaces":
+            data = {
+                "items": [
+                    {
+                        "metadata": {
+                            "name": "ns-1",
+                            "annotations": {"downscaler/force-uptime": "false"},
+                        }
+                    }
+                ]
+            }
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
 
@@ -1189,12 +1213,7 @@ def test_scaler_namespace_force_uptime_false(monkeypatch):
 
     # make sure that deploy-1 was updated
     patch_data = {
-        "metadata": {
-            "name": "deploy-1",
-            "namespace": "ns-1",
-            "creationTimestamp": "2019-03-01T16:38:00Z",
-            "annotations": {ORIGINAL_REPLICAS_ANNOTATION: "1"},
-        },
+        "metadata": {"annotations": {ORIGINAL_REPLICAS_ANNOTATION: "1"}},
         "spec": {"replicas": 0},
     }
     assert api.patch.call_args[1]["url"] == "/deployments/deploy-1"
@@ -1249,32 +1268,37 @@ def test_scaler_namespace_force_uptime_period(monkeypatch):
                     },
                 ]
             }
-        elif url == "namespaces/ns-1":
-            # past period
-            data = {
-                "metadata": {
-                    "annotations": {
-                        "downscaler/force-uptime": "2020-04-04T16:00:00+00:00-2020-04-05T16:00:00+00:00"
-                    }
-                }
-            }
-        elif url == "namespaces/ns-2":
-            # current period
-            data = {
-                "metadata": {
-                    "annotations": {
-                        "downscaler/force-uptime": "2020-04-04T16:00:00+00:00-2040-04-05T16:00:00+00:00"
-                    }
-                }
-            }
-        elif url == "namespaces/ns-3":
-            # future period
+        elif url == "namespaces":
             data = {
-                "metadata": {
-                    "annotations": {
-                        "downscaler/force-uptime": "2040-04-04T16:00:00+00:00-2040-04-05T16:00:00+00:00"
-                    }
-                }
+                "items": [
+                    # past period
+                    {
+                        "metadata": {
+                            "name": "ns-1",
+                            "annotations": {
+                                "downscaler/force-uptime": "2020-04-04T16:00:00+00:00-2020-04-05T16:00:00+00:00"
+                            },
+                        }
+                    },
+                    # current period
+                    {
+                        "metadata": {
+                            "name": "ns-2",
+                            "annotations": {
+                                "downscaler/force-uptime": "2020-04-04T16:00:00+00:00-2040-04-05T16:00:00+00:00"
+                            },
+                        }
+                    },
+                    # future period
+                    {
+                        "metadata": {
+                            "name": "ns-3",
+                            "annotations": {
+                                "downscaler/force-uptime": "2040-04-04T16:00:00+00:00-2040-04-05T16:00:00+00:00"
+                            },
+                        }
+                    },
+                ]
             }
         else:
             raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
@@ -1309,3 +1333,783 @@ def test_scaler_namespace_force_uptime_period(monkeypatch):
     assert not json.loads(api.patch.call_args[1]["data"])["metadata"]["annotations"][
         ORIGINAL_REPLICAS_ANNOTATION
     ]
+
+
+def test_scaler_informer(monkeypatch):
+    api = MagicMock()
+    monkeypatch.setattr(
+        "kube_downscaler.scaler.helper.get_kube_api", MagicMock(return_value=api)
+    )
+
+    def get(url, version, **kwargs):
+        if url == "pods":
+            data = {"items": []}
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "default"}}]}
+        else:
+            raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
+
+        response = MagicMock()
+        response.json.return_value = data
+        return response
+
+    api.get = get
+
+    informer = MagicMock()
+    informer.list.return_value = [
+        Deployment(
+            api,
+            {
+                "metadata": {
+                    "name": "deploy-1",
+                    "namespace": "default",
+                    "creationTimestamp": "2019-03-01T16:38:00Z",
+                },
+                "spec": {"replicas": 1},
+            },
+        )
+    ]
+
+    scale(
+        namespace=None,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=[],
+        exclude_deployments=[],
+        dry_run=False,
+        grace_period=300,
+        informers={"deployments": informer},
+    )
+
+    informer.list.assert_called_once()
+    assert api.patch.call_count == 1
+    assert api.patch.call_args[1]["url"] == "/deployments/deploy-1"
+
+
+def test_scaler_namespaces_listed_once(monkeypatch):
+    api = MagicMock()
+    monkeypatch.setattr(
+        "kube_downscaler.scaler.helper.get_kube_api", MagicMock(return_value=api)
+    )
+
+    calls = []
+
+    def get(url, version, **kwargs):
+        calls.append(url)
+        if url == "pods":
+            data = {"items": []}
+        elif url in ("deployments", "statefulsets"):
+            data = {
+                "items": [
+                    {
+                        "metadata": {"name": f"{url}-1", "namespace": "ns-1"},
+                        "spec": {"replicas": 1},
+                    },
+                    {
+                        "metadata": {"name": f"{url}-2", "namespace": "ns-2"},
+                        "spec": {"replicas": 1},
+                    },
+                ]
+            }
+        elif url == "namespaces":
+            data = {
+                "items": [
+                    {"metadata": {"name": "ns-1"}},
+                    {"metadata": {"name": "ns-2"}},
+                    {"metadata": {"name": "ns-3"}},
+                ]
+            }
+        else:
+            raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
+
+        response = MagicMock()
+        response.json.return_value = data
+        return response
+
+    api.get = get
+
+    scale(
+        namespace=None,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="always",
+        default_downtime="never",
+        include_resources=frozenset(["deployments", "statefulsets"]),
+        exclude_namespaces=[],
+        exclude_deployments=[],
+        dry_run=False,
+        grace_period=300,
+    )
+
+    assert sorted(calls) == ["deployments", "namespaces", "pods", "statefulsets"]
+    api.patch.assert_not_called()
+
+
+def test_scaler_namespace_not_listed(monkeypatch):
+    api = MagicMock()
+    monkeypatch.setattr(
+        "kube_downscaler.scaler.helper.get_kube_api", MagicMock(return_value=api)
+    )
+
+    def get(url, version, **kwargs):
+        if url == "pods":
+            data = {"items": []}
+        elif url == "deployments":
+            data = {
+                "items": [
+                    {
+                        "metadata": {
+                            "name": "deploy-1",
+                            "namespace": "new-ns",
+                            "creationTimestamp": "2019-03-01T16:38:00Z",
+                        },
+                        "spec": {"replicas": 1},
+                    }
+                ]
+            }
+        elif url == "namespaces":
+            data = {"items": []}
+        elif url == "namespaces/new-ns":
+            # namespace was created after the LIST
+            data = {"metadata": {"name": "new-ns", "annotations": {}}}
+        else:
+            raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
+
+        response = MagicMock()
+        response.json.return_value = data
+        return response
+
+    api.get = get
+
+    scale(
+        namespace=None,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=[],
+        exclude_deployments=[],
+        dry_run=False,
+        grace_period=300,
+    )
+
+    assert api.patch.call_count == 1
+    assert api.patch.call_args[1]["url"] == "/deployments/deploy-1"
+
+
+def test_scaler_concurrent_updates(monkeypatch):
+    api = MagicMock()
+    monkeypatch.setattr(
+        "kube_downscaler.scaler.helper.get_kube_api", MagicMock(return_value=api)
+    )
+
+    def get(url, version, **kwargs):
+        if url == "pods":
+            data = {"items": []}
+        elif url == "deployments":
+            data = {
+                "items": [
+                    {
+                        "metadata": {
+                            "name": f"deploy-{i}",
+                            "namespace": "default",
+                            "creationTimestamp": "2019-03-01T16:38:00Z",
+                        },
+                        "spec": {"replicas": 1},
+                    }
+                    for i in range(10)
+                ]
+            }
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "default"}}]}
+        else:
+            raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
+
+        response = MagicMock()
+        response.json.return_value = data
+        return response
+
+    api.get = get
+
+    scale(
+        namespace=None,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=[],
+        exclude_deployments=[],
+        dry_run=False,
+        grace_period=300,
+        max_concurrent_updates=4,
+    )
+
+    assert api.patch.call_count == 10
+    assert sorted(call[1]["url"] for call in api.patch.call_args_list) == sorted(
+        f"/deployments/deploy-{i}" for i in range(10)
+    )
+
+
+def test_scaler_next_transition(monkeypatch):
+    api = MagicMock()
+    monkeypatch.setattr(
+        "kube_downscaler.scaler.helper.get_kube_api", MagicMock(return_value=api)
+    )
+
+    def get(url, version, **kwargs):
+        if url == "pods":
+            data = {"items": []}
+        elif url == "deployments":
+            data = {
+                "items": [
+                    {
+                        "metadata": {
+                            "name": "deploy-1",
+                            "namespace": "ns-1",
+                            "annotations": {
+                                "downscaler/uptime": "2040-01-01T00:00:00+00:00-2040-01-02T00:00:00+00:00"
+                            },
+                        },
+                        "spec": {"replicas": 1},
+                    },
+                    {
+                        "metadata": {"name": "deploy-2", "namespace": "ns-2"},
+                        "spec": {"replicas": 1},
+                    },
+                ]
+            }
+        elif url == "namespaces":
+            data = {
+                "items": [
+                    {"metadata": {"name": "ns-1"}},
+                    {
+                        "metadata": {
+                            "name": "ns-2",
+                            "annotations": {
+                                "downscaler/force-uptime": "2030-01-01T00:00:00+00:00-2030-01-02T00:00:00+00:00"
+                            },
+                        }
+                    },
+                ]
+            }
+        else:
+            raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
+
+        response = MagicMock()
+        response.json.return_value = data
+        return response
+
+    api.get = get
+
+    next_transition = scale(
+        namespace=None,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="always",
+        default_downtime="never",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=[],
+        exclude_deployments=[],
+        dry_run=True,
+        grace_period=300,
+    )
+
+    # the namespace force-uptime period starts first
+    assert next_transition == datetime.datetime(
+        2030, 1, 1, tzinfo=datetime.timezone.utc
+    )
+
+
+def test_scaler_paginated_list(monkeypatch):
+    api = MagicMock()
+    monkeypatch.setattr(
+        "kube_downscaler.scaler.helper.get_kube_api", MagicMock(return_value=api)
+    )
+
+    def deployment(name, namespace):
+        return {
+            "metadata": {
+                "name": name,
+                "namespace": namespace,
+                "creationTimestamp": "2019-03-01T16:38:00Z",
+            },
+            "spec": {"replicas": 1},
+        }
+
+    # the second page continues with namespace ns-2
+    pages = {
+        None: {
+            "metadata": {"continue": "token-1"},
+            "items": [deployment("deploy-1", "ns-1"), deployment("deploy-2", "ns-2")],
+        },
+        "token-1": {
+            "metadata": {},
+            "items": [deployment("deploy-3", "ns-2"), deployment("deploy-4", "ns-3")],
+        },
+    }
+    calls = []
+
+    def get(url, version, **kwargs):
+        calls.append((url, kwargs["params"].get("continue")))
+        if url == "pods":
+            data = {"items": []}
+        elif url == "deployments":
+            data = pages[kwargs["params"].get("continue")]
+        elif url == "namespaces":
+            data = {
+                "items": [
+                    {"metadata": {"name": "ns-1"}},
+                    {"metadata": {"name": "ns-2"}},
+                    {"metadata": {"name": "ns-3"}},
+                ]
+            }
+        else:
+            raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
+
+        response = MagicMock()
+        response.json.return_value = data
+        return response
+
+    api.get = get
+
+    scale(
+        namespace=None,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=[],
+        exclude_deployments=[],
+        dry_run=False,
+        grace_period=300,
+        list_page_size=2,
+    )
+
+    # LIST calls run concurrently, i.e. their order is not deterministic
+    assert sorted(calls, key=str) == [
+        ("deployments", "token-1"),
+        ("deployments", None),
+        ("namespaces", None),
+        ("pods", None),
+    ]
+    patched = [call[1]["url"] for call in api.patch.call_args_list]
+    assert patched == [
+        "/deployments/deploy-1",
+        "/deployments/deploy-2",
+        "/deployments/deploy-3",
+        "/deployments/deploy-4",
+    ]
+
+
+def test_scaler_concurrent_lists(monkeypatch):
+    api = MagicMock()
+    # all four LIST calls must be in flight at the same time to pass the barrier
+    barrier = threading.Barrier(4, timeout=5)
+
+    def get(url, version, **kwargs):
+        barrier.wait()
+        if url == "pods":
+            data = {"items": []}
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "default"}}]}
+        elif url in ("deployments", "statefulsets"):
+            data = {
+                "items": [
+                    {
+                        "metadata": {
+                            "name": f"{url}-1",
+                            "namespace": "default",
+                            "creationTimestamp": "2019-03-01T16:38:00Z",
+                        },
+                        "spec": {"replicas": 1},
+                    }
+                ]
+            }
+        else:
+            raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
+
+        response = MagicMock()
+        response.json.return_value = data
+        return response
+
+    api.get = get
+
+    scale(
+        namespace=None,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments", "statefulsets"]),
+        exclude_namespaces=[],
+        exclude_deployments=[],
+        dry_run=False,
+        grace_period=300,
+        api=api,
+    )
+
+    patched = sorted(call[1]["url"] for call in api.patch.call_args_list)
+    assert patched == ["/deployments/deployments-1", "/statefulsets/statefulsets-1"]
+
+
+def test_scaler_list_error(monkeypatch):
+    api = MagicMock()
+
+    def get(url, version, **kwargs):
+        if url == "namespaces":
+            raise Exception("API server unavailable")
+        response = MagicMock()
+        response.json.return_value = {"items": []}
+        return response
+
+    api.get = get
+
+    with pytest.raises(Exception, match="API server unavailable"):
+        scale(
+            namespace=None,
+            upscale_period="never",
+            downscale_period="never",
+            default_uptime="never",
+            default_downtime="always",
+            include_resources=frozenset(["deployments"]),
+            exclude_namespaces=[],
+            exclude_deployments=[],
+            dry_run=False,
+            grace_period=300,
+            api=api,
+        )
+    api.patch.assert_not_called()
+
+
+def test_get_list_params():
+    assert get_list_params(frozenset(), frozenset()) == {}
+    assert get_list_params(
+        frozenset([re.compile("kube-system"), re.compile("infra-.*")]),
+        frozenset(["kube-downscaler", "downscaler"]),
+        "downscaler/exclude!=true",
+    ) == {
+        # regex patterns can not be expressed as field selector
+        "fieldSelector": "metadata.namespace!=kube-system,metadata.name!=downscaler,metadata.name!=kube-downscaler",
+        "labelSelector": "downscaler/exclude!=true",
+    }
+
+
+def test_scaler_server_side_filter(monkeypatch):
+    api = MagicMock()
+    params = {}
+
+    def get(url, version, **kwargs):
+        params[url] = kwargs.get("params")
+        if url == "deployments":
+            # the API server only returns matching objects
+            data = {
+                "items": [
+                    {
+                        "metadata": {
+                            "name": "deploy-1",
+                            "namespace": "default",
+                            "creationTimestamp": "2019-03-01T16:38:00Z",
+                        },
+                        "spec": {"replicas": 1},
+                    }
+                ]
+            }
+        elif url == "namespaces":
+            data = {"items": [{"metadata": {"name": "default"}}]}
+        else:
+            data = {"items": []}
+
+        response = MagicMock()
+        response.json.return_value = data
+        return response
+
+    api.get = get
+
+    scale(
+        namespace=None,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=frozenset([re.compile("kube-system")]),
+        exclude_deployments=frozenset(["kube-downscaler"]),
+        dry_run=False,
+        grace_period=300,
+        api=api,
+        label_selector="team=foo",
+    )
+
+    assert params["deployments"] == {
+        "fieldSelector": "metadata.namespace!=kube-system,metadata.name!=kube-downscaler",
+        "labelSelector": "team=foo",
+        "limit": 500,
+    }
+    # namespaces and pods are not filtered by the resource exclusions
+    assert "labelSelector" not in params["namespaces"]
+    assert api.patch.call_count == 1
+
+
+def test_scaler_namespace_list(monkeypatch):
+    api = MagicMock()
+    # pods, the namespace and deployments of both namespaces are fetched at the same time
+    barrier = threading.Barrier(6, timeout=5)
+    calls = []
+
+    def get(url, version, **kwargs):
+        barrier.wait()
+        calls.append((url, kwargs.get("namespace")))
+        if url == "pods":
+            data = {"items": []}
+        elif url.startswith("namespaces/"):
+            data = {"metadata": {"name": url.split("/")[1]}}
+        elif url == "deployments":
+            data = {
+                "items": [
+                    {
+                        "metadata": {
+                            "name": "deploy-1",
+                            "namespace": kwargs["namespace"],
+                            "creationTimestamp": "2019-03-01T16:38:00Z",
+                        },
+                        "spec": {"replicas": 1},
+                    }
+                ]
+            }
+        else:
+            raise Exception(f"unexpected call: {url}, {version}, {kwargs}")
+
+        response = MagicMock()
+        response.json.return_value = data
+        return response
+
+    api.get = get
+
+    scale(
+        namespace="team-b,team-a",
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=[],
+        exclude_deployments=[],
+        dry_run=False,
+        grace_period=300,
+        api=api,
+    )
+
+    # no cluster-wide LIST calls
+    assert sorted(calls) == [
+        ("deployments", "team-a"),
+        ("deployments", "team-b"),
+        ("namespaces/team-a", None),
+        ("namespaces/team-b", None),
+        ("pods", "team-a"),
+        ("pods", "team-b"),
+    ]
+    # the namespaces are processed in order
+    patched = [call[1]["namespace"] for call in api.patch.call_args_list]
+    assert patched == ["team-a", "team-b"]
+
+
+def test_scaler_namespace_selector(monkeypatch):
+    api = MagicMock()
+    calls = []
+
+    def get(url, version, **kwargs):
+        calls.append((url, kwargs.get("namespace"), kwargs.get("params")))
+        if url == "namespaces":
+            data = {
+                "items": [
+                    {"metadata": {"name": "team-a"}},
+                    {"metadata": {"name": "team-b"}},
+                ]
+            }
+        else:
+            data = {"items": []}
+
+        response = MagicMock()
+        response.json.return_value = data
+        return response
+
+    api.get = get
+
+    scale(
+        namespace=None,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=[],
+        exclude_deployments=[],
+        dry_run=False,
+        grace_period=300,
+        api=api,
+        namespace_selector="team",
+    )
+
+    assert calls[0] == ("namespaces", None, {"labelSelector": "team", "limit": 500})
+    assert sorted((url, namespace) for url, namespace, _ in calls[1:]) == [
+        ("deployments", "team-a"),
+        ("deployments", "team-b"),
+        ("pods", "team-a"),
+        ("pods", "team-b"),
+    ]
+
+
+def test_get_namespace_names():
+    assert get_namespace_names(None) == []
+    assert get_namespace_names("") == []
+    assert get_namespace_names("default") == ["default"]
+    assert get_namespace_names("team-b, team-a,,team-b") == ["team-a", "team-b"]
+
+
+def test_get_shard():
+    names = [f"namespace-{i}" for i in range(1000)]
+    assert {get_shard(name, 1) for name in names} == {0}
+
+    shards = [get_shard(name, 4) for name in names]
+    # stable and roughly balanced
+    assert shards == [get_shard(name, 4) for name in names]
+    for shard in range(4):
+        assert 200 < shards.count(shard) < 300
+
+    # adding a shard only moves namespaces to the new shard
+    for name, shard in zip(names, shards):
+        assert get_shard(name, 5) in (shard, 4)
+
+
+def test_scaler_shard(monkeypatch):
+    api = MagicMock()
+    names = [f"team-{i}" for i in range(10)]
+    own = [name for name in names if get_shard(name, 3) == 1]
+    calls = []
+
+    def get(url, version, **kwargs):
+        calls.append((url, kwargs.get("namespace")))
+        if url == "namespaces":
+            data = {"items": [{"metadata": {"name": name}} for name in names]}
+        else:
+            data = {"items": []}
+
+        response = MagicMock()
+        response.json.return_value = data
+        return response
+
+    api.get = get
+
+    scale(
+        namespace=None,
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=[],
+        exclude_deployments=[],
+        dry_run=False,
+        grace_period=300,
+        api=api,
+        shard_index=1,
+        shard_count=3,
+    )
+
+    assert own
+    # pods are still checked in all namespaces
+    assert sorted(calls) == sorted(
+        [("namespaces", None), ("pods", None)] + [("deployments", name) for name in own]
+    )
+
+
+def test_scaler_shard_namespace_list(monkeypatch):
+    api = MagicMock()
+    names = [f"team-{i}" for i in range(10)]
+    own = [name for name in names if get_shard(name, 3) == 1]
+    calls = []
+
+    def get(url, version, **kwargs):
+        calls.append((url, kwargs.get("namespace")))
+        if url.startswith("namespaces/"):
+            data = {"metadata": {"name": url.split("/")[1]}}
+        else:
+            data = {"items": []}
+
+        response = MagicMock()
+        response.json.return_value = data
+        return response
+
+    api.get = get
+
+    scale(
+        namespace=",".join(names),
+        upscale_period="never",
+        downscale_period="never",
+        default_uptime="never",
+        default_downtime="always",
+        include_resources=frozenset(["deployments"]),
+        exclude_namespaces=[],
+        exclude_deployments=[],
+        dry_run=False,
+        grace_period=300,
+        api=api,
+        shard_index=1,
+        shard_count=3,
+    )
+
+    assert own
+    # pods are checked in all namespaces of the list, not only in the shard's
+    assert sorted(call for call in calls if call[0] == "pods") == [
+        ("pods", name) for name in names
+    ]
+    assert sorted(call for call in calls if call[0] == "deployments") == [
+        ("deployments", name) for name in own
+    ]
+
+
+def test_scaler_failure_cancels_prefetchers(monkeypatch):
+    api = MagicMock()
+    calls = []
+
+    def get(url, version, **kwargs):
+        calls.append(url)
+        response = MagicMock()
+        # the deployments are never fully listed, i.e. the only fetch thread stays busy
+        response.json.return_value = {"items": [], "metadata": {"continue": "abc"}}
+        return response
+
+    api.get = get
+    monkeypatch.setattr("kube_downscaler.scaler.helper.DEFAULT_POOL_SIZE", 1)
+    monkeypatch.setattr(
+        "kube_downscaler.scaler.autoscale_resources",
+        MagicMock(side_effect=Exception("processing failed")),
+    )
+    informer = MagicMock()
+    informer.list.return_value = []
+
+    with pytest.raises(Exception, match="processing failed"):
+        scale(
+            namespace=None,
+            upscale_period="never",
+            downscale_period="never",
+            default_uptime="never",
+            default_downtime="always",
+            include_resources=frozenset(["deployments", "statefulsets"]),
+            exclude_namespaces=[],
+            exclude_deployments=[],
+            dry_run=False,
+            grace_period=300,
+            api=api,
+            informers={"pods": informer, "namespaces": informer},
+        )
+
+    # the queued statefulsets LIST was cancelled
+    assert "statefulsets" not in calls
+    assert "deployments" in calls
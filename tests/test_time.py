@@ -1,8 +1,11 @@
 from datetime import datetime
+from datetime import timedelta
 from datetime import timezone
 
 import pytest
 
+from kube_downscaler.helper import compile_time_spec
+from kube_downscaler.helper import get_next_time_spec_transition
 from kube_downscaler.helper import matches_time_spec
 
 
@@ -74,3 +77,133 @@ def test_week_starts_sunday():
     assert matches_time_spec(dt, "Sun-Fri 15:30-16:00 UTC")
     assert matches_time_spec(dt, "Sun-Mon 00:00-16:00 UTC")
     assert not matches_time_spec(dt, "Sun-Mon 00:00-15:00 UTC")
+
+
+def test_compile_time_spec():
+    assert compile_time_spec("always").always
+    assert compile_time_spec("Never") == compile_time_spec("never")
+    assert not compile_time_spec("never").always
+
+    time_spec = compile_time_spec(
+        "Sat-Mon 08:30-18:00 Europe/Berlin, 2019-01-01T00:00:00+00:00-2019-01-02T12:34:56+00:00"
+    )
+    assert not time_spec.always
+    assert len(time_spec.recurring) == 1
+    recurring = time_spec.recurring[0]
+    # Monday, Saturday and Sunday
+    assert recurring.weekdays == 0b1100001
+    assert recurring.minute_from == 8 * 60 + 30
+    assert recurring.minute_to == 18 * 60
+    assert str(recurring.tz) == "Europe/Berlin"
+    assert time_spec.absolute[0].time_from == datetime(2019, 1, 1, tzinfo=timezone.utc)
+    assert time_spec.absolute[0].time_to == datetime(
+        2019, 1, 2, 12, 34, 56, tzinfo=timezone.utc
+    )
+
+    # compiled specs are cached
+    assert compile_time_spec("Mon-Fri 08:00-18:00 UTC") is compile_time_spec(
+        "Mon-Fri 08:00-18:00 UTC"
+    )
+
+
+def test_invalid_time_spec_is_always_rejected():
+    # Sunday, November 26th 2017
+    dt = datetime(2017, 11, 26, 15, 33, tzinfo=timezone.utc)
+    # the whole spec is validated, even if an earlier part already matches
+    with pytest.raises(ValueError):
+        matches_time_spec(dt, "Sat-Sun 15:30-16:00 UTC, foo")
+
+
+def test_next_time_spec_transition():
+    # Monday, October 5th 2020
+    dt = datetime(2020, 10, 5, 7, 59, 30, tzinfo=timezone.utc)
+    assert get_next_time_spec_transition(dt, "always") is None
+    assert get_next_time_spec_transition(dt, "never") is None
+    assert get_next_time_spec_transition(dt, "Mon-Sun 00:00-24:00 UTC") is None
+
+    assert get_next_time_spec_transition(dt, "Mon-Fri 08:00-18:00 UTC") == datetime(
+        2020, 10, 5, 8, 0, tzinfo=timezone.utc
+    )
+    # 07:59 UTC is 09:59 in Berlin (CEST)
+    assert get_next_time_spec_transition(
+        dt, "Mon-Fri 08:00-18:00 Europe/Berlin"
+    ) == datetime(2020, 10, 5, 16, 0, tzinfo=timezone.utc)
+    assert get_next_time_spec_transition(dt, "Sat-Sun 00:00-24:00 UTC") == datetime(
+        2020, 10, 10, 0, 0, tzinfo=timezone.utc
+    )
+    # overlapping ranges only change at the end of the second range
+    assert get_next_time_spec_transition(
+        datetime(2020, 10, 5, 10, 30, tzinfo=timezone.utc),
+        "Mon-Fri 10:00-12:00 UTC, Mon-Fri 11:00-14:00 UTC",
+    ) == datetime(2020, 10, 5, 14, 0, tzinfo=timezone.utc)
+
+
+def test_next_time_spec_transition_absolute():
+    spec = "2020-10-05T08:00:00+00:00-2020-10-06T08:00:00+00:00"
+    assert get_next_time_spec_transition(
+        datetime(2020, 10, 5, 7, 0, tzinfo=timezone.utc), spec
+    ) == datetime(2020, 10, 5, 8, 0, tzinfo=timezone.utc)
+    transition = get_next_time_spec_transition(
+        datetime(2020, 10, 5, 9, 0, tzinfo=timezone.utc), spec
+    )
+    assert datetime(2020, 10, 6, 8, 0, tzinfo=timezone.utc) < transition
+    assert not matches_time_spec(transition, spec)
+    assert (
+        get_next_time_spec_transition(
+            datetime(2020, 10, 7, 0, 0, tzinfo=timezone.utc), spec
+        )
+        is None
+    )
+
+
+def test_unknown_time_zone():
+    dt = datetime(2020, 10, 5, 8, 0, tzinfo=timezone.utc)
+    with pytest.raises(ValueError, match="Europe/Foo"):
+        matches_time_spec(dt, "Mon-Fri 08:00-18:00 Europe/Foo")
+    with pytest.raises(ValueError):
+        get_next_time_spec_transition(dt, "Mon-Fri 08:00-18:00 Europe/Foo")
+
+
+def test_next_time_spec_transition_time_zones():
+    # Tuesday, April 7th 2020, 10:00 UTC is 06:00 in New York (EDT)
+    dt = datetime(2020, 4, 7, 10, 0, tzinfo=timezone.utc)
+    assert get_next_time_spec_transition(
+        dt, "Mon-Fri 08:00-18:00 America/New_York"
+    ) == datetime(2020, 4, 7, 12, 0, tzinfo=timezone.utc)
+    # 10:00 UTC is 19:00 in Tokyo (no DST)
+    assert get_next_time_spec_transition(
+        dt, "Mon-Fri 08:00-18:00 Asia/Tokyo"
+    ) == datetime(2020, 4, 7, 23, 0, tzinfo=timezone.utc)
+    # Friday evening in Tokyo: the next uptime starts on Monday
+    assert get_next_time_spec_transition(
+        datetime(2020, 4, 10, 9, 0, tzinfo=timezone.utc),
+        "Mon-Fri 08:00-18:00 Asia/Tokyo",
+    ) == datetime(2020, 4, 12, 23, 0, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        "Mon-Fri 08:00-18:00 America/New_York",
+        "Mon-Fri 08:00-18:00 Asia/Tokyo",
+        "Sat-Sun 22:00-23:30 Europe/Berlin",
+        "Mon-Fri 08:00-18:00 Europe/Berlin, 2020-03-26T12:00:00+09:00-2020-03-27T12:00:00+09:00",
+    ],
+)
+def test_next_time_spec_transition_matches_brute_force(spec):
+    # one week including the start of daylight saving time in Europe
+    start = datetime(2020, 3, 23, 0, 0, tzinfo=timezone.utc)
+    step = timedelta(minutes=15)
+    times = [start + step * i for i in range(7 * 24 * 4)]
+    for dt in times[:-1]:
+        current = matches_time_spec(dt, spec)
+        expected = next(
+            (t for t in times if t > dt and matches_time_spec(t, spec) != current),
+            None,
+        )
+        transition = get_next_time_spec_transition(dt, spec)
+        if expected is None:
+            assert transition is None or transition > times[-1]
+        else:
+            # the end of absolute ranges is included, i.e. they change 1µs later
+            assert expected - step < transition <= expected